@@ -30,7 +30,10 @@ quark_opts = [
                        "after deallocation.")),
     cfg.StrOpt("strategy_driver",
                default='quark.network_strategy.JSONStrategy',
-               help=_("Tree of network assignment strategy"))
+               help=_("Tree of network assignment strategy")),
+    cfg.IntOpt('backend_pool_size', default=10,
+               help=_("Maximum number of concurrent requests made to the "
+                      "network backend by a single API call"))
 ]
 
 
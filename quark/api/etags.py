@@ -0,0 +1,98 @@
+# Copyright (c) 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+
+import webob.dec
+import webob.exc
+
+from neutron import manager
+from neutron.openstack.common import log as logging
+from neutron import wsgi
+
+LOG = logging.getLogger(__name__)
+
+# Query parameters that only shape the response rather than select rows
+IGNORED_PARAMS = ("fields", "sort_key", "sort_dir", "limit", "marker",
+                  "page_reverse")
+
+
+def _parse_path(path):
+    parts = [p for p in path.split("/") if p]
+    if parts and parts[0].startswith("v2"):
+        parts = parts[1:]
+    if not parts or len(parts) > 2:
+        return None, None
+    for ext in (".json", ".xml"):
+        if parts[-1].endswith(ext):
+            parts[-1] = parts[-1][:-len(ext)]
+    collection = parts[0]
+    resource_id = parts[1] if len(parts) == 2 else None
+    return collection, resource_id
+
+
+class ConditionalGetMiddleware(wsgi.Middleware):
+    """Answers GETs of revisioned resources with ETags.
+
+    The ETag is computed from the ids and revisions of the matching rows,
+    so a request carrying a matching If-None-Match is answered with a 304
+    before the plugin loads or serializes anything.
+    """
+
+    def _etag(self, req):
+        ctx = req.environ.get("neutron.context")
+        if ctx is None:
+            return None
+        collection, resource_id = _parse_path(req.path_info)
+        if collection is None:
+            return None
+        plugin = manager.NeutronManager.get_plugin()
+        if not hasattr(plugin, "get_etag"):
+            return None
+
+        filters = dict((k, v) for k, v in req.GET.dict_of_lists().iteritems()
+                       if k not in IGNORED_PARAMS)
+        if resource_id:
+            filters["id"] = [resource_id]
+        data_etag = plugin.get_etag(ctx, collection, filters)
+        if data_etag is None:
+            return None
+
+        digest = hashlib.md5(data_etag)
+        digest.update(req.path_qs)
+        digest.update(str(req.accept))
+        digest.update(str(ctx.tenant_id))
+        return digest.hexdigest()
+
+    @webob.dec.wsgify(RequestClass=wsgi.Request)
+    def __call__(self, req):
+        if req.method != "GET":
+            return self.application
+
+        try:
+            etag = self._etag(req)
+        except Exception:
+            LOG.exception("Failed to compute ETag for %s" % req.path_qs)
+            etag = None
+        if etag is None:
+            return self.application
+
+        if etag in req.if_none_match:
+            return webob.exc.HTTPNotModified(headers={"ETag": '"%s"' % etag})
+
+        res = req.get_response(self.application)
+        if res.status_int == 200:
+            res.etag = etag
+        return res
@@ -0,0 +1,87 @@
+# Copyright (c) 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import webob
+
+from neutron.api import extensions
+from neutron import manager
+from neutron.openstack.common import log as logging
+from neutron import wsgi
+
+RESOURCE_NAME = "change"
+RESOURCE_COLLECTION = RESOURCE_NAME + "s"
+EXTENDED_ATTRIBUTES_2_0 = {
+    RESOURCE_COLLECTION: {}
+}
+
+LOG = logging.getLogger("neutron.quark.api.extensions.changes")
+
+
+class ChangesController(wsgi.Controller):
+
+    def __init__(self, plugin):
+        self._resource_name = RESOURCE_NAME
+        self._plugin = plugin
+
+    def index(self, request):
+        context = request.context
+        try:
+            since = int(request.GET.get("since", 0))
+            limit = request.GET.get("limit")
+            limit = int(limit) if limit else None
+        except ValueError:
+            raise webob.exc.HTTPBadRequest()
+        return self._plugin.get_changes(context, since, limit)
+
+
+class Changes(object):
+    """Incremental change feed.
+
+    * GET /changes?since=<cursor> returns the resources changed after
+      cursor and the cursor to pass on the next call
+    """
+    @classmethod
+    def get_name(cls):
+        return "Resource changes for a tenant"
+
+    @classmethod
+    def get_alias(cls):
+        return RESOURCE_COLLECTION
+
+    @classmethod
+    def get_description(cls):
+        return "Expose the resources changed since a previous poll"
+
+    @classmethod
+    def get_namespace(cls):
+        return "http://docs.openstack.org/network/ext/changes/api/v2.0"
+
+    @classmethod
+    def get_updated(cls):
+        return "2013-08-01T10:00:00-00:00"
+
+    def get_extended_resources(self, version):
+        if version == "2.0":
+            return EXTENDED_ATTRIBUTES_2_0
+        else:
+            return {}
+
+    @classmethod
+    def get_resources(cls):
+        """Returns Ext Resources."""
+        controller = ChangesController(manager.NeutronManager.get_plugin())
+        return [extensions.ResourceExtension(
+            Changes.get_alias(),
+            controller)]
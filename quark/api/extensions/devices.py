@@ -0,0 +1,83 @@
+# Copyright (c) 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from neutron.api import extensions
+from neutron import manager
+from neutron.openstack.common import log as logging
+from neutron import wsgi
+
+RESOURCE_NAME = "device"
+RESOURCE_COLLECTION = RESOURCE_NAME + "s"
+EXTENDED_ATTRIBUTES_2_0 = {
+    RESOURCE_COLLECTION: {}
+}
+
+LOG = logging.getLogger("neutron.quark.api.extensions.devices")
+
+
+class DevicesController(wsgi.Controller):
+
+    def __init__(self, plugin):
+        self._resource_name = RESOURCE_NAME
+        self._plugin = plugin
+
+    def show(self, request, id):
+        context = request.context
+        return {"ports": self._plugin.get_ports_by_device(context, id)}
+
+    def delete(self, request, id):
+        context = request.context
+        self._plugin.delete_ports_by_device(context, id)
+
+
+class Devices(object):
+    """Device scoped port operations.
+
+    * GET /devices/<device_id> lists every port of the device
+    * DELETE /devices/<device_id> deletes every port of the device
+    """
+    @classmethod
+    def get_name(cls):
+        return "Ports by device"
+
+    @classmethod
+    def get_alias(cls):
+        return RESOURCE_COLLECTION
+
+    @classmethod
+    def get_description(cls):
+        return "Expose functions for managing all ports of a device at once"
+
+    @classmethod
+    def get_namespace(cls):
+        return "http://docs.openstack.org/network/ext/devices/api/v2.0"
+
+    @classmethod
+    def get_updated(cls):
+        return "2013-08-01T10:00:00-00:00"
+
+    def get_extended_resources(self, version):
+        if version == "2.0":
+            return EXTENDED_ATTRIBUTES_2_0
+        else:
+            return {}
+
+    @classmethod
+    def get_resources(cls):
+        """Returns Ext Resources."""
+        controller = DevicesController(manager.NeutronManager.get_plugin())
+        return [extensions.ResourceExtension(
+            Devices.get_alias(),
+            controller)]
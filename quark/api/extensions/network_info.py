@@ -0,0 +1,87 @@
+# Copyright (c) 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import webob
+
+from neutron.api import extensions
+from neutron import manager
+from neutron.openstack.common import log as logging
+from neutron import wsgi
+
+RESOURCE_NAME = "network_info"
+RESOURCE_COLLECTION = RESOURCE_NAME
+EXTENDED_ATTRIBUTES_2_0 = {
+    RESOURCE_COLLECTION: {}
+}
+
+LOG = logging.getLogger("neutron.quark.api.extensions.network_info")
+
+
+class NetworkInfoController(wsgi.Controller):
+
+    def __init__(self, plugin):
+        self._resource_name = RESOURCE_NAME
+        self._plugin = plugin
+
+    def index(self, request):
+        context = request.context
+        device_ids = request.GET.getall("device_id")
+        if not device_ids:
+            raise webob.exc.HTTPBadRequest()
+        return {"network_info":
+                self._plugin.get_network_info(context, device_ids)}
+
+
+class Network_info(object):
+    """Aggregated network information for instances.
+
+    * GET /network_info?device_id=<id>&device_id=<id> returns the ports,
+      fixed IPs, subnets and networks of every given device at once
+    """
+    @classmethod
+    def get_name(cls):
+        return "Network information for devices"
+
+    @classmethod
+    def get_alias(cls):
+        return RESOURCE_COLLECTION
+
+    @classmethod
+    def get_description(cls):
+        return "Expose all networking information of devices in one call"
+
+    @classmethod
+    def get_namespace(cls):
+        return ("http://docs.openstack.org/network/ext/"
+                "network_info/api/v2.0")
+
+    @classmethod
+    def get_updated(cls):
+        return "2013-08-01T10:00:00-00:00"
+
+    def get_extended_resources(self, version):
+        if version == "2.0":
+            return EXTENDED_ATTRIBUTES_2_0
+        else:
+            return {}
+
+    @classmethod
+    def get_resources(cls):
+        """Returns Ext Resources."""
+        controller = NetworkInfoController(
+            manager.NeutronManager.get_plugin())
+        return [extensions.ResourceExtension(
+            Network_info.get_alias(),
+            controller)]
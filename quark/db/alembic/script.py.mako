@@ -6,13 +6,13 @@ Create Date: ${create_date}
 
 """
 
+from alembic import op
+import sqlalchemy as sa
+${imports if imports else ""}
 # revision identifiers, used by Alembic.
 revision = ${repr(up_revision)}
 down_revision = ${repr(down_revision)}
 
-from alembic import op
-import sqlalchemy as sa
-${imports if imports else ""}
 
 def upgrade():
     ${upgrades if upgrades else "pass"}
@@ -0,0 +1,74 @@
+"""Store IP addresses as NUMERIC(39, 0) and index the subnet ranges
+
+Revision ID: 33f29b25de0f
+Revises: 695f26499f44
+Create Date: 2013-08-19 22:41:05.277834
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '33f29b25de0f'
+down_revision = '695f26499f44'
+
+# (table, column, nullable) of every INET column
+COLUMNS = (("quark_ip_addresses", "address", False),
+           ("quark_dns_nameservers", "ip", True),
+           ("quark_subnets", "first_ip", True),
+           ("quark_subnets", "last_ip", True),
+           ("quark_subnets", "next_auto_assign_ip", True),
+           ("quark_ip_policy_rules", "address", True))
+
+# SQLite keeps its CHAR(39) columns, padded so they sort like the numbers
+PAD = "0" * 39
+
+# PostgreSQL won't change a bytea column's type without saying how
+ALTER_USING = ("ALTER TABLE %(table)s ALTER COLUMN %(column)s "
+               "TYPE %(type)s USING %(using)s")
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table, column, nullable in COLUMNS:
+        if dialect == "sqlite":
+            op.execute("UPDATE %(table)s "
+                       "SET %(column)s = substr('%(pad)s' || %(column)s, -39) "
+                       "WHERE %(column)s IS NOT NULL" %
+                       dict(table=table, column=column, pad=PAD))
+        elif dialect == "postgresql":
+            op.execute(ALTER_USING % dict(
+                table=table, column=column, type="NUMERIC(39, 0)",
+                using="encode(%s, 'escape')::NUMERIC(39, 0)" % column))
+        else:
+            # The blobs hold the addresses as decimal digits, which the
+            # type change converts in place
+            op.alter_column(table, column,
+                            type_=sa.Numeric(precision=39, scale=0),
+                            existing_type=sa.LargeBinary(),
+                            existing_nullable=nullable)
+    op.create_index("idx_quark_subnets_network_id_first_ip_last_ip",
+                    "quark_subnets", ["network_id", "first_ip", "last_ip"])
+
+
+def downgrade():
+    op.drop_index("idx_quark_subnets_network_id_first_ip_last_ip",
+                  "quark_subnets")
+    dialect = op.get_bind().dialect.name
+    for table, column, nullable in COLUMNS:
+        if dialect == "sqlite":
+            op.execute("UPDATE %(table)s "
+                       "SET %(column)s = CASE ltrim(%(column)s, '0') "
+                       "WHEN '' THEN '0' ELSE ltrim(%(column)s, '0') END "
+                       "WHERE %(column)s IS NOT NULL" %
+                       dict(table=table, column=column))
+        elif dialect == "postgresql":
+            op.execute(ALTER_USING % dict(
+                table=table, column=column, type="BYTEA",
+                using="decode(%s::TEXT, 'escape')" % column))
+        else:
+            op.alter_column(table, column,
+                            type_=sa.LargeBinary(),
+                            existing_type=sa.Numeric(precision=39, scale=0),
+                            existing_nullable=nullable)
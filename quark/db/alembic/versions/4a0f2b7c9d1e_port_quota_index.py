@@ -0,0 +1,22 @@
+"""Index ports by network and tenant
+
+Revision ID: 4a0f2b7c9d1e
+Revises: d2b52080463d
+Create Date: 2013-08-22 10:17:36.408215
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '4a0f2b7c9d1e'
+down_revision = 'd2b52080463d'
+
+
+def upgrade():
+    op.create_index("idx_quark_ports_network_id_tenant_id",
+                    "quark_ports", ["network_id", "tenant_id"])
+
+
+def downgrade():
+    op.drop_index("idx_quark_ports_network_id_tenant_id", "quark_ports")
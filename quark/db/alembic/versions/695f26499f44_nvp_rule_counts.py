@@ -0,0 +1,80 @@
+"""Track security rule counts of NVP profiles and lswitch ports
+
+Revision ID: 695f26499f44
+Revises: ec03a1112ca3
+Create Date: 2013-08-19 20:07:33.912460
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '695f26499f44'
+down_revision = 'ec03a1112ca3'
+
+
+lports = sa.sql.table(
+    "quark_nvp_driver_lswitchport",
+    sa.sql.column("id", sa.String(36)),
+    sa.sql.column("rule_count", sa.Integer()))
+
+profiles = sa.sql.table(
+    "quark_nvp_driver_security_profile",
+    sa.sql.column("id", sa.String(36)),
+    sa.sql.column("rule_count", sa.Integer()))
+
+lport_profiles = sa.sql.table(
+    "quark_nvp_driver_lport_profile_associations",
+    sa.sql.column("port_id", sa.String(36)),
+    sa.sql.column("profile_id", sa.String(36)))
+
+rules = sa.sql.table(
+    "quark_security_group_rule",
+    sa.sql.column("group_id", sa.String(36)))
+
+
+def upgrade():
+    op.add_column("quark_nvp_driver_security_profile",
+                  sa.Column("rule_count", sa.Integer(), nullable=False,
+                            server_default="0"))
+    op.add_column("quark_nvp_driver_lswitchport",
+                  sa.Column("rule_count", sa.Integer(), nullable=False,
+                            server_default="0"))
+    op.create_table(
+        "quark_nvp_driver_lport_profile_associations",
+        sa.Column("port_id", sa.String(36),
+                  sa.ForeignKey("quark_nvp_driver_lswitchport.id")),
+        sa.Column("profile_id", sa.String(36),
+                  sa.ForeignKey("quark_nvp_driver_security_profile.id")),
+        mysql_engine="InnoDB")
+    op.create_index("idx_quark_nvp_driver_lport_profile_profile_id",
+                    "quark_nvp_driver_lport_profile_associations",
+                    ["profile_id"])
+
+    # Profiles share the id of their security group, and lswitch ports
+    # name their neutron port
+    op.execute(
+        profiles.update().values(rule_count=sa.select(
+            [sa.func.count()]).where(
+                rules.c.group_id == profiles.c.id).as_scalar()))
+    op.execute(
+        "INSERT INTO quark_nvp_driver_lport_profile_associations "
+        "(port_id, profile_id) "
+        "SELECT lport.id, profile.id "
+        "FROM quark_nvp_driver_lswitchport lport "
+        "JOIN quark_port_security_group_associations assoc "
+        "ON assoc.port_id = lport.port_id "
+        "JOIN quark_nvp_driver_security_profile profile "
+        "ON profile.id = assoc.group_id")
+    op.execute(
+        lports.update().values(rule_count=sa.select(
+            [sa.func.coalesce(sa.func.sum(profiles.c.rule_count), 0)]).where(
+                lport_profiles.c.port_id == lports.c.id).where(
+                lport_profiles.c.profile_id == profiles.c.id).as_scalar()))
+
+
+def downgrade():
+    op.drop_table("quark_nvp_driver_lport_profile_associations")
+    op.drop_column("quark_nvp_driver_lswitchport", "rule_count")
+    op.drop_column("quark_nvp_driver_security_profile", "rule_count")
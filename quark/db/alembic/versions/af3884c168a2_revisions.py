@@ -0,0 +1,30 @@
+"""Add revision counters to the resources served with ETags
+
+Revision ID: af3884c168a2
+Revises: f68cfe9b6813
+Create Date: 2013-08-19 16:40:12.604117
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'af3884c168a2'
+down_revision = 'f68cfe9b6813'
+
+TABLES = ("quark_ip_addresses", "quark_routes", "quark_subnets",
+          "quark_ports", "quark_networks")
+
+
+def upgrade():
+    # The server default fills in existing rows, so the column can be NOT
+    # NULL from the start
+    for table in TABLES:
+        op.add_column(table, sa.Column("revision", sa.Integer(),
+                                       nullable=False, server_default="1"))
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_column(table, "revision")
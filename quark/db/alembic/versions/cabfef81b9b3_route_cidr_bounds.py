@@ -0,0 +1,53 @@
+"""Add the integer bounds of route destinations
+
+Revision ID: cabfef81b9b3
+Revises: 33f29b25de0f
+Create Date: 2013-08-20 10:12:31.510212
+
+"""
+
+from alembic import op
+import netaddr
+import sqlalchemy as sa
+
+from quark.db import custom_types
+
+# revision identifiers, used by Alembic.
+revision = 'cabfef81b9b3'
+down_revision = '33f29b25de0f'
+
+
+routes = sa.sql.table(
+    "quark_routes",
+    sa.sql.column("id", sa.String(36)),
+    sa.sql.column("cidr", sa.String(64)),
+    sa.sql.column("first_ip", custom_types.INET()),
+    sa.sql.column("last_ip", custom_types.INET()),
+    sa.sql.column("prefix", sa.Integer()))
+
+
+def upgrade():
+    op.add_column("quark_routes",
+                  sa.Column("first_ip", custom_types.INET()))
+    op.add_column("quark_routes",
+                  sa.Column("last_ip", custom_types.INET()))
+    op.add_column("quark_routes", sa.Column("prefix", sa.Integer()))
+    op.create_index("idx_quark_routes_subnet_id_first_ip_last_ip",
+                    "quark_routes", ["subnet_id", "first_ip", "last_ip"])
+
+    connection = op.get_bind()
+    for route_id, cidr in connection.execute(
+            sa.select([routes.c.id, routes.c.cidr])).fetchall():
+        ip = netaddr.IPNetwork(cidr)
+        connection.execute(
+            routes.update().where(routes.c.id == route_id).values(
+                first_ip=ip.ipv6().first, last_ip=ip.ipv6().last,
+                prefix=ip.prefixlen))
+
+
+def downgrade():
+    op.drop_index("idx_quark_routes_subnet_id_first_ip_last_ip",
+                  "quark_routes")
+    op.drop_column("quark_routes", "prefix")
+    op.drop_column("quark_routes", "last_ip")
+    op.drop_column("quark_routes", "first_ip")
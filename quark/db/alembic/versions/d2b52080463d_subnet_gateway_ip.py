@@ -0,0 +1,43 @@
+"""Store the gateway of each subnet
+
+Revision ID: d2b52080463d
+Revises: cabfef81b9b3
+Create Date: 2013-08-21 14:03:52.127004
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd2b52080463d'
+down_revision = 'cabfef81b9b3'
+
+
+subnets = sa.sql.table(
+    "quark_subnets",
+    sa.sql.column("id", sa.String(36)),
+    sa.sql.column("gateway_ip", sa.String(64)))
+
+routes = sa.sql.table(
+    "quark_routes",
+    sa.sql.column("subnet_id", sa.String(36)),
+    sa.sql.column("gateway", sa.String(64)),
+    sa.sql.column("prefix", sa.Integer()))
+
+
+def upgrade():
+    op.add_column("quark_subnets",
+                  sa.Column("gateway_ip", sa.String(64)))
+
+    connection = op.get_bind()
+    default_routes = sa.select([routes.c.subnet_id, routes.c.gateway]).\
+        where(routes.c.prefix == 0).where(routes.c.subnet_id.isnot(None))
+    for subnet_id, gateway in connection.execute(default_routes).fetchall():
+        connection.execute(
+            subnets.update().where(subnets.c.id == subnet_id).values(
+                gateway_ip=gateway))
+
+
+def downgrade():
+    op.drop_column("quark_subnets", "gateway_ip")
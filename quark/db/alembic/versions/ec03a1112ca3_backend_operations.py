@@ -0,0 +1,38 @@
+"""Add the outbox of net driver operations
+
+Revision ID: ec03a1112ca3
+Revises: af3884c168a2
+Create Date: 2013-08-19 18:25:51.330941
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'ec03a1112ca3'
+down_revision = 'af3884c168a2'
+
+
+def upgrade():
+    op.create_table(
+        "quark_backend_operations",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("tenant_id", sa.String(255)),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("idempotency_key", sa.String(255), nullable=False,
+                  unique=True),
+        sa.Column("resource_id", sa.String(36), nullable=False),
+        sa.Column("operation", sa.String(64), nullable=False),
+        sa.Column("arguments", sa.Text()),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("last_error", sa.Text()),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=False),
+        sa.Column("parked_at", sa.DateTime()),
+        mysql_engine="InnoDB")
+    op.create_index("idx_quark_backend_operations_resource_id_id",
+                    "quark_backend_operations", ["resource_id", "id"])
+
+
+def downgrade():
+    op.drop_table("quark_backend_operations")
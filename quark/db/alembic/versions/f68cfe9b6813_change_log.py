@@ -0,0 +1,34 @@
+"""Add the change log
+
+Revision ID: f68cfe9b6813
+Revises: None
+Create Date: 2013-08-19 14:02:47.118305
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f68cfe9b6813'
+down_revision = None
+
+
+def upgrade():
+    op.create_table(
+        "quark_change_log",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("tenant_id", sa.String(255)),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("resource", sa.String(36), nullable=False),
+        sa.Column("resource_id", sa.String(36), nullable=False),
+        sa.Column("action", sa.String(10), nullable=False),
+        mysql_engine="InnoDB")
+    op.create_index("idx_quark_change_log_tenant_id_id",
+                    "quark_change_log", ["tenant_id", "id"])
+    op.create_index("idx_quark_change_log_created_at",
+                    "quark_change_log", ["created_at"])
+
+
+def downgrade():
+    op.drop_table("quark_change_log")
@@ -14,12 +14,16 @@
 #    under the License.
 
 import datetime
+import hashlib
 import inspect
+import itertools
 
+import netaddr
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import timeutils
 from neutron.openstack.common import uuidutils
 from sqlalchemy import event
+from sqlalchemy import exc as sql_exc
 from sqlalchemy import func as sql_func
 from sqlalchemy import orm, or_
 
@@ -50,16 +54,162 @@ for _name, klass in inspect.getmembers(models, inspect.isclass):
         event.listen(klass, "init", _perhaps_generate_id)
 
 
-def _listify(filters):
-    for key in ["name", "network_id", "id", "device_id", "tenant_id",
-                "mac_address", "shared"]:
-        if key in filters:
-            if not filters[key]:
+CHANGE_TRACKED_MODELS = {
+    models.Port: "port",
+    models.IPAddress: "ip_address",
+    models.Subnet: "subnet",
+    models.Route: "route",
+    models.SecurityGroup: "security_group",
+    models.SecurityGroupRule: "security_group_rule"}
+
+
+def _record_changes(session, flush_context, instances):
+    """Adds a ChangeLog row for every tracked model about to be flushed.
+
+    Running before the flush puts the log rows in the same transaction as
+    the changes themselves.
+    """
+    changes = []
+    for action, objs in (("create", session.new),
+                         ("update", session.dirty),
+                         ("delete", session.deleted)):
+        for obj in objs:
+            resource = CHANGE_TRACKED_MODELS.get(type(obj))
+            if not resource:
+                continue
+            if action == "update" and not session.is_modified(obj):
                 continue
-            listified = filters[key]
-            if not isinstance(listified, list):
-                listified = [listified]
-            filters[key] = listified
+            changes.append(models.ChangeLog(resource=resource,
+                                            resource_id=obj.id,
+                                            action=action,
+                                            tenant_id=obj.tenant_id))
+    session.add_all(changes)
+
+event.listen(orm.Session, "before_flush", _record_changes)
+
+
+def _related_id(obj, attr):
+    """Returns the id obj refers to through attr, set either as the
+    foreign key column or, before the flush, as the relationship.
+    """
+    related_id = getattr(obj, "%s_id" % attr)
+    if related_id is None:
+        related = getattr(obj, attr)
+        related_id = related and related.id
+    return related_id
+
+
+def _network_bump_revisions(session, network_ids):
+    query = session.query(models.Network)
+    query = query.filter(models.Network.id.in_(network_ids))
+    query.update({"revision": models.Network.revision + 1},
+                 synchronize_session=False)
+
+
+def _bump_revisions(session, flush_context, instances):
+    """Bumps the revision of every changed revisioned model.
+
+    Routes, DNS nameservers and IP policies are rendered as part of their
+    subnet, and subnets as part of their network, so changing one bumps
+    the subnet or network too. The policy of a network applies to each of
+    its subnets.
+    """
+    subnet_ids = set()
+    network_ids = set()
+    policy_network_ids = set()
+    for obj in session.dirty:
+        if not session.is_modified(obj):
+            continue
+        if isinstance(obj, models.HasRevision):
+            obj.revision = type(obj).revision + 1
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (models.Route, models.DNSNameserver)):
+            subnet_ids.add(obj.subnet_id)
+        elif isinstance(obj, models.Subnet) and obj not in session.dirty:
+            network_ids.add(_related_id(obj, "network"))
+        elif isinstance(obj, (models.IPPolicy, models.IPPolicyRule)):
+            policy = obj
+            if isinstance(obj, models.IPPolicyRule):
+                policy = obj.ip_policy
+            if policy:
+                subnet_ids.add(_related_id(policy, "subnet"))
+                policy_network_ids.add(_related_id(policy, "network"))
+    subnet_ids.discard(None)
+    network_ids.discard(None)
+    policy_network_ids.discard(None)
+
+    subnets = session.query(models.Subnet)
+    if subnet_ids:
+        subnets.filter(models.Subnet.id.in_(subnet_ids)).update(
+            {"revision": models.Subnet.revision + 1},
+            synchronize_session=False)
+    if policy_network_ids:
+        subnets.filter(models.Subnet.network_id.in_(policy_network_ids)).\
+            update({"revision": models.Subnet.revision + 1},
+                   synchronize_session=False)
+    if network_ids:
+        _network_bump_revisions(session, network_ids)
+
+event.listen(orm.Session, "before_flush", _bump_revisions)
+
+
+_LISTIFIED = ("name", "network_id", "id", "device_id", "tenant_id",
+              "mac_address", "shared")
+
+
+def _listify(filters):
+    for key in _LISTIFIED:
+        listified = filters.get(key)
+        if listified and not isinstance(listified, list):
+            filters[key] = [listified]
+
+
+def _reuse_after(column, reuse_after):
+    reuse = timeutils.utcnow() - datetime.timedelta(seconds=reuse_after)
+    return column <= reuse
+
+
+def _deallocated(column, deallocated):
+    if deallocated:
+        return column == 1
+    return column != 1
+
+
+# Filter key, the model attribute it applies to and how the clause is
+# built from that attribute and the filter value. A filter is skipped
+# when its value is empty, except for _deallocated which is skipped only
+# when it is None.
+FILTERS = (
+    ("name", "name", lambda c, v: c.in_(v)),
+    ("network_id", "network_id", lambda c, v: c.in_(v)),
+    ("mac_address", "mac_address", lambda c, v: c.in_(v)),
+    ("tenant_id", "tenant_id", lambda c, v: c.in_(v)),
+    ("id", "id", lambda c, v: c.in_(v)),
+    ("reuse_after", "deallocated_at", _reuse_after),
+    ("subnet_id", "subnet_id", lambda c, v: c == v),
+    ("deallocated", "deallocated", lambda c, v: c == v),
+    ("_deallocated", "_deallocated", _deallocated),
+    ("device_id", "device_id", lambda c, v: c.in_(v)),
+    ("address", "address", lambda c, v: c == v),
+    ("version", "ip_version", lambda c, v: c == v),
+    ("ip_address", "address", lambda c, v: c == int(v)),
+    ("mac_address_range_id", "mac_address_range_id", lambda c, v: c == v),
+    ("cidr", "cidr", lambda c, v: c == v))
+
+FILTER_KEYS = frozenset(key for key, _, _ in FILTERS)
+
+# Per model, [(filter key, attribute, clause builder)] for the filters of
+# FILTERS the model has the attribute for. Built on first use of a model.
+_model_filters = {}
+
+
+def _filters_for_model(model):
+    table = _model_filters.get(model)
+    if table is None:
+        table = [(key, getattr(model, attr), clause)
+                 for key, attr, clause in FILTERS if hasattr(model, attr)]
+        _model_filters[model] = table
+    return table
 
 
 def _model_query(context, model, filters, fields=None):
@@ -73,58 +223,25 @@ def _model_query(context, model, filters, fields=None):
     if not (context.is_admin or "tenant_id" in filters):
         filters["tenant_id"] = [context.tenant_id]
 
-    if filters.get("name"):
-        model_filters.append(model.name.in_(filters["name"]))
-
-    if filters.get("network_id"):
-        model_filters.append(model.network_id.in_(filters["network_id"]))
-
-    if filters.get("mac_address"):
-        model_filters.append(model.mac_address.in_(filters["mac_address"]))
-
-    if filters.get("tenant_id"):
-        model_filters.append(model.tenant_id.in_(filters["tenant_id"]))
-
-    if filters.get("id"):
-        model_filters.append(model.id.in_(filters["id"]))
-
-    if filters.get("reuse_after"):
-        reuse_after = filters["reuse_after"]
-        reuse = (timeutils.utcnow() -
-                 datetime.timedelta(seconds=reuse_after))
-        model_filters.append(model.deallocated_at <= reuse)
-
-    if filters.get("subnet_id"):
-        model_filters.append(model.subnet_id ==
-                             filters["subnet_id"])
-
-    if filters.get("deallocated"):
-        model_filters.append(model.deallocated == filters["deallocated"])
-
-    if filters.get("_deallocated") is not None:
-        if filters.get("_deallocated"):
-            model_filters.append(model._deallocated == 1)
-        else:
-            model_filters.append(model._deallocated != 1)
-
-    if filters.get("device_id"):
-        model_filters.append(models.Port.device_id.in_(filters["device_id"]))
-
-    if filters.get("address"):
-        model_filters.append(model.address == filters["address"])
-
-    if filters.get("version"):
-        model_filters.append(model.ip_version == filters["version"])
-
-    if filters.get("ip_address"):
-        model_filters.append(model.address == int(filters["ip_address"]))
-
-    if filters.get("mac_address_range_id"):
-        model_filters.append(model.mac_address_range_id ==
-                             filters["mac_address_range_id"])
-
-    if filters.get("cidr"):
-        model_filters.append(model.cidr == filters["cidr"])
+    table = _filters_for_model(model)
+    for key, column, clause in table:
+        value = filters.get(key)
+        if value is None or (not value and key != "_deallocated"):
+            continue
+        model_filters.append(clause(column, value))
+
+    # Filters the model has no column for would have been ignored, refuse
+    # them instead. Keys that aren't filters at all, like segment_id or
+    # the unsupported filters the API passes along, are still ignored.
+    if len(model_filters) < len(filters):
+        applicable = set(key for key, _, _ in table)
+        for key in FILTER_KEYS.intersection(filters):
+            value = filters[key]
+            if key in applicable or value is None:
+                continue
+            if value or key == "_deallocated":
+                raise quark_exc.UnsupportedFilter(model=model.__name__,
+                                                  key=key)
 
     return model_filters
 
@@ -165,6 +282,46 @@ def port_find(context, **filters):
     return query.filter(*model_filters)
 
 
+def network_info_find(context, device_ids):
+    """Fetches what's needed to describe the networking of devices.
+
+    Returns the ports of device_ids with their IP addresses and security
+    groups, the subnets of those addresses (with routes, DNS and IP
+    policies) and the networks of the ports. Costs one query each,
+    however many devices, ports or subnets are involved.
+    """
+    if not device_ids:
+        return [], [], []
+
+    ports = port_find(context, device_id=device_ids, scope=ALL).options(
+        orm.joinedload(models.Port.security_groups)).all()
+    subnet_ids = set()
+    network_ids = set()
+    for port in ports:
+        network_ids.add(port["network_id"])
+        for address in port["ip_addresses"]:
+            subnet_ids.add(address["subnet_id"])
+
+    # NOTE: subnets and networks are reached through ports the caller can
+    #       already see, and provider ones belong to another tenant, so
+    #       they aren't tenant filtered
+    subnets = []
+    if subnet_ids:
+        query = context.session.query(models.Subnet).options(
+            orm.joinedload(models.Subnet.routes),
+            orm.joinedload(models.Subnet.dns_nameservers),
+            orm.joinedload_all("ip_policy.exclude"),
+            orm.joinedload_all("network.ip_policy.exclude"))
+        subnets = query.filter(models.Subnet.id.in_(subnet_ids)).all()
+
+    networks = []
+    if network_ids:
+        query = context.session.query(models.Network).options(
+            orm.joinedload(models.Network.subnets))
+        networks = query.filter(models.Network.id.in_(network_ids)).all()
+    return ports, subnets, networks
+
+
 def port_count_all(context, **filters):
     query = context.session.query(sql_func.count(models.Port.id))
     model_filters = _model_query(context, models.Port, filters)
@@ -211,6 +368,20 @@ def ip_address_create(context, **address_dict):
     return ip_address
 
 
+def ip_address_bulk_deallocate(context, address_ids):
+    if not address_ids:
+        return 0
+    query = context.session.query(models.IPAddress)
+    query = query.filter(models.IPAddress.id.in_(address_ids))
+    count = query.update({"_deallocated": True,
+                          "deallocated_at": timeutils.utcnow(),
+                          "revision": models.IPAddress.revision + 1},
+                         synchronize_session=False)
+    # Bulk updates skip the flush, so log them by hand
+    change_bulk_create(context, "ip_address", address_ids, "update")
+    return count
+
+
 @scoped
 def ip_address_find(context, **filters):
     query = context.session.query(models.IPAddress)
@@ -232,10 +403,11 @@ def ip_address_find(context, **filters):
         else:
             query = query.filter(stmt.c.ports_count <= 1)
 
+    device_ids = filters.pop("device_id", None)
     model_filters = _model_query(context, models.IPAddress, filters)
-    if filters.get("device_id"):
+    if device_ids:
         model_filters.append(models.IPAddress.ports.any(
-            models.Port.device_id.in_(filters["device_id"])))
+            models.Port.device_id.in_(device_ids)))
 
     return query.filter(*model_filters)
 
@@ -284,6 +456,16 @@ def mac_address_update(context, mac, **kwargs):
     return mac
 
 
+def mac_address_bulk_deallocate(context, addresses):
+    if not addresses:
+        return 0
+    query = context.session.query(models.MacAddress)
+    query = query.filter(models.MacAddress.address.in_(addresses))
+    return query.update({"deallocated": True,
+                         "deallocated_at": timeutils.utcnow()},
+                        synchronize_session=False)
+
+
 def mac_address_create(context, **mac_dict):
     mac_address = models.MacAddress()
     mac_address.update(mac_dict)
@@ -328,6 +510,18 @@ def network_find(context, fields=None, **filters):
     return query
 
 
+def network_find_strategy(context):
+    """Returns the networks named by the network strategy, parents and
+    children alike, whatever tenant they belong to.
+    """
+    ids = (list(STRATEGY.get_assignable_networks(context)) +
+           STRATEGY.reverse_strategy.keys())
+    if not ids:
+        return []
+    query = context.session.query(models.Network)
+    return query.filter(models.Network.id.in_(ids)).all()
+
+
 def network_create(context, **network):
     new_net = models.Network()
     new_net.update(network)
@@ -375,6 +569,22 @@ def subnet_find(context, **filters):
     return query.filter(*model_filters)
 
 
+def subnet_find_overlapping(context, network_id, cidr):
+    """Returns a subnet of the network overlapping cidr, or None.
+
+    Compares the integer bounds of the subnets, so no subnet is loaded
+    unless it overlaps.
+    """
+    ip = netaddr.IPNetwork(cidr)
+    first, last = ip.ipv6().first, ip.ipv6().last
+    query = context.session.query(models.Subnet)
+    query = query.filter(models.Subnet.network_id == network_id)
+    query = query.filter(models.Subnet.ip_version == ip.version)
+    query = query.filter(models.Subnet.first_ip <= last)
+    query = query.filter(models.Subnet.last_ip >= first)
+    return query.first()
+
+
 def subnet_count_all(context, **filters):
     query = context.session.query(sql_func.count(models.Subnet.id))
     if filters.get("network_id"):
@@ -388,6 +598,66 @@ def subnet_delete(context, subnet):
     context.session.delete(subnet)
 
 
+def subnet_ids_for_network(context, network_id):
+    query = context.session.query(models.Subnet.id)
+    query = query.filter(models.Subnet.network_id == network_id)
+    return [row.id for row in query]
+
+
+def subnet_find_in_use(context, subnet_ids):
+    """Returns the id of one of the subnets that still has allocated IPs,
+    or None if none of them has any.
+    """
+    if not subnet_ids:
+        return None
+    query = context.session.query(models.IPAddress.subnet_id)
+    query = query.filter(models.IPAddress.subnet_id.in_(subnet_ids))
+    row = query.filter(models.IPAddress._deallocated != 1).first()
+    return row and row.subnet_id
+
+
+def subnet_bulk_delete(context, subnet_ids):
+    """Deletes subnets along with their routes, DNS nameservers and IP
+    policies, one DELETE per table.
+    """
+    if not subnet_ids:
+        return 0
+    session = context.session
+    network_ids = set(row.network_id for row in
+                      session.query(models.Subnet.network_id).filter(
+                          models.Subnet.id.in_(subnet_ids)))
+    route_ids = [row.id for row in session.query(models.Route.id).filter(
+        models.Route.subnet_id.in_(subnet_ids))]
+    if route_ids:
+        session.query(models.Route).\
+            filter(models.Route.id.in_(route_ids)).\
+            delete(synchronize_session=False)
+    session.query(models.DNSNameserver).\
+        filter(models.DNSNameserver.subnet_id.in_(subnet_ids)).\
+        delete(synchronize_session=False)
+
+    policy_ids = session.query(models.IPPolicy.id).\
+        filter(models.IPPolicy.subnet_id.in_(subnet_ids)).subquery()
+    session.query(models.IPPolicyRule).\
+        filter(models.IPPolicyRule.ip_policy_id.in_(policy_ids)).\
+        delete(synchronize_session=False)
+    session.query(models.IPPolicy).\
+        filter(models.IPPolicy.subnet_id.in_(subnet_ids)).\
+        delete(synchronize_session=False)
+
+    count = session.query(models.Subnet).\
+        filter(models.Subnet.id.in_(subnet_ids)).\
+        delete(synchronize_session=False)
+    # Bulk deletes skip the flush, so log them and bump the networks
+    # listing the subnets by hand
+    change_bulk_create(context, "route", route_ids, "delete")
+    change_bulk_create(context, "subnet", subnet_ids, "delete")
+    network_ids.discard(None)
+    if network_ids:
+        _network_bump_revisions(session, network_ids)
+    return count
+
+
 def subnet_create(context, **subnet_dict):
     subnet = models.Subnet()
     subnet.update(subnet_dict)
@@ -409,21 +679,61 @@ def route_find(context, fields=None, **filters):
     return query.filter(*model_filters)
 
 
+def route_find_overlapping(context, subnet_id, cidr):
+    """Returns a route of the subnet overlapping cidr, or None.
+
+    Default routes never conflict. CIDRs either nest or are disjoint, so
+    overlapping routes are the ones containing or contained in cidr.
+    """
+    ip = netaddr.IPNetwork(cidr).ipv6()
+    query = context.session.query(models.Route)
+    model_filters = _model_query(context, models.Route,
+                                 dict(subnet_id=subnet_id))
+    query = query.filter(*model_filters)
+    query = query.filter(models.Route.prefix != 0)
+    query = query.filter(models.Route.first_ip <= ip.last)
+    query = query.filter(models.Route.last_ip >= ip.first)
+    return query.first()
+
+
+def _route_set_subnet_gateway(context, route, gateway_ip):
+    """Stores the gateway of a default route on its subnet.
+
+    Routes attached through the subnet's routes collection have no
+    subnet_id yet, their callers set the gateway on the subnet.
+    """
+    if not route["subnet_id"]:
+        return
+    query = context.session.query(models.Subnet)
+    query = query.filter(models.Subnet.id == route["subnet_id"])
+    query.update({"gateway_ip": gateway_ip},
+                 synchronize_session="evaluate")
+
+
 def route_create(context, **route_dict):
     new_route = models.Route()
     new_route.update(route_dict)
     new_route["tenant_id"] = context.tenant_id
     context.session.add(new_route)
+    if new_route["prefix"] == 0:
+        _route_set_subnet_gateway(context, new_route, new_route["gateway"])
     return new_route
 
 
 def route_update(context, route, **kwargs):
+    was_default = route["prefix"] == 0
     route.update(kwargs)
     context.session.add(route)
+    if route["prefix"] == 0:
+        _route_set_subnet_gateway(context, route, route["gateway"])
+    elif was_default:
+        _route_set_subnet_gateway(context, route, None)
     return route
 
 
 def route_delete(context, route):
+    if route["prefix"] == 0:
+        _route_set_subnet_gateway(context, route, None)
     context.session.delete(route)
 
 
@@ -449,6 +759,12 @@ def security_group_find(context, **filters):
     return query.filter(*model_filters)
 
 
+def security_group_exists(context, id):
+    query = context.session.query(models.SecurityGroup.id)
+    model_filters = _model_query(context, models.SecurityGroup, {"id": [id]})
+    return query.filter(*model_filters).first() is not None
+
+
 def security_group_create(context, **sec_group_dict):
     new_group = models.SecurityGroup()
     new_group.update(sec_group_dict)
@@ -474,15 +790,36 @@ def security_group_rule_find(context, **filters):
     return query.filter(*model_filters)
 
 
-def security_group_rule_create(context, **rule_dict):
+def security_group_rule_count_by_group(context, group_ids):
+    """Returns the number of rules of each group, by group id. Groups
+    without rules are left out.
+    """
+    rules = models.SecurityGroupRule
+    query = context.session.query(rules.group_id, sql_func.count(rules.id))
+    query = query.filter(rules.group_id.in_(group_ids))
+    return dict(query.group_by(rules.group_id).all())
+
+
+def _security_group_rule_new(rule_dict):
     new_rule = models.SecurityGroupRule()
     new_rule.update(rule_dict)
     new_rule.group_id = rule_dict['security_group_id']
     new_rule.tenant_id = rule_dict['tenant_id']
+    return new_rule
+
+
+def security_group_rule_create(context, **rule_dict):
+    new_rule = _security_group_rule_new(rule_dict)
     context.session.add(new_rule)
     return new_rule
 
 
+def security_group_rule_create_bulk(context, rules):
+    new_rules = [_security_group_rule_new(rule_dict) for rule_dict in rules]
+    context.session.add_all(new_rules)
+    return new_rules
+
+
 def security_group_rule_delete(context, rule):
     context.session.delete(rule)
 
@@ -509,3 +846,136 @@ def ip_policy_find(context, **filters):
 
 def ip_policy_delete(context, ip_policy):
     context.session.delete(ip_policy)
+
+
+def revision_etag(context, model, **filters):
+    """Returns an ETag for the rows of model matching filters.
+
+    Only the ids and revisions of the rows are read, so no relationship is
+    loaded. Returns None if nothing matches a search by id.
+
+    Network ids are rendered through the network strategy, which can be
+    reloaded without touching any row, so the ETag covers them as they
+    are rendered.
+    """
+    columns = [model.id, model.revision]
+    if hasattr(model, "network_id"):
+        columns.append(model.network_id)
+    query = context.session.query(*columns)
+    query = query.filter(*_model_query(context, model, filters))
+    digest = hashlib.md5()
+    rows = 0
+    for row in query.order_by(model.id):
+        digest.update("%s:%s," % (row.id, row.revision))
+        if model is models.Network:
+            digest.update("%s," % STRATEGY.is_parent_network(row.id))
+        elif hasattr(model, "network_id"):
+            digest.update("%s," % STRATEGY.get_parent_network(
+                row.network_id))
+        rows += 1
+    if filters.get("id") and not rows:
+        return None
+    return digest.hexdigest()
+
+
+def change_bulk_create(context, resource, resource_ids, action):
+    context.session.add_all([
+        models.ChangeLog(resource=resource, resource_id=resource_id,
+                         action=action, tenant_id=context.tenant_id)
+        for resource_id in resource_ids])
+
+
+@scoped
+def change_find(context, since=None, limit=None, **filters):
+    query = context.session.query(models.ChangeLog)
+    model_filters = _model_query(context, models.ChangeLog, filters)
+    if since is not None:
+        model_filters.append(models.ChangeLog.id > since)
+    query = query.filter(*model_filters).order_by(models.ChangeLog.id)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+def change_prune(context, before):
+    query = context.session.query(models.ChangeLog)
+    query = query.filter(models.ChangeLog.created_at < before)
+    return query.delete(synchronize_session=False)
+
+
+def backend_operation_create(context, **operation):
+    new_op = models.BackendOperation(tenant_id=context.tenant_id)
+    new_op.update(operation)
+    context.session.add(new_op)
+    return new_op
+
+
+def backend_operation_record(context, **operation):
+    """Creates an operation unless one with its idempotency_key exists.
+
+    The unique key decides, so two requests recording the same operation
+    at once can't both write it. Returns the new operation or None.
+    """
+    try:
+        with context.session.begin_nested():
+            return backend_operation_create(context, **operation)
+    except sql_exc.IntegrityError:
+        return None
+
+
+def backend_operation_find(context, limit=None, **filters):
+    query = context.session.query(models.BackendOperation)
+    query = query.filter_by(**filters).order_by(models.BackendOperation.id)
+    if limit:
+        query = query.limit(limit)
+    return query.all()
+
+
+def backend_operation_find_due(context, limit=None):
+    """Returns the operations to make now: the first unparked operation of
+    each resource, if it is due.
+    """
+    ops = models.BackendOperation
+    heads = context.session.query(sql_func.min(ops.id)).\
+        filter(ops.parked_at.is_(None)).\
+        group_by(ops.resource_id).subquery()
+    query = context.session.query(ops).filter(ops.id.in_(heads))
+    query = query.filter(ops.next_attempt_at <= timeutils.utcnow())
+    query = query.order_by(ops.id)
+    if limit:
+        query = query.limit(limit)
+    return query.all()
+
+
+def backend_operation_claim(context, operation, lease):
+    """Takes an operation for lease seconds if it is due.
+
+    Returns False if it isn't due or another dispatcher claimed it first.
+    """
+    now = timeutils.utcnow()
+    query = context.session.query(models.BackendOperation)
+    query = query.filter(models.BackendOperation.id == operation["id"])
+    query = query.filter(models.BackendOperation.next_attempt_at <= now)
+    count = query.update(
+        {"next_attempt_at": now + datetime.timedelta(seconds=lease)},
+        synchronize_session=False)
+    return count == 1
+
+
+def backend_operation_retry_later(context, operation, delay, error):
+    operation["attempts"] += 1
+    operation["last_error"] = error
+    operation["next_attempt_at"] = (timeutils.utcnow() +
+                                    datetime.timedelta(seconds=delay))
+    context.session.add(operation)
+
+
+def backend_operation_park(context, operation, error):
+    operation["attempts"] += 1
+    operation["last_error"] = error
+    operation["parked_at"] = timeutils.utcnow()
+    context.session.add(operation)
+
+
+def backend_operation_delete(context, operation):
+    context.session.delete(operation)
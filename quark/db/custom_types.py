@@ -18,31 +18,33 @@ from sqlalchemy import types
 
 
 class INET(types.TypeDecorator):
-    impl = types.LargeBinary
+    """An IP address as an integer, comparable in SQL.
+
+    Range queries over addresses depend on the stored values sorting like
+    the integers they stand for.
+    """
+    impl = types.Numeric
 
     def load_dialect_impl(self, dialect):
         if dialect.name == 'sqlite':
             # IPv6 is 128 bits => 2^128 == 3.4e38 => 39 digits
             return dialect.type_descriptor(sqlite.CHAR(39))
-        return dialect.type_descriptor(self.impl)
+        return dialect.type_descriptor(types.Numeric(precision=39, scale=0))
 
     def process_bind_param(self, value, dialect):
         if value is None:
             return value
 
         if dialect.name == 'sqlite':
-            return str(value)
+            # Zero padded so text comparisons order like the numbers
+            return "%039d" % long(value)
 
         return value
 
     def process_result_value(self, value, dialect):
         if value is None:
             return value
-
-        if dialect.name == 'sqlite':
-            return long(value)
-
-        return value
+        return long(value)
 
 
 class MACAddress(types.TypeDecorator):
@@ -87,6 +87,12 @@ class Tag(BASEV2, models.HasId, models.HasTenant):
                                    backref=orm.backref("tags_association"))
 
 
+class HasRevision(object):
+    """Revision counter, bumped by every flush that changes the row."""
+    revision = sa.Column(sa.Integer(), nullable=False, default=1,
+                         server_default="1")
+
+
 class IsHazTags(object):
     @declarative.declared_attr
     def tag_association_uuid(cls):
@@ -105,7 +111,7 @@ class IsHazTags(object):
         return orm.relationship("TagAssociation", backref=backref)
 
 
-class IPAddress(BASEV2, models.HasId, models.HasTenant):
+class IPAddress(BASEV2, models.HasId, models.HasTenant, HasRevision):
     """More closely emulate the melange version of the IP table.
 
     We always mark the record as deallocated rather than deleting it.
@@ -155,14 +161,43 @@ class IPAddress(BASEV2, models.HasId, models.HasTenant):
     deallocated_at = sa.Column(sa.DateTime())
 
 
-class Route(BASEV2, models.HasTenant, models.HasId, IsHazTags):
+class Route(BASEV2, models.HasTenant, models.HasId, IsHazTags,
+            HasRevision):
     __tablename__ = "quark_routes"
-    cidr = sa.Column(sa.String(64))
+    _cidr = sa.Column("cidr", sa.String(64))
+
+    @hybrid.hybrid_property
+    def cidr(self):
+        return self._cidr
+
+    @cidr.setter
+    def cidr(self, val):
+        self._cidr = val
+        ip = netaddr.IPNetwork(val)
+        self.prefix = ip.prefixlen
+        ip = ip.ipv6()
+        self.first_ip = ip.first
+        self.last_ip = ip.last
+
+    @cidr.expression
+    def cidr(cls):
+        return Route._cidr
+
+    # Bounds of the destination, mapped to IPv6 like the subnet's
+    first_ip = sa.Column(custom_types.INET())
+    last_ip = sa.Column(custom_types.INET())
+    prefix = sa.Column(sa.Integer())
     gateway = sa.Column(sa.String(64))
     subnet_id = sa.Column(sa.String(36), sa.ForeignKey("quark_subnets.id",
                                                        ondelete="CASCADE"))
 
 
+# Backs the route conflict check, a range query over a subnet's routes
+sa.Index("idx_quark_routes_subnet_id_first_ip_last_ip",
+         Route.__table__.c.subnet_id, Route.__table__.c.first_ip,
+         Route.__table__.c.last_ip)
+
+
 class DNSNameserver(BASEV2, models.HasTenant, models.HasId, IsHazTags):
     __tablename__ = "quark_dns_nameservers"
     ip = sa.Column(custom_types.INET())
@@ -170,7 +205,8 @@ class DNSNameserver(BASEV2, models.HasTenant, models.HasId, IsHazTags):
                                                        ondelete="CASCADE"))
 
 
-class Subnet(BASEV2, models.HasId, models.HasTenant, IsHazTags):
+class Subnet(BASEV2, models.HasId, models.HasTenant, IsHazTags,
+             HasRevision):
     """Upstream model for IPs.
 
     Subnet -> has_many(IPAllocationPool)
@@ -211,6 +247,8 @@ class Subnet(BASEV2, models.HasId, models.HasTenant, IsHazTags):
     last_ip = sa.Column(custom_types.INET())
     ip_version = sa.Column(sa.Integer())
     next_auto_assign_ip = sa.Column(custom_types.INET())
+    # Nexthop of the default route, kept by the route_* db api calls
+    gateway_ip = sa.Column(sa.String(64))
 
     allocated_ips = orm.relationship(IPAddress,
                                      primaryjoin='and_(Subnet.id=='
@@ -228,6 +266,13 @@ class Subnet(BASEV2, models.HasId, models.HasTenant, IsHazTags):
     ip_policy = orm.relationship("IPPolicy", uselist=False, backref="subnet")
 
 
+# Backs the CIDR overlap check, which runs a range query over a network's
+# subnets for every subnet create
+sa.Index("idx_quark_subnets_network_id_first_ip_last_ip",
+         Subnet.__table__.c.network_id, Subnet.__table__.c.first_ip,
+         Subnet.__table__.c.last_ip)
+
+
 port_ip_association_table = sa.Table(
     "quark_port_ip_address_associations",
     BASEV2.metadata,
@@ -272,7 +317,7 @@ class SecurityGroup(BASEV2, models.HasId, models.HasTenant):
                              primaryjoin=join)
 
 
-class Port(BASEV2, models.HasTenant, models.HasId):
+class Port(BASEV2, models.HasTenant, models.HasId, HasRevision):
     __tablename__ = "quark_ports"
     id = sa.Column(sa.String(36), primary_key=True)
     name = sa.Column(sa.String(255))
@@ -306,6 +351,12 @@ class Port(BASEV2, models.HasTenant, models.HasId):
                                 backref="ports")
 
 
+# Backs the ports_per_network quota check, which counts a tenant's ports on
+# a network for every port create
+sa.Index("idx_quark_ports_network_id_tenant_id",
+         Port.__table__.c.network_id, Port.__table__.c.tenant_id)
+
+
 class MacAddress(BASEV2, models.HasTenant):
     __tablename__ = "quark_mac_addresses"
     address = sa.Column(sa.BigInteger(), primary_key=True)
@@ -352,9 +403,56 @@ class IPPolicyRule(BASEV2, models.HasId):
     prefix = sa.Column(sa.Integer())
 
 
-class Network(BASEV2, models.HasTenant, models.HasId):
+class Network(BASEV2, models.HasTenant, models.HasId, HasRevision):
     __tablename__ = "quark_networks"
     name = sa.Column(sa.String(255))
     ports = orm.relationship(Port, backref='network')
     subnets = orm.relationship(Subnet, backref='network')
     ip_policy = orm.relationship(IPPolicy, uselist=False, backref="network")
+
+
+class ChangeLog(BASEV2, models.HasTenant):
+    """Ordered record of mutations to the resources clients sync on.
+
+    Rows are written in the same flush as the change they describe. The
+    autoincrementing id doubles as the cursor clients poll from, once
+    created_at is old enough for every lower id to have committed.
+    """
+    __tablename__ = "quark_change_log"
+    id = sa.Column(sa.Integer(), primary_key=True, autoincrement=True)
+    resource = sa.Column(sa.String(36), nullable=False)
+    resource_id = sa.Column(sa.String(36), nullable=False)
+    action = sa.Column(sa.String(10), nullable=False)
+
+
+sa.Index("idx_quark_change_log_tenant_id_id",
+         ChangeLog.__table__.c.tenant_id, ChangeLog.__table__.c.id)
+sa.Index("idx_quark_change_log_created_at",
+         ChangeLog.__table__.c.created_at)
+
+
+class BackendOperation(BASEV2, models.HasTenant):
+    """A net driver call recorded in the transaction that requires it.
+
+    The outbox dispatcher makes the call after the transaction commits and
+    deletes the row once it succeeds. Operations on the same resource run
+    in id order. An operation that keeps failing is parked, which keeps the
+    row for inspection but stops retrying it.
+    """
+    __tablename__ = "quark_backend_operations"
+    id = sa.Column(sa.Integer(), primary_key=True, autoincrement=True)
+    idempotency_key = sa.Column(sa.String(255), nullable=False, unique=True)
+    resource_id = sa.Column(sa.String(36), nullable=False)
+    operation = sa.Column(sa.String(64), nullable=False)
+    arguments = sa.Column(sa.Text())
+    attempts = sa.Column(sa.Integer(), nullable=False, default=0)
+    last_error = sa.Column(sa.Text())
+    next_attempt_at = sa.Column(sa.DateTime(), nullable=False,
+                                default=timeutils.utcnow)
+    parked_at = sa.Column(sa.DateTime())
+
+
+# Backs the search for the next operation of each resource
+sa.Index("idx_quark_backend_operations_resource_id_id",
+         BackendOperation.__table__.c.resource_id,
+         BackendOperation.__table__.c.id)
@@ -68,3 +68,8 @@ class BaseDriver(object):
     def delete_security_group_rule(self, context, group_id, rule):
         LOG.info("Deleting security rule on group %s for tenant %s" %
                 (group_id, context.tenant_id))
+
+    def update_security_group_rules(self, context, group_id, added=None,
+                                    removed=None):
+        LOG.info("Updating security rules on group %s for tenant %s" %
+                (group_id, context.tenant_id))
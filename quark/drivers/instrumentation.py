@@ -0,0 +1,253 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Call counts, errors and latency histograms for net driver calls
+
+Driver methods and the controller round trips they make are both
+recorded, keyed by the plugin operation that was running at the time.
+"""
+
+import contextlib
+import functools
+import threading
+import time
+
+import eventlet
+from neutron.openstack.common import log as logging
+from oslo.config import cfg
+
+CONF = cfg.CONF
+LOG = logging.getLogger("neutron.quark.instrumentation")
+
+instrumentation_opts = [
+    cfg.BoolOpt('instrument_drivers', default=False,
+                help=_('Record call counts and latencies of net driver '
+                       'methods and backend requests')),
+    cfg.IntOpt('instrumentation_log_interval', default=60,
+               help=_('Seconds between logging driver call statistics. '
+                      '0 disables logging')),
+]
+
+CONF.register_opts(instrumentation_opts, "QUARK")
+
+# Upper bounds of the latency histogram buckets in milliseconds. The last
+# bucket counts everything slower.
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Methods of backend client objects that make a request to the controller
+ROUND_TRIPS = ("create", "read", "update", "delete", "results")
+
+_local = threading.local()
+
+
+class Metric(object):
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    def record(self, elapsed_ms, error=False):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if error:
+            self.errors += 1
+        for i, bound in enumerate(BUCKETS):
+            if elapsed_ms <= bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def to_dict(self):
+        return {"count": self.count, "errors": self.errors,
+                "mean_ms": self.count and self.total_ms / self.count or 0,
+                "histogram": list(self.histogram)}
+
+
+class Stats(object):
+    def __init__(self):
+        self.metrics = {}
+        self._logger = None
+
+    def record(self, name, elapsed_ms, error=False):
+        key = (current_operation(), name)
+        metric = self.metrics.get(key)
+        if metric is None:
+            metric = self.metrics.setdefault(key, Metric())
+        metric.record(elapsed_ms, error)
+        if self._logger is None and CONF.QUARK.instrumentation_log_interval:
+            self._logger = eventlet.spawn(self._log_forever)
+
+    def snapshot(self):
+        """Returns {(operation, call): metric dict}."""
+        return dict((key, metric.to_dict())
+                    for key, metric in self.metrics.items())
+
+    def reset(self):
+        self.metrics.clear()
+
+    def log(self):
+        for (operation, name), metric in sorted(self.snapshot().items()):
+            LOG.info("%s %s count=%d errors=%d mean_ms=%.2f histogram=%s" %
+                     (operation, name, metric["count"], metric["errors"],
+                      metric["mean_ms"], metric["histogram"]))
+
+    def _log_forever(self):
+        while True:
+            eventlet.sleep(CONF.QUARK.instrumentation_log_interval)
+            try:
+                self.log()
+            except Exception:
+                LOG.exception("Failed to log driver statistics")
+
+
+STATS = Stats()
+
+
+def current_operation():
+    return getattr(_local, "operation", None) or "unknown"
+
+
+@contextlib.contextmanager
+def operation(name):
+    """Tags the driver calls made inside the block with name.
+
+    Nested operations keep the outermost tag.
+    """
+    outer = getattr(_local, "operation", None)
+    if outer is None:
+        _local.operation = name
+    try:
+        yield
+    finally:
+        _local.operation = outer
+
+
+def carry_operation(func):
+    """Makes func tag its calls with the current operation, even when it
+    runs in another green thread.
+    """
+    name = getattr(_local, "operation", None)
+    if name is None:
+        return func
+
+    @functools.wraps(func)
+    def _carried(*args, **kwargs):
+        with operation(name):
+            return func(*args, **kwargs)
+    return _carried
+
+
+@contextlib.contextmanager
+def timed(name):
+    start = time.time()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        STATS.record(name, (time.time() - start) * 1000, error)
+
+
+def _timed_call(name, func):
+    @functools.wraps(func)
+    def _call(*args, **kwargs):
+        with timed(name):
+            return func(*args, **kwargs)
+    return _call
+
+
+def tag_operations(cls):
+    """Class decorator tagging calls made by every public method with the
+    method's name.
+    """
+    for name, func in cls.__dict__.items():
+        if name.startswith("_") or not callable(func):
+            continue
+
+        def _wrap(name, func):
+            @functools.wraps(func)
+            def _tagged(*args, **kwargs):
+                with operation(name):
+                    return func(*args, **kwargs)
+            return _tagged
+        setattr(cls, name, _wrap(name, func))
+    return cls
+
+
+class InstrumentedDriver(object):
+    """Wraps a net driver, timing each of its public methods."""
+
+    def __init__(self, driver):
+        self._driver = driver
+
+    def __getattr__(self, name):
+        attr = getattr(self._driver, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        return _timed_call("driver.%s" % name, attr)
+
+
+class InstrumentedClient(object):
+    """Wraps a backend client object, timing its controller requests.
+
+    Objects it hands out are wrapped too, so requests made through an
+    lswitch or query built from the connection are counted as well.
+    Anything else, such as request results, is returned as is.
+    """
+
+    def __init__(self, client, kind="connection", wrap=None):
+        self._client = client
+        self._kind = kind
+        self._wrap = wrap or ()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+        if name in ROUND_TRIPS:
+            call_name = name == "results" and "query" or name
+            return _timed_call("%s.%s" % (self._kind, call_name), attr)
+
+        @functools.wraps(attr)
+        def _call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if result is self._client:
+                return self
+            if name in self._wrap:
+                return InstrumentedClient(result, name)
+            if name == "query":
+                return InstrumentedClient(result, self._kind)
+            return result
+        return _call
+
+
+def wrap_driver(driver):
+    if not CONF.QUARK.instrument_drivers:
+        return driver
+    return InstrumentedDriver(driver)
+
+
+def wrap_connection(connection, entities):
+    """Wraps a backend connection. entities are the names of its methods
+    returning objects that make requests, like "lswitch".
+    """
+    if not CONF.QUARK.instrument_drivers:
+        return connection
+    return InstrumentedClient(connection, wrap=entities)
@@ -17,6 +17,13 @@
 NVP client driver for Quark
 """
 
+import copy
+import json
+import socket
+import threading
+import time
+
+import eventlet
 from oslo.config import cfg
 
 import aiclib
@@ -24,7 +31,9 @@ from neutron.extensions import securitygroup as sg_ext
 from neutron.openstack.common import log as logging
 
 from quark.drivers import base
+from quark.drivers import instrumentation
 from quark import exceptions
+from quark import utils
 
 
 LOG = logging.getLogger("neutron.quark.nvplib")
@@ -46,6 +55,16 @@ nvp_opts = [
     cfg.IntOpt('max_rules_per_port',
                default=30,
                help=_('Maximum rules per NVP lport across all groups')),
+    cfg.IntOpt('controller_cooldown',
+               default=30,
+               help=_('Seconds a failing NVP controller is skipped for')),
+    cfg.IntOpt('cache_ttl',
+               default=30,
+               help=_('Seconds NVP security profile and lswitch lookups '
+                      'are cached for. 0 disables the cache')),
+    cfg.IntOpt('cache_size',
+               default=1000,
+               help=_('Maximum number of entries in each NVP lookup cache')),
 ]
 
 physical_net_type_map = {
@@ -59,15 +78,25 @@ physical_net_type_map = {
 
 CONF.register_opts(nvp_opts, "NVP")
 
+# aiclib connection methods returning objects that talk to the controller
+NVP_ENTITIES = ("lswitch", "lswitch_port", "securityprofile", "transportzone")
+
 
 class NVPDriver(base.BaseDriver):
     def __init__(self):
         self.nvp_connections = []
         self.conn_index = 0
+        self._local = threading.local()
+        self._init_caches()
         self.limits = {'max_ports_per_switch': 0,
                        'max_rules_per_group': 0,
                        'max_rules_per_port': 0}
 
+    def _init_caches(self):
+        ttl, size = CONF.NVP.cache_ttl, CONF.NVP.cache_size
+        self.profile_cache = utils.TTLCache(ttl, size)
+        self.lswitch_cache = utils.TTLCache(ttl, size)
+
     def load_config(self):
         #NOTE(mdietz): What does default_tz actually mean?
         #              We don't have one default.
@@ -79,6 +108,7 @@ class NVPDriver(base.BaseDriver):
             'max_rules_per_group': CONF.NVP.max_rules_per_group,
             'max_rules_per_port': CONF.NVP.max_rules_per_port})
         LOG.info("Loading NVP settings " + str(connections))
+        self._init_caches()
         for conn in connections:
             (ip, port, user, pw, req_timeout,
              http_timeout, retries, redirects) = conn.split(":")
@@ -93,8 +123,70 @@ class NVPDriver(base.BaseDriver):
                                         redirects=redirects,
                                         default_tz=default_tz))
 
+    def _select_controller(self):
+        """Picks the next controller round-robin, skipping those marked
+        down. If every controller is down the next one is tried anyway.
+        """
+        now = time.time()
+        count = len(self.nvp_connections)
+        index = self.conn_index % count
+        for offset in xrange(count):
+            candidate = (self.conn_index + offset) % count
+            if self.nvp_connections[candidate].get("down_until", 0) <= now:
+                index = candidate
+                break
+        self.conn_index = (index + 1) % count
+        return self.nvp_connections[index]
+
+    def _mark_down(self, conn):
+        LOG.warning("Marking NVP controller %s down for %s seconds" %
+                    (conn.get("ip_address"), CONF.NVP.controller_cooldown))
+        conn["down_until"] = time.time() + CONF.NVP.controller_cooldown
+
+    def _is_controller_failure(self, exc):
+        if isinstance(exc, (eventlet.Timeout, socket.error, IOError)):
+            return True
+        if isinstance(exc, aiclib.core.AICException):
+            return exc.code >= 500
+        return False
+
+    def _is_not_found(self, exc):
+        return (isinstance(exc, aiclib.core.AICException) and
+                exc.code == 404)
+
+    def _map(self, func, items):
+        """Runs independent backend calls concurrently."""
+        return utils.pool_map(func, items)
+
+    def _req_timeout(self):
+        timeouts = [int(conn["req_timeout"]) for conn in self.nvp_connections
+                    if conn.get("req_timeout")]
+        return timeouts and max(timeouts) or None
+
+    def _read(self, func, *args, **kwargs):
+        """Runs an idempotent read, retrying it on another controller if the
+        one it ran against fails. Honors the req_timeout and retries fields
+        of the controller connection strings.
+        """
+        attempts = 0
+        while True:
+            self._local.controller = None
+            try:
+                with eventlet.Timeout(self._req_timeout()):
+                    return func(*args, **kwargs)
+            except (eventlet.Timeout, Exception) as e:
+                conn = self._local.controller
+                if conn is None or not self._is_controller_failure(e):
+                    raise
+                self._mark_down(conn)
+                attempts += 1
+                if attempts > int(conn.get("retries") or 0):
+                    raise
+                LOG.info("Retrying NVP read on another controller")
+
     def get_connection(self):
-        conn = self.nvp_connections[self.conn_index]
+        conn = self._select_controller()
+        self._local.controller = conn
         if "connection" not in conn:
             scheme = conn["port"] == "443" and "https" or "http"
             uri = "%s://%s:%s" % (scheme, conn["ip_address"], conn["port"])
@@ -103,7 +195,8 @@ class NVPDriver(base.BaseDriver):
             conn["connection"] = aiclib.nvp.Connection(uri,
                                                        username=user,
                                                        password=passwd)
-        return conn["connection"]
+        return instrumentation.wrap_connection(conn["connection"],
+                                               NVP_ENTITIES)
 
     def create_network(self, context, network_name, tags=None,
                        network_id=None, **kwargs):
@@ -111,22 +204,24 @@ class NVPDriver(base.BaseDriver):
                                     network_id, **kwargs)
 
     def delete_network(self, context, network_id):
-        lswitches = self._lswitches_for_network(context, network_id).results()
-        connection = self.get_connection()
-        for switch in lswitches["results"]:
-            LOG.debug("Deleting lswitch %s" % switch["uuid"])
-            connection.lswitch(switch["uuid"]).delete()
+        lswitches = self._read(
+            lambda: self._lswitches_for_network(context, network_id).results())
+        self._map(lambda switch: self._lswitch_delete(context, switch["uuid"]),
+                  lswitches["results"])
 
     def create_port(self, context, network_id, port_id,
                     status=True, security_groups=[], allowed_pairs=[]):
         tenant_id = context.tenant_id
-        lswitch = self._create_or_choose_lswitch(context, network_id)
+        # Choosing the lswitch doesn't depend on the security profiles, so
+        # look both up at once
+        lswitch, nvp_group_ids = self._map(lambda lookup: lookup(), [
+            lambda: self._create_or_choose_lswitch(context, network_id),
+            lambda: self._get_security_groups_for_port(context,
+                                                       security_groups)])
         connection = self.get_connection()
         port = connection.lswitch_port(lswitch)
         port.admin_status_enabled(status)
         port.allowed_address_pairs(allowed_pairs)
-        nvp_group_ids = self._get_security_groups_for_port(context,
-                                                           security_groups)
         port.security_profiles(nvp_group_ids)
         tags = [dict(tag=network_id, scope="neutron_net_id"),
                 dict(tag=port_id, scope="neutron_port_id"),
@@ -135,6 +230,7 @@ class NVPDriver(base.BaseDriver):
         port.tags(tags)
         res = port.create()
         res["lswitch"] = lswitch
+        self.lswitch_cache.set(res["uuid"], lswitch)
         return res
 
     def update_port(self, context, port_id, status=True,
@@ -158,6 +254,7 @@ class NVPDriver(base.BaseDriver):
             lswitch_uuid = self._lswitch_from_port(context, port_id)
         LOG.debug("Deleting port %s from lswitch %s" % (port_id, lswitch_uuid))
         connection.lswitch_port(lswitch_uuid, port_id).delete()
+        self.lswitch_cache.pop(port_id)
 
     def _get_network_details(self, context, network_id, switches):
         name, phys_net, phys_type, segment_id = None, None, None, None
@@ -203,9 +300,13 @@ class NVPDriver(base.BaseDriver):
         connection = self.get_connection()
         LOG.debug("Deleting security profile %s" % group_id)
         connection.securityprofile(guuid).delete()
+        self.profile_cache.pop((context.tenant_id, group_id))
 
     def update_security_group(self, context, group_id, **group):
         query = self._get_security_group(context, group_id)
+        return self._update_security_group(context, group_id, query, **group)
+
+    def _update_security_group(self, context, group_id, query, **group):
         connection = self.get_connection()
         profile = connection.securityprofile(query.get('uuid'))
 
@@ -224,39 +325,80 @@ class NVPDriver(base.BaseDriver):
             profile.port_ingress_rules(ingress_rules)
         if group.get('port_egress_rules', None) is not None:
             profile.port_egress_rules(egress_rules)
-        return profile.update()
+        res = profile.update()
+        self.profile_cache.pop((context.tenant_id, group_id))
+        if (group.get('port_ingress_rules', None) is not None or
+                group.get('port_egress_rules', None) is not None):
+            self._security_group_rules_changed(
+                context, group_id, len(ingress_rules) + len(egress_rules))
+        return res
+
+    def _security_group_rules_changed(self, context, group_id, rule_count):
+        """Hook for drivers that keep track of rule counts.
+
+        Called after the rules of a security profile were replaced.
+        """
+        pass
 
-    def _update_security_group_rules(self, context, group_id, rule, operation,
-                                     checks):
+    def _rule_key(self, rule):
+        """Stable identity of a rule, independent of key order."""
+        return json.dumps(rule, sort_keys=True)
+
+    def update_security_group_rules(self, context, group_id, added=None,
+                                    removed=None):
+        """Creates and deletes several rules of a group with one profile
+        update. Only the directions that changed are sent to NVP.
+        """
         groupd = self._get_security_group(context, group_id)
-        direction, secrule = self._get_security_group_rule_object(context,
-                                                                  rule)
-        rulelist = groupd['logical_port_%s_rules' % direction]
-        for check in checks:
-            if not check(secrule, rulelist):
-                raise checks[check]
-        getattr(rulelist, operation)(secrule)
-
-        LOG.debug("%s rule on security group %s" % (operation, groupd['uuid']))
-        group = {'port_%s_rules' % direction: rulelist}
-        return self.update_security_group(context, group_id, **group)
+        rulelists, keys = {}, {}
+        for direction in ('ingress', 'egress'):
+            rulelists[direction] = groupd['logical_port_%s_rules' % direction]
+            keys[direction] = set(self._rule_key(r)
+                                  for r in rulelists[direction])
+
+        changed = set()
+        for rule in removed or []:
+            direction, secrule = self._get_security_group_rule_object(
+                context, rule)
+            key = self._rule_key(secrule)
+            if key not in keys[direction]:
+                raise sg_ext.SecurityGroupRuleNotFound(
+                    id="with group_id %s" % group_id)
+            keys[direction].remove(key)
+            rulelists[direction] = [r for r in rulelists[direction]
+                                    if self._rule_key(r) != key]
+            changed.add(direction)
+
+        for rule in added or []:
+            direction, secrule = self._get_security_group_rule_object(
+                context, rule)
+            key = self._rule_key(secrule)
+            if key in keys[direction]:
+                raise sg_ext.SecurityGroupRuleExists(id=group_id)
+            keys[direction].add(key)
+            rulelists[direction].append(secrule)
+            changed.add(direction)
+
+        growth = len(added or []) - len(removed or [])
+        if growth > 0 and (self._check_rule_count_per_port(context, group_id)
+                           + growth > self.limits['max_rules_per_port']):
+            raise exceptions.DriverLimitReached(limit="rules per port")
+
+        if not changed:
+            return None
+        LOG.debug("Updating %d rules on security group %s" %
+                  (len(added or []) + len(removed or []), groupd['uuid']))
+        group = dict(('port_%s_rules' % direction, rulelists[direction])
+                     for direction in changed)
+        return self._update_security_group(context, group_id, groupd, **group)
 
     def create_security_group_rule(self, context, group_id, rule):
-        return self._update_security_group_rules(
-            context, group_id, rule, 'append',
-            {(lambda x, y: x not in y):
-             sg_ext.SecurityGroupRuleExists(id=group_id),
-             (lambda x, y:
-                 self._check_rule_count_per_port(context, group_id) <
-                 self.limits['max_rules_per_port']):
-             exceptions.DriverLimitReached(limit="rules per port")})
+        return self.update_security_group_rules(context, group_id,
+                                                added=[rule])
 
     def delete_security_group_rule(self, context, group_id, rule):
-        return self._update_security_group_rules(
-            context, group_id, rule, 'remove',
-            {(lambda x, y: x in y):
-             sg_ext.SecurityGroupRuleNotFound(id="with group_id %s" %
-                                              group_id)})
+        return self.update_security_group_rules(context, group_id,
+                                                removed=[rule])
 
     def _create_or_choose_lswitch(self, context, network_id):
         switches = self._lswitch_status_query(context, network_id)
@@ -275,9 +417,12 @@ class NVPDriver(base.BaseDriver):
                                     **switch_details)
 
     def _lswitch_status_query(self, context, network_id):
-        query = self._lswitches_for_network(context, network_id)
-        query.relations("LogicalSwitchStatus")
-        results = query.results()
+        def _query():
+            query = self._lswitches_for_network(context, network_id)
+            query.relations("LogicalSwitchStatus")
+            return query.results()
+
+        results = self._read(_query)
         LOG.debug("Query results: %s" % results)
         return results
 
@@ -368,29 +513,57 @@ class NVPDriver(base.BaseDriver):
         return query
 
     def _lswitch_from_port(self, context, port_id):
-        connection = self.get_connection()
-        query = connection.lswitch_port("*").query()
-        query.relations("LogicalSwitchConfig")
-        query.uuid(port_id)
-        port = query.results()
+        lswitch = self.lswitch_cache.get(port_id)
+        if lswitch:
+            return lswitch
+
+        def _query():
+            connection = self.get_connection()
+            query = connection.lswitch_port("*").query()
+            query.relations("LogicalSwitchConfig")
+            query.uuid(port_id)
+            return query.results()
+
+        port = self._read(_query)
         if port['result_count'] > 1:
             raise Exception("Could not identify lswitch for port %s" % port_id)
         if port['result_count'] < 1:
-            raise Exception("No lswitch found for port %s" % port_id)
-        return port['results'][0]["_relations"]["LogicalSwitchConfig"]["uuid"]
+            raise exceptions.LSwitchPortNotFound(port_id=port_id)
+        lswitch = port['results'][0]["_relations"]["LogicalSwitchConfig"]
+        self.lswitch_cache.set(port_id, lswitch["uuid"])
+        return lswitch["uuid"]
 
-    def _get_security_group(self, context, group_id):
-        connection = self.get_connection()
-        query = connection.securityprofile().query()
-        query.tagscopes(['os_tid', 'neutron_group_id'])
-        query.tags([context.tenant_id, group_id])
-        query = query.results()
+    def _get_security_group(self, context, group_id, cached=False):
+        """Reads a group's security profile from NVP.
+
+        The profile is cached for the limit checks and uuid lookups, which
+        pass cached=True. Anything that writes the rules back must read
+        them fresh, or it would undo changes made by another server.
+        """
+        # Callers modify the rule lists, so hand out copies of the cache
+        key = (context.tenant_id, group_id)
+        if cached:
+            profile = self.profile_cache.get(key)
+            if profile is not None:
+                return copy.deepcopy(profile)
+
+        def _query():
+            connection = self.get_connection()
+            query = connection.securityprofile().query()
+            query.tagscopes(['os_tid', 'neutron_group_id'])
+            query.tags([context.tenant_id, group_id])
+            return query.results()
+
+        query = self._read(_query)
         if query['result_count'] != 1:
             raise sg_ext.SecurityGroupNotFound(id=group_id)
-        return query['results'][0]
+        profile = query['results'][0]
+        self.profile_cache.set(key, copy.deepcopy(profile))
+        return profile
 
     def _get_security_group_id(self, context, group_id):
-        return self._get_security_group(context, group_id)['uuid']
+        group = self._get_security_group(context, group_id, cached=True)
+        return group['uuid']
 
     def _get_security_group_rule_object(self, context, rule):
         ethertype = rule.get('ethertype', None)
@@ -420,9 +593,15 @@ class NVPDriver(base.BaseDriver):
         ports = connection.lswitch_port("*").query().security_profile_uuid(
             '=', self._get_security_group_id(
                 context, group_id)).results().get('results', [])
-        groups = (port.get('security_profiles', []) for port in ports)
+        groups = [port.get('security_profiles', []) for port in ports]
+        # Ports of a group mostly share their other groups too, so read
+        # every profile once instead of once per port
+        uuids = list(set(gp for group in groups for gp in group))
+        profiles = dict(zip(uuids, self._map(
+            lambda gp: self.get_connection().securityprofile(gp).read(),
+            uuids)))
         return max([self._check_rule_count_for_groups(
-            context, (connection.securityprofile(gp).read() for gp in group))
+            context, (profiles[gp] for gp in group))
             for group in groups] or [0])
 
     def _check_rule_count_for_groups(self, context, groups):
@@ -431,11 +610,11 @@ class NVPDriver(base.BaseDriver):
                    for group in groups)
 
     def _get_security_groups_for_port(self, context, groups):
-        if (self._check_rule_count_for_groups(
-                context,
-                (self._get_security_group(context, g) for g in groups))
+        profiles = self._map(
+            lambda group: self._get_security_group(context, group,
+                                                   cached=True), groups)
+        if (self._check_rule_count_for_groups(context, profiles)
                 > self.limits['max_rules_per_port']):
             raise exceptions.DriverLimitReached(limit="rules per port")
 
-        return [self._get_security_group(context, group)['uuid']
-                for group in groups]
+        return [profile['uuid'] for profile in profiles]
@@ -17,20 +17,67 @@
 Optimized NVP client for Quark
 """
 
+import copy
+
+import eventlet
+from neutron import context as neutron_context
 from neutron.openstack.common import log as logging
+from oslo.config import cfg
 from quark.db import models
 from quark.drivers.nvp_driver import NVPDriver
+from quark import exceptions
+from quark import utils
 import sqlalchemy as sa
 from sqlalchemy import orm
+import transaction
 
 LOG = logging.getLogger("neutron.quark.nvplib")
 
+CONF = cfg.CONF
+
+optimized_nvp_opts = [
+    cfg.IntOpt('port_count_reconcile_interval',
+               default=0,
+               help=_('Seconds between recomputing lswitch port counts '
+                      'from their ports. 0 disables reconciliation')),
+    cfg.IntOpt('spare_lswitches',
+               default=0,
+               help=_('Empty lswitches kept ready for each network about to '
+                      'fill its lswitches. 0 disables the provisioner')),
+    cfg.BoolOpt('spare_lswitch_provisioner',
+                default=False,
+                help=_('Run the spare lswitch provisioner in this server. '
+                       'Runs don\'t coordinate, so enable it on one server '
+                       'only')),
+    cfg.IntOpt('spare_lswitch_interval',
+               default=30,
+               help=_('Seconds between spare lswitch provisioning runs')),
+]
+
+CONF.register_opts(optimized_nvp_opts, "NVP")
+
+# How many times a full switch is re-selected before creating a new one
+CLAIM_ATTEMPTS = 3
+
 
 class OptimizedNVPDriver(NVPDriver):
+    def load_config(self):
+        super(OptimizedNVPDriver, self).load_config()
+        if CONF.NVP.port_count_reconcile_interval:
+            eventlet.spawn(self._reconcile_forever)
+        if CONF.NVP.spare_lswitches and CONF.NVP.spare_lswitch_provisioner:
+            eventlet.spawn(self._provision_forever)
+
     def delete_network(self, context, network_id):
         lswitches = self._lswitches_for_network(context, network_id)
+        # The rows are already loaded, so only the backend deletes go
+        # through _lswitch_delete and they can run on the pool rather
+        # than the serial _map below. The session stays on this thread.
+        delete = super(OptimizedNVPDriver, self)._lswitch_delete
+        utils.pool_map(lambda switch: delete(context, switch.nvp_id),
+                       lswitches)
         for switch in lswitches:
-            self._lswitch_delete(context, switch.nvp_id)
+            context.session.delete(switch)
 
     def create_port(self, context, network_id, port_id,
                     status=True, security_groups=[], allowed_pairs=[]):
@@ -41,17 +88,14 @@ class OptimizedNVPDriver(NVPDriver):
                         allowed_pairs=allowed_pairs)
         switch_nvp_id = nvp_port["lswitch"]
 
-        # slightly inefficient for the sake of brevity. Lets the
-        # parent class do its thing then finds the switch that
-        # the port was created on for creating the association. Switch should
-        # be in the query cache so the subsequent lookup should be minimal,
-        # but this could be an easy optimization later if we're looking.
+        # The switch's port_count was already bumped when the switch was
+        # chosen, this only records which switch the port landed on.
         switch = self._lswitch_select_by_nvp_id(context, switch_nvp_id)
 
         new_port = LSwitchPort(port_id=nvp_port["uuid"],
                                switch_id=switch.id)
+        self._lport_set_profiles(context, new_port, security_groups)
         context.session.add(new_port)
-        switch.port_count = switch.port_count + 1
         return nvp_port
 
     def update_port(self, context, port_id,
@@ -62,22 +106,46 @@ class OptimizedNVPDriver(NVPDriver):
                         allowed_pairs=allowed_pairs)
         port = self._lport_select_by_id(context, port_id)
         port.update(nvp_port)
+        # The NVP driver leaves the profiles alone without security groups
+        if security_groups:
+            self._lport_set_profiles(context, port, security_groups)
 
     def delete_port(self, context, port_id, lswitch_uuid=None):
+        # The outbox retries deletes whose transaction was aborted after
+        # the backend calls went through, so what is already gone counts
+        # as deleted and the rows are still cleaned up
         port = self._lport_select_by_id(context, port_id)
+        if not port:
+            LOG.info("lport %s is already deleted" % port_id)
+            return
         switch = port.switch
-        super(OptimizedNVPDriver, self).\
-            delete_port(context, port_id, lswitch_uuid=switch.nvp_id)
+        try:
+            super(OptimizedNVPDriver, self).\
+                delete_port(context, port_id, lswitch_uuid=switch.nvp_id)
+        except Exception as e:
+            if not self._is_not_found(e):
+                raise
+            LOG.info("lport %s is already deleted from NVP" % port_id)
         context.session.delete(port)
-        switch.port_count = switch.port_count - 1
-        if switch.port_count == 0:
-            self._lswitch_delete(context, switch.nvp_id)
+        context.session.flush()
+        if self._lswitch_release(context, switch.id):
+            try:
+                super(OptimizedNVPDriver, self).\
+                    _lswitch_delete(context, switch.nvp_id)
+            except Exception as e:
+                if not self._is_not_found(e):
+                    raise
+                LOG.info("lswitch %s is already deleted from NVP" %
+                         switch.nvp_id)
 
     def create_security_group(self, context, group_name, **group):
         nvp_group = super(OptimizedNVPDriver, self).create_security_group(
             context, group_name, **group)
         group_id = group.get('group_id')
-        profile = SecurityProfile(id=group_id, nvp_id=nvp_group['uuid'])
+        rule_count = (len(group.get('port_ingress_rules', [])) +
+                      len(group.get('port_egress_rules', [])))
+        profile = SecurityProfile(id=group_id, nvp_id=nvp_group['uuid'],
+                                  rule_count=rule_count)
         context.session.add(profile)
 
     def delete_security_group(self, context, group_id):
@@ -86,6 +154,12 @@ class OptimizedNVPDriver(NVPDriver):
         group = self._query_security_group(context, group_id)
         context.session.delete(group)
 
+    def _map(self, func, items):
+        """Lookups here mostly share the request's DB session, which can't be
+        used from several green threads, so they are run in turn.
+        """
+        return map(func, items)
+
     def _lport_select_by_id(self, context, port_id):
         query = context.session.query(LSwitchPort)
         query = query.filter(LSwitchPort.port_id == port_id)
@@ -105,7 +179,7 @@ class OptimizedNVPDriver(NVPDriver):
 
     def _lswitch_select_first(self, context, network_id):
         query = context.session.query(LSwitch)
-        query.filter(LSwitch.network_id == network_id)
+        query = query.filter(LSwitch.network_id == network_id)
         return query.first()
 
     def _lswitch_select_free(self, context, network_id):
@@ -113,7 +187,8 @@ class OptimizedNVPDriver(NVPDriver):
         query = query.filter(LSwitch.port_count <
                              self.limits['max_ports_per_switch'])
         query = query.filter(LSwitch.network_id == network_id)
-        switch = query.order_by(LSwitch.port_count).first()
+        # Fill the fullest switch first so spare switches are used last
+        switch = query.order_by(LSwitch.port_count.desc()).first()
         return switch
 
     def _lswitch_status_query(self, context, network_id):
@@ -124,13 +199,62 @@ class OptimizedNVPDriver(NVPDriver):
         """
         pass
 
+    def _lswitch_claim(self, context, switch_id, limit=0):
+        """Atomically takes a port slot on a switch.
+
+        With a limit, fails if the switch already has that many ports.
+        """
+        query = context.session.query(LSwitch)
+        query = query.filter(LSwitch.id == switch_id)
+        if limit:
+            query = query.filter(LSwitch.port_count < limit)
+        count = query.update({"port_count": LSwitch.port_count + 1},
+                             synchronize_session=False)
+        return count == 1
+
+    def _lswitch_release(self, context, switch_id):
+        """Atomically gives back a port slot on a switch.
+
+        Returns True if that left the switch empty and it was removed, in
+        which case the caller deletes the backend switch.
+        """
+        query = context.session.query(LSwitch)
+        query = query.filter(LSwitch.id == switch_id)
+        query.filter(LSwitch.port_count > 0).update(
+            {"port_count": LSwitch.port_count - 1},
+            synchronize_session=False)
+        count = query.filter(LSwitch.port_count <= 0).delete(
+            synchronize_session=False)
+        return count == 1
+
+    def _create_or_choose_lswitch(self, context, network_id):
+        """Returns the nvp id of a switch with a port slot claimed."""
+        switch = self._lswitch_select_open(context, network_id=network_id)
+        if switch:
+            LOG.debug("Found open switch %s" % switch)
+            return switch
+
+        switch_details = self._get_network_details(context, network_id,
+                                                   None)
+        if not switch_details:
+            raise exceptions.BadNVPState(net_id=network_id)
+
+        return self._lswitch_create(context, network_id=network_id,
+                                    port_count=1, **switch_details)
+
     def _lswitch_select_open(self, context, network_id=None, **kwargs):
-        if self.limits['max_ports_per_switch'] == 0:
+        limit = self.limits['max_ports_per_switch']
+        if limit == 0:
             switch = self._lswitch_select_first(context, network_id)
+            if switch and self._lswitch_claim(context, switch.id):
+                return switch.nvp_id
         else:
-            switch = self._lswitch_select_free(context, network_id)
-        if switch:
-            return switch.nvp_id
+            for _ in xrange(CLAIM_ATTEMPTS):
+                switch = self._lswitch_select_free(context, network_id)
+                if not switch:
+                    break
+                if self._lswitch_claim(context, switch.id, limit):
+                    return switch.nvp_id
         LOG.debug("Could not find optimized switch")
 
     def _get_network_details(self, context, network_id, switches):
@@ -154,15 +278,97 @@ class OptimizedNVPDriver(NVPDriver):
 
     def _lswitch_create_optimized(self, context, network_name, nvp_id,
                                   network_id, phys_net=None, phys_type=None,
-                                  segment_id=None):
+                                  segment_id=None, port_count=0):
         new_switch = LSwitch(nvp_id=nvp_id, network_id=network_id,
-                             port_count=0, transport_zone=phys_net,
+                             port_count=port_count, transport_zone=phys_net,
                              transport_connector=phys_type,
                              display_name=network_name,
                              segment_id=segment_id)
         context.session.add(new_switch)
         return new_switch
 
+    def reconcile_port_counts(self, context):
+        """Recomputes every switch's port_count from its LSwitchPort rows.
+
+        Returns the number of switches whose count was wrong.
+        """
+        actual = sa.select([sa.func.count(LSwitchPort.id)]).\
+            where(LSwitchPort.switch_id == LSwitch.id).as_scalar()
+        query = context.session.query(LSwitch)
+        query = query.filter(LSwitch.port_count != actual)
+        count = query.update({"port_count": actual},
+                             synchronize_session=False)
+        if count:
+            LOG.warning("Corrected the port count of %d lswitches" % count)
+        return count
+
+    def provision_spare_lswitches(self, context):
+        """Creates empty lswitches for networks about to fill theirs.
+
+        A network needs spares once its non-empty switches have less than
+        one switch's worth of free ports left. Port creates then find an
+        open switch instead of creating one themselves. Returns the number
+        of switches created.
+        """
+        limit = self.limits['max_ports_per_switch']
+        spares_wanted = CONF.NVP.spare_lswitches
+        if not (limit and spares_wanted):
+            return 0
+
+        is_spare = sa.case([(LSwitch.port_count == 0, 1)], else_=0)
+        query = context.session.query(LSwitch.network_id,
+                                      sa.func.count(LSwitch.id),
+                                      sa.func.sum(is_spare),
+                                      sa.func.sum(LSwitch.port_count))
+        created = 0
+        for network_id, switches, spares, ports in \
+                query.group_by(LSwitch.network_id).all():
+            # MySQL sums come back as Decimals
+            spares, ports = int(spares), int(ports)
+            in_use = switches - spares
+            headroom = in_use * limit - ports
+            if not in_use or headroom >= limit or spares >= spares_wanted:
+                continue
+
+            network = context.session.query(models.Network).\
+                filter(models.Network.id == network_id).first()
+            if not network:
+                continue
+            details = self._get_network_details(context, network_id, None)
+            # The backend switch is tagged with the network's tenant. The
+            # copy keeps using this context's session.
+            tenant_context = copy.copy(context)
+            tenant_context.tenant_id = network["tenant_id"]
+            for _ in xrange(spares_wanted - spares):
+                LOG.debug("Provisioning spare lswitch for network %s" %
+                          network_id)
+                self._lswitch_create(tenant_context, network_id=network_id,
+                                     **details)
+                created += 1
+        return created
+
+    def _provision_forever(self):
+        while True:
+            eventlet.sleep(CONF.NVP.spare_lswitch_interval)
+            try:
+                self.provision_spare_lswitches(
+                    neutron_context.get_admin_context())
+                transaction.commit()
+            except Exception:
+                LOG.exception("Failed to provision spare lswitches")
+                transaction.abort()
+
+    def _reconcile_forever(self):
+        while True:
+            eventlet.sleep(CONF.NVP.port_count_reconcile_interval)
+            try:
+                self.reconcile_port_counts(
+                    neutron_context.get_admin_context())
+                transaction.commit()
+            except Exception:
+                LOG.exception("Failed to reconcile lswitch port counts")
+                transaction.abort()
+
     def _lswitches_for_network(self, context, network_id):
         switches = context.session.query(LSwitch).\
             filter(LSwitch.network_id == network_id).\
@@ -189,7 +395,7 @@ class OptimizedNVPDriver(NVPDriver):
                 res.pop(key)
         return res
 
-    def _get_security_group(self, context, group_id):
+    def _get_security_group(self, context, group_id, cached=False):
         group = context.session.query(models.SecurityGroup).\
             filter(models.SecurityGroup.id == group_id).first()
         rulelist = {'ingress': [], 'egress': []}
@@ -200,14 +406,65 @@ class OptimizedNVPDriver(NVPDriver):
                 'logical_port_ingress_rules': rulelist['ingress'],
                 'logical_port_egress_rules': rulelist['egress']}
 
+    def _security_profiles(self, context, group_ids):
+        if not group_ids:
+            return []
+        query = context.session.query(SecurityProfile)
+        return query.filter(SecurityProfile.id.in_(group_ids)).all()
+
+    def _get_security_groups_for_port(self, context, groups):
+        profiles = dict((profile.id, profile) for profile in
+                        self._security_profiles(context, groups))
+        if (sum(profiles[group].rule_count for group in groups) >
+                self.limits['max_rules_per_port']):
+            raise exceptions.DriverLimitReached(limit="rules per port")
+        return [profiles[group].nvp_id for group in groups]
+
+    def _lport_set_profiles(self, context, lport, group_ids):
+        """Records a port's security profiles and its total rule count."""
+        profiles = self._security_profiles(context, group_ids)
+        lport.profiles = profiles
+        lport.rule_count = sum(profile.rule_count for profile in profiles)
+
+    def _security_group_rules_changed(self, context, group_id, rule_count):
+        """Stores the group's new rule count and recomputes the rule totals
+        of the ports using it.
+        """
+        query = context.session.query(SecurityProfile)
+        query.filter(SecurityProfile.id == group_id).update(
+            {"rule_count": rule_count}, synchronize_session=False)
+
+        assoc = lport_profile_association_table
+        total = sa.select([sa.func.sum(SecurityProfile.rule_count)]).\
+            where(assoc.c.port_id == LSwitchPort.id).\
+            where(assoc.c.profile_id == SecurityProfile.id).as_scalar()
+        ports = sa.select([assoc.c.port_id]).\
+            where(assoc.c.profile_id == group_id)
+        query = context.session.query(LSwitchPort)
+        query.filter(LSwitchPort.id.in_(ports)).update(
+            {"rule_count": total}, synchronize_session=False)
+
     def _check_rule_count_per_port(self, context, group_id):
-        ports = context.session.query(models.SecurityGroup).filter(
-            models.SecurityGroup.id == group_id).first().get('ports', [])
-        groups = (set(group.id for group in port.get('security_groups', []))
-                  for port in ports)
-        return max(self._check_rule_count_for_groups(
-            context, (self._get_security_group(context, id) for id in g))
-            for g in groups)
+        """Returns the largest rule total of the ports using the group."""
+        assoc = lport_profile_association_table
+        query = context.session.query(sa.func.max(LSwitchPort.rule_count))
+        query = query.filter(LSwitchPort.id == assoc.c.port_id)
+        query = query.filter(assoc.c.profile_id == group_id)
+        return query.scalar() or 0
+
+
+lport_profile_association_table = sa.Table(
+    "quark_nvp_driver_lport_profile_associations",
+    models.BASEV2.metadata,
+    sa.Column("port_id", sa.String(36),
+              sa.ForeignKey("quark_nvp_driver_lswitchport.id")),
+    sa.Column("profile_id", sa.String(36),
+              sa.ForeignKey("quark_nvp_driver_security_profile.id")))
+
+# Backs the max_rules_per_port check, which looks up the ports of a group
+# on every rule create
+sa.Index("idx_quark_nvp_driver_lport_profile_profile_id",
+         lport_profile_association_table.c.profile_id)
 
 
 class LSwitchPort(models.BASEV2, models.HasId):
@@ -216,6 +473,10 @@ class LSwitchPort(models.BASEV2, models.HasId):
     switch_id = sa.Column(sa.String(36),
                           sa.ForeignKey("quark_nvp_driver_lswitch.id"),
                           nullable=False)
+    # Sum of the rule counts of the port's security profiles
+    rule_count = sa.Column(sa.Integer(), nullable=False, default=0)
+    profiles = orm.relationship("SecurityProfile",
+                                secondary=lport_profile_association_table)
 
 
 class LSwitch(models.BASEV2, models.HasId):
@@ -240,3 +501,4 @@ class QOS(models.BASEV2, models.HasId):
 class SecurityProfile(models.BASEV2, models.HasId):
     __tablename__ = "quark_nvp_driver_security_profile"
     nvp_id = sa.Column(sa.String(36), nullable=False)
+    rule_count = sa.Column(sa.Integer(), nullable=False, default=0)
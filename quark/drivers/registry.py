@@ -0,0 +1,71 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Net and IPAM drivers shared by the plugin modules
+
+Each driver is built from its config option the first time it is used,
+so importing the plugin does no backend setup and every plugin module
+goes through the same connections and caches.
+"""
+
+import threading
+
+from neutron.openstack.common import importutils
+from oslo.config import cfg
+
+from quark.drivers import instrumentation
+
+CONF = cfg.CONF
+
+
+class LazyDriver(object):
+    """Stands in for the driver built by factory, building it on first
+    attribute access.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._driver = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._driver is None:
+            with self._lock:
+                if self._driver is None:
+                    self._driver = self._factory()
+        return self._driver
+
+    def reset(self):
+        """Drops the driver so the next use builds it again."""
+        with self._lock:
+            self._driver = None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def _build_net_driver():
+    driver = importutils.import_class(CONF.QUARK.net_driver)()
+    driver.load_config()
+    return instrumentation.wrap_driver(driver)
+
+
+def _build_ipam_driver():
+    return importutils.import_class(CONF.QUARK.ipam_driver)()
+
+
+net_driver = LazyDriver(_build_net_driver)
+ipam_driver = LazyDriver(_build_ipam_driver)
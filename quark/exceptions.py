@@ -17,6 +17,10 @@ class RouteNotFound(exceptions.NotFound):
     message = _("Route %(route_id)s not found.")
 
 
+class LSwitchPortNotFound(exceptions.NotFound):
+    message = _("No lswitch found for port %(port_id)s.")
+
+
 class AmbiguousNetworkId(exceptions.NeutronException):
     message = _("Segment ID required for network %(net_id)s.")
 
@@ -67,3 +71,7 @@ class IPPolicyAlreadyExists(exceptions.NeutronException):
 
 class DriverLimitReached(exceptions.InvalidInput):
     message = _("Driver has reached limit on resource '%(limit)s'")
+
+
+class UnsupportedFilter(exceptions.InvalidInput):
+    message = _("%(model)s can not be filtered by %(key)s")
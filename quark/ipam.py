@@ -24,6 +24,7 @@ from neutron.openstack.common import log as logging
 from neutron.openstack.common import timeutils
 
 from quark.db import api as db_api
+from quark import utils
 
 
 LOG = logging.getLogger("neutron")
@@ -105,7 +106,7 @@ class QuarkIpam(object):
 
     def allocate_ip_address(self, context, net_id, port_id, reuse_after,
                             version=None, ip_address=None):
-        elevated = context.elevated()
+        elevated = utils.elevated(context)
         if ip_address:
             ip_address = netaddr.IPAddress(ip_address)
 
@@ -157,6 +158,24 @@ class QuarkIpam(object):
                 addr["deallocated"] = 1
         port["ip_addresses"] = []
 
+    def deallocate_ports_ip_addresses(self, context, ports, **kwargs):
+        """Deallocates the addresses of several ports with one update.
+
+        As with deallocate_ip_address, an address shared with a port that
+        is not in ports stays allocated.
+        """
+        port_ids = set(port["id"] for port in ports)
+        address_ids = set()
+        for port in ports:
+            for addr in port["ip_addresses"]:
+                if all(p["id"] in port_ids for p in addr["ports"]):
+                    address_ids.add(addr["id"])
+            port["ip_addresses"] = []
+        db_api.ip_address_bulk_deallocate(context, list(address_ids))
+
+    def deallocate_mac_addresses(self, context, addresses):
+        db_api.mac_address_bulk_deallocate(context, addresses)
+
     def deallocate_mac_address(self, context, address):
         mac = db_api.mac_address_find(context, address=address,
                                       scope=db_api.ONE)
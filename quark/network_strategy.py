@@ -14,7 +14,9 @@
 #    under the License.
 
 import json
+import os
 
+import eventlet
 from neutron.common import exceptions
 from neutron.openstack.common import log as logging
 from oslo.config import cfg
@@ -24,55 +26,117 @@ CONF = cfg.CONF
 
 quark_opts = [
     cfg.StrOpt('default_net_strategy', default='{}',
-               help=_("Default network assignment strategy"))
+               help=_("Default network assignment strategy")),
+    cfg.StrOpt('net_strategy_file',
+               help=_("JSON file holding the network assignment strategy. "
+                      "Takes precedence over default_net_strategy and is "
+                      "reloaded when it changes")),
+    cfg.IntOpt('net_strategy_poll_interval', default=10,
+               help=_("Seconds between checks of net_strategy_file for "
+                      "changes. 0 disables reloading"))
 ]
 CONF.register_opts(quark_opts, "QUARK")
 
 
+class _CompiledStrategy(object):
+    """Lookup tables built from a parsed strategy. They are never changed
+    once built, so a new strategy is swapped in with a single assignment.
+    """
+
+    def __init__(self, strategy):
+        self.strategy = strategy
+        self.parents = tuple(strategy.keys())
+        self.reverse = {}
+        self.children = {}
+        for network, definition in strategy.iteritems():
+            for key, child_net in definition["children"].iteritems():
+                self.reverse[child_net] = network
+                self.children[(network, key)] = child_net
+
+
 class JSONStrategy(object):
     def __init__(self, strategy=None):
-        self.reverse_strategy = {}
-        self.strategy = {}
-        if not strategy:
-            self._compile_strategy(CONF.QUARK.default_net_strategy)
-        else:
+        self._path = None
+        self._stat = None
+        self._watcher = None
+        # Bumped whenever a strategy is compiled, for caches built from it
+        self.generation = 0
+        if strategy:
             self._compile_strategy(strategy)
+        elif CONF.QUARK.net_strategy_file:
+            self._path = CONF.QUARK.net_strategy_file
+            self.reload()
+        else:
+            self._compile_strategy(CONF.QUARK.default_net_strategy)
+
+    @property
+    def strategy(self):
+        return self._tables.strategy
+
+    @property
+    def reverse_strategy(self):
+        return self._tables.reverse
 
     def _compile_strategy(self, strategy):
-        strategy = json.loads(strategy)
-        for network, definition in strategy.iteritems():
-            for _, child_net in definition["children"].iteritems():
-                self.reverse_strategy[child_net] = network
-        self.strategy = strategy
+        self._tables = _CompiledStrategy(json.loads(strategy))
+        self.generation += 1
+
+    def reload(self):
+        """Recompiles the strategy file if it changed since it was last
+        read. Returns whether it was recompiled.
+        """
+        st = os.stat(self._path)
+        stat = (st.st_mtime, st.st_size)
+        if stat == self._stat:
+            return False
+        with open(self._path) as strategy_file:
+            self._compile_strategy(strategy_file.read())
+        self._stat = stat
+        LOG.info("Loaded network strategy from %s" % self._path)
+        return True
+
+    def watch(self):
+        """Starts reloading the strategy file in the background whenever
+        it changes.
+        """
+        if (self._path and CONF.QUARK.net_strategy_poll_interval
+                and self._watcher is None):
+            self._watcher = eventlet.spawn(self._watch_forever)
+
+    def _watch_forever(self):
+        while True:
+            eventlet.sleep(CONF.QUARK.net_strategy_poll_interval)
+            try:
+                self.reload()
+            except Exception:
+                LOG.exception("Failed to reload network strategy from %s" %
+                              self._path)
 
     def split_network_ids(self, context, net_ids):
+        strategy = self._tables.strategy
         assignable = []
         tenant = []
         for net_id in net_ids:
-            if self.is_parent_network(net_id):
+            if net_id in strategy:
                 assignable.append(net_id)
             else:
                 tenant.append(net_id)
         return tenant, assignable
 
     def get_assignable_networks(self, context):
-        return self.strategy.keys()
+        return self._tables.parents
 
     def is_parent_network(self, net_id):
-        return self.strategy.get(net_id) is not None
+        return net_id in self._tables.strategy
 
     def get_parent_network(self, net_id):
-        net = self.reverse_strategy.get(net_id)
-        if net:
-            return net
-
-        # No matches, this is the highest network
-        return net_id
+        # No matches means this is the highest network
+        return self._tables.reverse.get(net_id, net_id)
 
     def best_match_network_id(self, context, net_id, key):
-        net = self.strategy.get(net_id)
-        if net:
-            child_net = net["children"].get(key)
+        tables = self._tables
+        if net_id in tables.strategy:
+            child_net = tables.children.get((net_id, key))
             if not child_net:
                 raise exceptions.NetworkNotFound(net_id=net_id)
             return child_net
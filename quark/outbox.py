@@ -0,0 +1,190 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+#  under the License.
+
+"""
+Outbox for net driver calls
+
+Calls recorded with `call` are stored in the same transaction as the DB
+change that needs them, and a Dispatcher makes them once that transaction
+has committed. A slow backend then no longer holds the request's
+transaction and row locks open.
+"""
+
+import json
+
+import eventlet
+from neutron.common import exceptions
+from neutron import context as neutron_context
+from neutron.openstack.common import log as logging
+from oslo.config import cfg
+import transaction
+
+from quark.db import api as db_api
+from quark.drivers import instrumentation
+from quark import utils
+
+CONF = cfg.CONF
+LOG = logging.getLogger("neutron.quark.outbox")
+
+outbox_opts = [
+    cfg.BoolOpt('backend_outbox', default=False,
+                help=_('Make net driver deletes from the outbox after the '
+                       'request commits instead of during the request')),
+    cfg.IntOpt('outbox_poll_interval', default=2,
+               help=_('Seconds between outbox dispatch runs')),
+    cfg.IntOpt('outbox_batch_size', default=100,
+               help=_('Maximum outbox operations read per dispatch run')),
+    cfg.IntOpt('outbox_lease', default=300,
+               help=_('Seconds a dispatcher reserves an operation for')),
+    cfg.IntOpt('outbox_max_backoff', default=300,
+               help=_('Maximum seconds between retries of an operation')),
+    cfg.IntOpt('outbox_max_attempts', default=20,
+               help=_('Attempts after which a failing operation is parked '
+                      'and no longer retried. 0 retries forever')),
+]
+
+CONF.register_opts(outbox_opts, "QUARK")
+
+
+def call(context, driver, operation, resource_id, *args, **kwargs):
+    """Calls driver.operation(context, *args, **kwargs) or records it in the
+    outbox.
+
+    Only one call per operation and resource is recorded at a time, so
+    recording one twice is harmless. Arguments must be JSON serializable.
+    """
+    if not CONF.QUARK.backend_outbox:
+        return getattr(driver, operation)(context, *args, **kwargs)
+
+    key = "%s:%s" % (operation, resource_id)
+    LOG.debug("Recording %s of %s in the outbox" % (operation, resource_id))
+    db_api.backend_operation_record(context, idempotency_key=key,
+                                    resource_id=resource_id,
+                                    operation=operation,
+                                    arguments=json.dumps(dict(args=args,
+                                                              kwargs=kwargs)))
+
+
+def call_each(context, driver, operation, resource_ids):
+    """Like call(context, driver, operation, id, id) for each resource id.
+
+    Direct calls are made concurrently. Recorded ones are written in turn
+    as they share the request's session.
+    """
+    if not CONF.QUARK.backend_outbox:
+        return utils.pool_map(
+            lambda r: getattr(driver, operation)(context, r), resource_ids)
+    return [call(context, driver, operation, resource_id, resource_id)
+            for resource_id in resource_ids]
+
+
+class Dispatcher(object):
+    """Drains the outbox into a net driver.
+
+    Operations on different resources are made concurrently on a pool
+    bounded by QUARK.backend_pool_size. Operations on the same resource
+    are made in the order they were recorded, and a failed one holds back
+    the ones after it. Failures are retried with exponential backoff until
+    QUARK.outbox_max_attempts, when the operation is parked for an operator
+    to look at and the ones after it go ahead.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pool = eventlet.GreenPool(CONF.QUARK.backend_pool_size)
+
+    def start(self):
+        eventlet.spawn_n(self._run)
+
+    def _run(self):
+        while True:
+            try:
+                self.dispatch()
+            except Exception:
+                LOG.exception("Outbox dispatch failed")
+            eventlet.sleep(CONF.QUARK.outbox_poll_interval)
+
+    def dispatch(self):
+        """Makes the due outbox calls. Returns how many succeeded."""
+        context = neutron_context.get_admin_context()
+        op_ids = [op["id"] for op in db_api.backend_operation_find_due(
+            context, limit=CONF.QUARK.outbox_batch_size)]
+        transaction.abort()
+
+        return sum(self.pool.imap(self._dispatch_one, op_ids))
+
+    def _is_done(self, operation, error):
+        """Whether a failed call left the backend as the operation wanted,
+        which is the case for deletes of what is already gone.
+        """
+        if not operation.startswith("delete_"):
+            return False
+        return (isinstance(error, exceptions.NotFound) or
+                getattr(error, "code", None) == 404)
+
+    def _dispatch_one(self, op_id):
+        context = neutron_context.get_admin_context()
+        ops = db_api.backend_operation_find(context, id=op_id)
+        if not ops or not db_api.backend_operation_claim(
+                context, ops[0], CONF.QUARK.outbox_lease):
+            transaction.abort()
+            return False
+        transaction.commit()
+
+        context = neutron_context.get_admin_context()
+        op = db_api.backend_operation_find(context, id=op_id)[0]
+        operation, resource_id = op["operation"], op["resource_id"]
+        # Drivers scope their lookups by tenant, so act as the tenant that
+        # recorded the operation
+        op_context = neutron_context.Context(None, op["tenant_id"],
+                                             is_admin=True)
+        try:
+            arguments = json.loads(op["arguments"])
+            with instrumentation.operation("outbox"):
+                getattr(self.driver, operation)(op_context,
+                                                *arguments["args"],
+                                                **arguments["kwargs"])
+        except Exception as e:
+            transaction.abort()
+            if not self._is_done(operation, e):
+                LOG.exception("Outbox %s of %s failed" %
+                              (operation, resource_id))
+                self._retry_later(op_id, str(e))
+                return False
+            LOG.info("Outbox %s of %s found it already done" %
+                     (operation, resource_id))
+            context = neutron_context.get_admin_context()
+            op = db_api.backend_operation_find(context, id=op_id)[0]
+
+        db_api.backend_operation_delete(context, op)
+        transaction.commit()
+        return True
+
+    def _retry_later(self, op_id, error):
+        """Schedules the next attempt of a failed operation, or parks it if
+        it has run out of attempts.
+        """
+        context = neutron_context.get_admin_context()
+        op = db_api.backend_operation_find(context, id=op_id)[0]
+        attempts = op["attempts"] + 1
+        max_attempts = CONF.QUARK.outbox_max_attempts
+        if max_attempts and attempts >= max_attempts:
+            LOG.error("Parking outbox %s of %s after %d attempts" %
+                      (op["operation"], op["resource_id"], attempts))
+            db_api.backend_operation_park(context, op, error)
+        else:
+            delay = min(2 ** op["attempts"], CONF.QUARK.outbox_max_backoff)
+            db_api.backend_operation_retry_later(context, op, delay, error)
+        transaction.commit()
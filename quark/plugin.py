@@ -25,13 +25,21 @@ from neutron.db import api as neutron_db_api
 from neutron.extensions import securitygroup as sg_ext
 from neutron import neutron_plugin_base_v2
 from neutron.openstack.common.db.sqlalchemy import session as neutron_session
+from neutron.openstack.common import excutils
+from neutron.openstack.common import log as logging
 from neutron import quota
 
 from quark.api import extensions
 from quark.db import models
+from quark.drivers import instrumentation
+from quark import network_strategy
+from quark import outbox
+from quark.plugin_modules import changes
+from quark.plugin_modules import etags
 from quark.plugin_modules import ip_addresses
 from quark.plugin_modules import ip_policies
 from quark.plugin_modules import mac_address_ranges
+from quark.plugin_modules import network_info
 from quark.plugin_modules import networks
 from quark.plugin_modules import ports
 from quark.plugin_modules import routes
@@ -39,6 +47,7 @@ from quark.plugin_modules import security_groups
 from quark.plugin_modules import subnets
 
 CONF = cfg.CONF
+LOG = logging.getLogger("neutron.quark")
 
 quark_resources = [
     quota.BaseResource('ports_per_network',
@@ -71,13 +80,19 @@ CONF.register_opts(quark_quota_opts, "QUOTAS")
 quota.QUOTAS.register_resources(quark_resources)
 
 
+@instrumentation.tag_operations
 class Plugin(neutron_plugin_base_v2.NeutronPluginBaseV2,
              sg_ext.SecurityGroupPluginBase):
     supported_extension_aliases = ["mac_address_ranges", "routes",
                                    "ip_addresses", "ports_quark",
                                    "security-group",
                                    "subnets_quark", "provider",
-                                   "ip_policies", "quotas"]
+                                   "ip_policies", "quotas", "devices",
+                                   "network_info", "changes"]
+
+    # Bulk creates of every resource come to the *_bulk methods rather
+    # than being split into single creates by the API
+    __native_bulk_support = True
 
     def _initDBMaker(self):
         # This needs to be called after _ENGINE is configured
@@ -90,6 +105,32 @@ class Plugin(neutron_plugin_base_v2.NeutronPluginBaseV2,
         neutron_db_api.configure_db()
         self._initDBMaker()
         neutron_db_api.register_models(base=models.BASEV2)
+        network_strategy.STRATEGY.watch()
+        changes.start_pruning()
+        if CONF.QUARK.backend_outbox:
+            outbox.Dispatcher(ports.net_driver).start()
+
+    def _create_bulk(self, resource, context, request_items):
+        """Creates the items of a bulk request one by one. If one fails,
+        the items already created are deleted again, as the API does when
+        it splits a bulk request itself, so nothing is left behind on the
+        backend.
+        """
+        create = getattr(self, "create_%s" % resource)
+        delete = getattr(self, "delete_%s" % resource)
+        created = []
+        try:
+            for item in request_items["%ss" % resource]:
+                created.append(create(context, item))
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for obj in created:
+                    try:
+                        delete(context, obj["id"])
+                    except Exception:
+                        LOG.exception("Unable to undo bulk create of "
+                                      "%s %s" % (resource, obj["id"]))
+        return created
 
     def get_mac_address_range(self, context, id, fields=None):
         return mac_address_ranges.get_mac_address_range(context, id, fields)
@@ -106,10 +147,17 @@ class Plugin(neutron_plugin_base_v2.NeutronPluginBaseV2,
     def create_security_group(self, context, security_group):
         return security_groups.create_security_group(context, security_group)
 
+    def create_security_group_bulk(self, context, security_group):
+        return self._create_bulk("security_group", context, security_group)
+
     def create_security_group_rule(self, context, security_group_rule):
         return security_groups.create_security_group_rule(context,
                                                           security_group_rule)
 
+    def create_security_group_rule_bulk(self, context, security_group_rule):
+        return security_groups.create_security_group_rule_bulk(
+            context, security_group_rule)
+
     def delete_security_group(self, context, id):
         security_groups.delete_security_group(context, id)
 
@@ -167,6 +215,9 @@ class Plugin(neutron_plugin_base_v2.NeutronPluginBaseV2,
     def create_port(self, context, port):
         return ports.create_port(context, port)
 
+    def create_port_bulk(self, context, port):
+        return self._create_bulk("port", context, port)
+
     def post_update_port(self, context, id, port):
         return ports.post_update_port(context, id, port)
 
@@ -185,9 +236,24 @@ class Plugin(neutron_plugin_base_v2.NeutronPluginBaseV2,
     def delete_port(self, context, id):
         return ports.delete_port(context, id)
 
+    def get_ports_by_device(self, context, device_id, fields=None):
+        return ports.get_ports_by_device(context, device_id, fields)
+
+    def delete_ports_by_device(self, context, device_id):
+        return ports.delete_ports_by_device(context, device_id)
+
     def disassociate_port(self, context, id, ip_address_id):
         return ports.disassociate_port(context, id, ip_address_id)
 
+    def get_changes(self, context, since=0, limit=None):
+        return changes.get_changes(context, since, limit)
+
+    def get_etag(self, context, collection, filters=None):
+        return etags.get_etag(context, collection, filters)
+
+    def get_network_info(self, context, device_ids):
+        return network_info.get_network_info(context, device_ids)
+
     def get_route(self, context, id):
         return routes.get_route(context, id)
 
@@ -203,6 +269,9 @@ class Plugin(neutron_plugin_base_v2.NeutronPluginBaseV2,
     def create_subnet(self, context, subnet):
         return subnets.create_subnet(context, subnet)
 
+    def create_subnet_bulk(self, context, subnet):
+        return self._create_bulk("subnet", context, subnet)
+
     def update_subnet(self, context, id, subnet):
         return subnets.update_subnet(context, id, subnet)
 
@@ -221,6 +290,9 @@ class Plugin(neutron_plugin_base_v2.NeutronPluginBaseV2,
     def create_network(self, context, network):
         return networks.create_network(context, network)
 
+    def create_network_bulk(self, context, network):
+        return self._create_bulk("network", context, network)
+
     def update_network(self, context, id, network):
         return networks.update_network(context, id, network)
 
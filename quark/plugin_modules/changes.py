@@ -0,0 +1,153 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+import itertools
+
+import eventlet
+from neutron import context as neutron_context
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import timeutils
+from oslo.config import cfg
+import transaction
+
+from quark.db import api as db_api
+from quark import plugin_views as v
+
+CONF = cfg.CONF
+LOG = logging.getLogger("neutron.quark")
+
+quark_opts = [
+    cfg.IntOpt('max_changes_per_request', default=1000,
+               help=_("Maximum number of change log entries returned by "
+                      "a single changes request")),
+    cfg.IntOpt('change_log_settle_time', default=30,
+               help=_("Seconds a change log entry is held back before it "
+                      "is returned. Entry ids are allocated before their "
+                      "transaction commits, so a younger entry may still "
+                      "have an uncommitted one before it")),
+    cfg.IntOpt('change_log_retention', default=7 * 24 * 60 * 60,
+               help=_("Seconds change log entries are kept for. Clients "
+                      "polling less often than this must resync. 0 keeps "
+                      "them forever")),
+    cfg.IntOpt('change_log_prune_interval', default=60 * 60,
+               help=_("Seconds between change log pruning runs"))
+]
+CONF.register_opts(quark_opts, "QUARK")
+
+_pruner = None
+
+
+PAYLOADS = {
+    "port": ("port_find", v._make_port_dict),
+    "ip_address": ("ip_address_find", v._make_ip_dict),
+    "subnet": ("subnet_find", v._make_subnet_dict),
+    "route": ("route_find", v._make_route_dict),
+    "security_group": ("security_group_find", v._make_security_group_dict),
+    "security_group_rule": ("security_group_rule_find",
+                            v._make_security_group_rule_dict)}
+
+
+def _load_payloads(context, changes):
+    """Fetches the current state of every changed, non deleted resource.
+
+    Costs one query per resource type rather than one per change.
+    """
+    wanted = {}
+    for change in changes:
+        if change["action"] != "delete":
+            wanted.setdefault(change["resource"], set()).add(
+                change["resource_id"])
+
+    payloads = {}
+    for resource, ids in wanted.iteritems():
+        finder, make_dict = PAYLOADS[resource]
+        finder = getattr(db_api, finder)
+        for obj in finder(context, id=list(ids), scope=db_api.ALL):
+            payloads[(resource, obj["id"])] = make_dict(obj)
+    return payloads
+
+
+def get_changes(context, since=0, limit=None):
+    """Retrieve the resources changed after a cursor.
+
+    Only the latest change to each resource is returned, along with its
+    current representation, or None if it has been deleted since.
+    : param context: neutron api request context
+    : param since: cursor returned by a previous call, 0 for everything.
+    : param limit: maximum number of change log entries to consider.
+    """
+    LOG.info("get_changes for tenant %s since %s" %
+             (context.tenant_id, since))
+    max_limit = CONF.QUARK.max_changes_per_request
+    limit = min(limit or max_limit, max_limit)
+    log = db_api.change_find(context, since=since, limit=limit,
+                             scope=db_api.ALL)
+
+    # NOTE: ids are handed out when rows are inserted, not when their
+    #       transactions commit, so an entry can become visible after one
+    #       with a higher id. Stop at the first entry that hasn't settled
+    #       so the cursor never moves past one that may yet appear.
+    settled = timeutils.utcnow() - datetime.timedelta(
+        seconds=CONF.QUARK.change_log_settle_time)
+    log = list(itertools.takewhile(
+        lambda entry: entry["created_at"] <= settled, log))
+
+    latest = {}
+    for entry in log:
+        latest[(entry["resource"], entry["resource_id"])] = entry
+    changes = sorted(latest.values(), key=lambda entry: entry["id"])
+
+    payloads = _load_payloads(context, changes)
+    cursor = log[-1]["id"] if log else since
+    return {"cursor": cursor,
+            "changes": [{"id": change["id"],
+                         "resource": change["resource"],
+                         "resource_id": change["resource_id"],
+                         "action": change["action"],
+                         "payload": payloads.get((change["resource"],
+                                                  change["resource_id"]))}
+                        for change in changes]}
+
+
+def prune_changes(context):
+    """Deletes the change log entries older than the retention period.
+
+    Returns how many were deleted.
+    """
+    retention = CONF.QUARK.change_log_retention
+    if not retention:
+        return 0
+    before = timeutils.utcnow() - datetime.timedelta(seconds=retention)
+    return db_api.change_prune(context, before)
+
+
+def _prune_forever():
+    while True:
+        eventlet.sleep(CONF.QUARK.change_log_prune_interval)
+        try:
+            pruned = prune_changes(neutron_context.get_admin_context())
+            transaction.commit()
+            LOG.debug("Pruned %s change log entries" % pruned)
+        except Exception:
+            LOG.exception("Failed to prune the change log")
+            transaction.abort()
+
+
+def start_pruning():
+    """Starts pruning the change log in the background, once per process."""
+    global _pruner
+    if CONF.QUARK.change_log_retention and _pruner is None:
+        _pruner = eventlet.spawn(_prune_forever)
@@ -0,0 +1,52 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+from neutron.openstack.common import log as logging
+
+from quark.db import api as db_api
+from quark.db import models
+from quark import network_strategy
+
+LOG = logging.getLogger("neutron.quark")
+STRATEGY = network_strategy.STRATEGY
+
+REVISIONED = {
+    "ports": models.Port,
+    "subnets": models.Subnet,
+    "networks": models.Network,
+    "routes": models.Route,
+    "ip_addresses": models.IPAddress,
+}
+
+
+def get_etag(context, collection, filters=None):
+    """Returns an ETag for a collection, or None if it can't be computed.
+
+    Shared networks aren't owned by the tenant and are merged in by the
+    network strategy, so requests for them are never cached.
+    """
+    model = REVISIONED.get(collection)
+    filters = dict(filters or {})
+    if model is None or "shared" in filters:
+        return None
+    if not all(hasattr(model, key) for key in filters):
+        return None
+    if model is models.Network:
+        if any(STRATEGY.is_parent_network(net_id)
+               for net_id in filters.get("id", [])):
+            return None
+    LOG.debug("get_etag %s for tenant %s" % (collection, context.tenant_id))
+    return db_api.revision_etag(context, model, **filters)
@@ -14,18 +14,18 @@
 #    under the License.
 
 from neutron.common import exceptions
-from neutron.openstack.common import importutils
 from neutron.openstack.common import log as logging
 from oslo.config import cfg
 
 from quark.db import api as db_api
+from quark.drivers import registry
 from quark import exceptions as quark_exceptions
 from quark import plugin_views as v
 
 
 CONF = cfg.CONF
 LOG = logging.getLogger("neutron.quark")
-ipam_driver = (importutils.import_class(CONF.QUARK.ipam_driver))()
+ipam_driver = registry.ipam_driver
 
 
 def get_ip_addresses(context, **filters):
@@ -0,0 +1,37 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.openstack.common import log as logging
+
+from quark.db import api as db_api
+from quark import plugin_views as v
+
+LOG = logging.getLogger("neutron.quark")
+
+
+def get_network_info(context, device_ids):
+    """Retrieve all networking information for a set of devices.
+
+    Replaces the network, subnet and port lookups a client would otherwise
+    make one by one for each instance.
+    : param context: neutron api request context
+    : param device_ids: ids of the devices (e.g., VMs) to describe.
+    """
+    LOG.info("get_network_info for tenant %s devices %s" %
+             (context.tenant_id, device_ids))
+    ports, subnets, networks = db_api.network_info_find(context, device_ids)
+    return {"ports": v._make_ports_list(ports),
+            "subnets": v._make_subnets_list(subnets),
+            "networks": [v._make_network_dict(net) for net in networks]}
@@ -17,15 +17,15 @@ import netaddr
 
 from neutron.common import exceptions
 from neutron.extensions import providernet as pnet
-from neutron.openstack.common import importutils
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import uuidutils
 from oslo.config import cfg
 
 from quark.db import api as db_api
+from quark.drivers import registry
 from quark import network_strategy
+from quark import outbox
 from quark.plugin_modules import security_groups
-from quark.plugin_modules import subnets
 from quark import plugin_views as v
 from quark import utils
 
@@ -34,9 +34,55 @@ DEFAULT_ROUTE = netaddr.IPNetwork("0.0.0.0/0")
 LOG = logging.getLogger("neutron.quark")
 STRATEGY = network_strategy.STRATEGY
 
-ipam_driver = (importutils.import_class(CONF.QUARK.ipam_driver))()
-net_driver = (importutils.import_class(CONF.QUARK.net_driver))()
-net_driver.load_config()
+ipam_driver = registry.ipam_driver
+net_driver = registry.net_driver
+
+quark_opts = [
+    cfg.IntOpt('shared_network_cache_ttl', default=300,
+               help=_("Seconds the networks of the network strategy are "
+                      "cached for when creating ports. 0 disables the "
+                      "cache"))
+]
+CONF.register_opts(quark_opts, "QUARK")
+
+# Keyed by the strategy generation, so a reloaded strategy never gets
+# the networks resolved for the previous one.
+_shared_networks = utils.TTLCache(CONF.QUARK.shared_network_cache_ttl, 1)
+
+
+def _load_shared_networks(context):
+    existing = set(net["id"] for net in
+                   db_api.network_find_strategy(utils.elevated(context)))
+    resolved = {}
+    for parent, definition in STRATEGY.strategy.iteritems():
+        if parent in existing:
+            resolved[(parent, None)] = parent
+        for segment_id, child in definition["children"].iteritems():
+            if child in existing:
+                resolved[(parent, segment_id)] = child
+    return resolved
+
+
+def find_shared_network_id(context, net_id, segment_id=None):
+    """Returns the id of the network a port on shared network net_id and
+    segment segment_id goes on, or None if net_id is not a shared network
+    in the database.
+
+    The networks of the strategy are loaded once and kept in a
+    per-process cache, so most calls make no database round trip. A
+    network missing from the cache is looked up in the database again.
+    """
+    if not STRATEGY.is_parent_network(net_id):
+        return None
+    generation = STRATEGY.generation
+    key = (net_id, segment_id)
+    resolved = _shared_networks.get(generation)
+    if resolved is None or key not in resolved:
+        # Absence is never cached, the network may have been created
+        # since the cache was filled
+        resolved = _load_shared_networks(context)
+        _shared_networks.set(generation, resolved)
+    return resolved.get(key)
 
 
 def _adapt_provider_nets(context, network):
@@ -91,11 +137,9 @@ def create_network(context, network):
         s = db_api.subnet_create(context, **sub["subnet"])
         new_subnets.append(s)
     new_net["subnets"] = new_subnets
+    _shared_networks.clear()
 
-    if not security_groups.get_security_groups(
-            context,
-            filters={"id": security_groups.DEFAULT_SG_UUID}):
-        security_groups._create_default_security_group(context)
+    security_groups.ensure_default_security_group(context)
     return v._make_network_dict(new_net)
 
 
@@ -198,7 +242,11 @@ def delete_network(context, id):
         raise exceptions.NetworkNotFound(net_id=id)
     if net.ports:
         raise exceptions.NetworkInUse(net_id=id)
-    net_driver.delete_network(context, id)
-    for subnet in net["subnets"]:
-        subnets._delete_subnet(context, subnet)
+    subnet_ids = db_api.subnet_ids_for_network(context, id)
+    in_use = db_api.subnet_find_in_use(context, subnet_ids)
+    if in_use:
+        raise exceptions.SubnetInUse(subnet_id=in_use)
+    outbox.call(context, net_driver, "delete_network", id, id)
+    db_api.subnet_bulk_delete(context, subnet_ids)
     db_api.network_delete(context, net)
+    _shared_networks.clear()
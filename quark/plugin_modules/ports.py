@@ -16,22 +16,23 @@
 import netaddr
 
 from neutron.common import exceptions
-from neutron.openstack.common import importutils
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import uuidutils
 from neutron import quota
 from oslo.config import cfg
 
 from quark.db import api as db_api
+from quark.drivers import registry
+from quark import outbox
+from quark.plugin_modules import networks
 from quark import plugin_views as v
 from quark import utils
 
 CONF = cfg.CONF
 LOG = logging.getLogger("neutron.quark")
 
-ipam_driver = (importutils.import_class(CONF.QUARK.ipam_driver))()
-net_driver = (importutils.import_class(CONF.QUARK.net_driver))()
-net_driver.load_config()
+ipam_driver = registry.ipam_driver
+net_driver = registry.net_driver
 
 
 def create_port(context, port):
@@ -55,17 +56,24 @@ def create_port(context, port):
 
     port_id = uuidutils.generate_uuid()
 
-    net = db_api.network_find(context, id=net_id, shared=True,
-                              segment_id=segment_id, scope=db_api.ONE)
-    if not net:
+    shared_net_id = networks.find_shared_network_id(context, net_id,
+                                                    segment_id)
+    if shared_net_id:
+        net_id = shared_net_id
+    else:
         # Maybe it's a tenant network
         net = db_api.network_find(context, id=net_id, scope=db_api.ONE)
         if not net:
             raise exceptions.NetworkNotFound(net_id=net_id)
+        net_id = net["id"]
 
+    # Count in the database rather than loading every port on the network,
+    # shared networks can have a great many of them
+    port_count = db_api.port_count_all(context, network_id=[net_id],
+                                       tenant_id=[context.tenant_id])
     quota.QUOTAS.limit_check(
         context, context.tenant_id,
-        ports_per_network=len(net.get('ports', [])) + 1)
+        ports_per_network=port_count + 1)
 
     if fixed_ips:
         for fixed_ip in fixed_ips:
@@ -76,15 +84,15 @@ def create_port(context, port):
                     resource="fixed_ips",
                     msg="subnet_id and ip_address required")
             addresses.append(ipam_driver.allocate_ip_address(
-                context, net["id"], port_id, CONF.QUARK.ipam_reuse_after,
+                context, net_id, port_id, CONF.QUARK.ipam_reuse_after,
                 ip_address=ip_address))
     else:
         addresses.append(ipam_driver.allocate_ip_address(
-            context, net["id"], port_id, CONF.QUARK.ipam_reuse_after))
+            context, net_id, port_id, CONF.QUARK.ipam_reuse_after))
 
     group_ids, security_groups = v.make_security_group_list(
         context, port["port"].pop("security_groups", None))
-    mac = ipam_driver.allocate_mac_address(context, net["id"], port_id,
+    mac = ipam_driver.allocate_mac_address(context, net_id, port_id,
                                            CONF.QUARK.ipam_reuse_after,
                                            mac_address=mac_address)
     mac_address_string = str(netaddr.EUI(mac['address'],
@@ -92,11 +100,11 @@ def create_port(context, port):
     address_pairs = [{'mac_address': mac_address_string,
                       'ip_address': address.get('address_readable', '')}
                      for address in addresses]
-    backend_port = net_driver.create_port(context, net["id"], port_id=port_id,
+    backend_port = net_driver.create_port(context, net_id, port_id=port_id,
                                           security_groups=group_ids,
                                           allowed_pairs=address_pairs)
 
-    port_attrs["network_id"] = net["id"]
+    port_attrs["network_id"] = net_id
     port_attrs["id"] = port_id
     port_attrs["security_groups"] = security_groups
     new_port = db_api.port_create(
@@ -295,7 +303,50 @@ def delete_port(context, id):
     ipam_driver.deallocate_ip_address(
         context, port, ipam_reuse_after=CONF.QUARK.ipam_reuse_after)
     db_api.port_delete(context, port)
-    net_driver.delete_port(context, backend_key)
+    outbox.call(context, net_driver, "delete_port", backend_key, backend_key)
+
+
+def get_ports_by_device(context, device_id, fields=None):
+    """Retrieve every port attached to a device.
+
+    : param context: neutron api request context
+    : param device_id: id of the device (e.g., a VM) owning the ports.
+    : param fields: a list of strings that are valid keys in a
+        port dictionary as listed in the RESOURCE_ATTRIBUTE_MAP
+        object in neutron/api/v2/attributes.py. Only these fields
+        will be returned.
+    """
+    LOG.info("get_ports_by_device %s for tenant %s fields %s" %
+            (device_id, context.tenant_id, fields))
+    query = db_api.port_find(context, device_id=device_id, fields=fields)
+    return v._make_ports_list(query, fields)
+
+
+def delete_ports_by_device(context, device_id):
+    """Delete every port attached to a device.
+
+    Tears down all of a device's ports at once instead of one delete_port
+    call per NIC. MAC and IP addresses are deallocated with one update
+    each and the backend ports are deleted concurrently.
+    : param context: neutron api request context
+    : param device_id: id of the device (e.g., a VM) owning the ports.
+    """
+    LOG.info("delete_ports_by_device %s for tenant %s" %
+            (device_id, context.tenant_id))
+
+    ports = db_api.port_find(context, device_id=device_id, scope=db_api.ALL)
+    if not ports:
+        return
+
+    backend_keys = [port["backend_key"] for port in ports]
+    mac_addresses = [netaddr.EUI(port["mac_address"]).value
+                     for port in ports]
+    ipam_driver.deallocate_mac_addresses(context, mac_addresses)
+    ipam_driver.deallocate_ports_ip_addresses(
+        context, ports, ipam_reuse_after=CONF.QUARK.ipam_reuse_after)
+    for port in ports:
+        db_api.port_delete(context, port)
+    outbox.call_each(context, net_driver, "delete_port", backend_keys)
 
 
 def disassociate_port(context, id, ip_address_id):
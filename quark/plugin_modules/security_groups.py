@@ -15,23 +15,38 @@
 
 from neutron.common import exceptions
 from neutron.extensions import securitygroup as sg_ext
-from neutron.openstack.common import importutils
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import uuidutils
 from neutron import quota
 from oslo.config import cfg
 
 from quark.db import api as db_api
+from quark.drivers import registry
 from quark import plugin_views as v
+from quark import utils
 
 
 CONF = cfg.CONF
 LOG = logging.getLogger("neutron.quark")
 DEFAULT_SG_UUID = "00000000-0000-0000-0000-000000000000"
 
+quark_opts = [
+    cfg.IntOpt('default_security_group_cache_ttl', default=3600,
+               help=_("Seconds a tenant is remembered as having its default "
+                      "security group. 0 disables the cache")),
+    cfg.IntOpt('default_security_group_cache_size', default=10000,
+               help=_("Maximum number of tenants remembered as having "
+                      "their default security group"))
+]
+CONF.register_opts(quark_opts, "QUARK")
 
-net_driver = (importutils.import_class(CONF.QUARK.net_driver))()
-net_driver.load_config()
+# The default group can't be deleted, so once a tenant is seen with it
+# there is no need to look again.
+_default_groups = utils.TTLCache(CONF.QUARK.default_security_group_cache_ttl,
+                                 CONF.QUARK.default_security_group_cache_size)
+
+
+net_driver = registry.net_driver
 
 
 def _validate_security_group_rule(context, rule):
@@ -113,12 +128,37 @@ def _create_default_security_group(context):
 
     default_group["id"] = DEFAULT_SG_UUID
     default_group["tenant_id"] = context.tenant_id
-    for rule in default_group.pop("port_ingress_rules"):
-        db_api.security_group_rule_create(
-            context, security_group_id=default_group["id"],
-            tenant_id=context.tenant_id, direction="ingress",
-            **rule)
+    rules = [dict(rule, id=uuidutils.generate_uuid(),
+                  security_group_id=DEFAULT_SG_UUID,
+                  tenant_id=context.tenant_id, direction="ingress")
+             for rule in default_group.pop("port_ingress_rules")]
     db_api.security_group_create(context, **default_group)
+    db_api.security_group_rule_create_bulk(context, rules)
+
+
+def ensure_default_security_group(context):
+    """Creates the default security group of the tenant if it is missing.
+
+    Tenants are only cached once their group is found in the database, so
+    a creation that gets rolled back is retried on the next call.
+    """
+    if _default_groups.get(context.tenant_id):
+        return
+    if db_api.security_group_exists(context, DEFAULT_SG_UUID):
+        _default_groups.set(context.tenant_id, True)
+        return
+    _create_default_security_group(context)
+
+
+def _check_rules_per_group(context, added):
+    """Checks the rules per group quota for adding added[group_id] rules
+    to each group.
+    """
+    counts = db_api.security_group_rule_count_by_group(context, added.keys())
+    for group_id, count in added.items():
+        quota.QUOTAS.limit_check(
+            context, context.tenant_id,
+            security_rules_per_group=counts.get(group_id, 0) + count)
 
 
 def create_security_group_rule(context, security_group_rule):
@@ -134,9 +174,7 @@ def create_security_group_rule(context, security_group_rule):
     if not group:
         raise sg_ext.SecurityGroupNotFound(group_id=group_id)
 
-    quota.QUOTAS.limit_check(
-        context, context.tenant_id,
-        security_rules_per_group=len(group.get("rules", [])) + 1)
+    _check_rules_per_group(context, {group_id: 1})
 
     net_driver.create_security_group_rule(context, group_id, rule)
 
@@ -144,6 +182,38 @@ def create_security_group_rule(context, security_group_rule):
         db_api.security_group_rule_create(context, **rule))
 
 
+def create_security_group_rule_bulk(context, security_group_rule):
+    """Creates the rules of several security_group_rule bodies at once.
+
+    Every rule is validated before anything is written, each group gets
+    one quota check and one backend update, and the rows are inserted
+    together.
+    """
+    LOG.info("create_security_group_rule_bulk for tenant %s" %
+             (context.tenant_id))
+    rules = [_validate_security_group_rule(context, r["security_group_rule"])
+             for r in security_group_rule["security_group_rules"]]
+
+    group_rules = {}
+    for rule in rules:
+        rule["id"] = uuidutils.generate_uuid()
+        group_rules.setdefault(rule["security_group_id"], []).append(rule)
+
+    groups = db_api.security_group_find(context, id=group_rules.keys())
+    found = set(group["id"] for group in groups)
+    for group_id in group_rules:
+        if group_id not in found:
+            raise sg_ext.SecurityGroupNotFound(group_id=group_id)
+    _check_rules_per_group(context, dict(
+        (group_id, len(added)) for group_id, added in group_rules.items()))
+
+    for group_id, added in group_rules.items():
+        net_driver.update_security_group_rules(context, group_id, added=added)
+
+    return [v._make_security_group_rule_dict(rule)
+            for rule in db_api.security_group_rule_create_bulk(context, rules)]
+
+
 def delete_security_group(context, id):
     LOG.info("delete_security_group %s for tenant %s" %
             (id, context.tenant_id))
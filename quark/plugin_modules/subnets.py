@@ -17,11 +17,11 @@ import netaddr
 
 from neutron.common import config as neutron_cfg
 from neutron.common import exceptions
-from neutron.openstack.common import importutils
 from neutron.openstack.common import log as logging
 from oslo.config import cfg
 
 from quark.db import api as db_api
+from quark.drivers import registry
 from quark import network_strategy
 from quark.plugin_modules import routes
 from quark import plugin_views as v
@@ -32,7 +32,7 @@ DEFAULT_ROUTE = netaddr.IPNetwork("0.0.0.0/0")
 LOG = logging.getLogger("neutron.quark")
 STRATEGY = network_strategy.STRATEGY
 
-ipam_driver = (importutils.import_class(CONF.QUARK.ipam_driver))()
+ipam_driver = registry.ipam_driver
 
 
 def _validate_subnet_cidr(context, network_id, new_subnet_cidr):
@@ -46,26 +46,30 @@ def _validate_subnet_cidr(context, network_id, new_subnet_cidr):
     if neutron_cfg.cfg.CONF.allow_overlapping_ips:
         return
 
-    new_subnet_ipset = netaddr.IPSet([new_subnet_cidr])
-
     # Using admin context here, in case we actually share networks later
-    subnet_list = db_api.subnet_find(context.elevated(),
-                                     network_id=network_id)
-    for subnet in subnet_list:
-        if (netaddr.IPSet([subnet.cidr]) & new_subnet_ipset):
-            # don't give out details of the overlapping subnet
-            err_msg = (_("Requested subnet with cidr: %(cidr)s for "
-                         "network: %(network_id)s overlaps with another "
-                         "subnet") %
-                       {'cidr': new_subnet_cidr,
-                        'network_id': network_id})
-            LOG.error(_("Validation for CIDR: %(new_cidr)s failed - "
-                        "overlaps with subnet %(subnet_id)s "
-                        "(CIDR: %(cidr)s)"),
-                      {'new_cidr': new_subnet_cidr,
-                       'subnet_id': subnet.id,
-                       'cidr': subnet.cidr})
-            raise exceptions.InvalidInput(error_message=err_msg)
+    subnet = db_api.subnet_find_overlapping(utils.elevated(context),
+                                            network_id, new_subnet_cidr)
+    if subnet:
+        # don't give out details of the overlapping subnet
+        err_msg = (_("Requested subnet with cidr: %(cidr)s for "
+                     "network: %(network_id)s overlaps with another "
+                     "subnet") %
+                   {'cidr': new_subnet_cidr,
+                    'network_id': network_id})
+        LOG.error(_("Validation for CIDR: %(new_cidr)s failed - "
+                    "overlaps with subnet %(subnet_id)s "
+                    "(CIDR: %(cidr)s)"),
+                  {'new_cidr': new_subnet_cidr,
+                   'subnet_id': subnet.id,
+                   'cidr': subnet.cidr})
+        raise exceptions.InvalidInput(error_message=err_msg)
+
+
+def _find_default_route(host_routes):
+    for route in host_routes:
+        netaddr_route = netaddr.IPNetwork(route["destination"])
+        if netaddr_route.value == routes.DEFAULT_ROUTE.value:
+            return route
 
 
 def create_subnet(context, subnet):
@@ -97,14 +101,14 @@ def create_subnet(context, subnet):
     allocation_pools = utils.pop_param(sub_attrs, "allocation_pools", [])
     sub_attrs["network"] = net
 
+    default_route = _find_default_route(host_routes)
+    if default_route:
+        gateway_ip = default_route["nexthop"]
+    sub_attrs["gateway_ip"] = gateway_ip
+
     new_subnet = db_api.subnet_create(context, **sub_attrs)
 
-    default_route = None
     for route in host_routes:
-        netaddr_route = netaddr.IPNetwork(route["destination"])
-        if netaddr_route.value == routes.DEFAULT_ROUTE.value:
-            default_route = route
-            gateway_ip = default_route["nexthop"]
         new_subnet["routes"].append(db_api.route_create(
             context, cidr=route["destination"], gateway=route["nexthop"]))
 
@@ -123,8 +127,7 @@ def create_subnet(context, subnet):
             exclude = exclude - x
         new_subnet["ip_policy"] = db_api.ip_policy_create(context,
                                                           exclude=exclude)
-    subnet_dict = v._make_subnet_dict(new_subnet,
-                                      default_route=routes.DEFAULT_ROUTE)
+    subnet_dict = v._make_subnet_dict(new_subnet)
     subnet_dict["gateway_ip"] = gateway_ip
     return subnet_dict
 
@@ -152,24 +155,22 @@ def update_subnet(context, id, subnet):
     host_routes = s.pop("host_routes", [])
     gateway_ip = s.pop("gateway_ip", None)
 
-    if gateway_ip:
-        default_route = None
-        for route in host_routes:
-            netaddr_route = netaddr.IPNetwork(route["destination"])
-            if netaddr_route.value == routes.DEFAULT_ROUTE.value:
-                default_route = route
-                break
-        if default_route is None:
-            route_model = db_api.route_find(
-                context, cidr=str(routes.DEFAULT_ROUTE), subnet_id=id,
-                scope=db_api.ONE)
-            if route_model:
-                db_api.route_update(context, route_model,
-                                    gateway=gateway_ip)
-            else:
-                db_api.route_create(context,
-                                    cidr=str(routes.DEFAULT_ROUTE),
-                                    gateway=gateway_ip, subnet_id=id)
+    default_route = _find_default_route(host_routes)
+    if gateway_ip and default_route is None and host_routes:
+        # The routes given replace the subnet's, so the requested gateway
+        # goes in as their default route
+        default_route = dict(destination=str(routes.DEFAULT_ROUTE),
+                             nexthop=gateway_ip)
+        host_routes = host_routes + [default_route]
+    elif gateway_ip and default_route is None:
+        route_model = db_api.route_find(
+            context, cidr=str(routes.DEFAULT_ROUTE), subnet_id=id,
+            scope=db_api.ONE)
+        if route_model:
+            db_api.route_update(context, route_model, gateway=gateway_ip)
+        else:
+            db_api.route_create(context, cidr=str(routes.DEFAULT_ROUTE),
+                                gateway=gateway_ip, subnet_id=id)
 
     if dns_ips:
         subnet_db["dns_nameservers"] = []
@@ -180,12 +181,16 @@ def update_subnet(context, id, subnet):
 
     if host_routes:
         subnet_db["routes"] = []
+        # The routes given replace the subnet's, default route included
+        s["gateway_ip"] = default_route and default_route["nexthop"]
+    elif gateway_ip:
+        s["gateway_ip"] = gateway_ip
     for route in host_routes:
         subnet_db["routes"].append(db_api.route_create(
             context, cidr=route["destination"], gateway=route["nexthop"]))
 
     subnet = db_api.subnet_update(context, subnet_db, **s)
-    return v._make_subnet_dict(subnet, default_route=routes.DEFAULT_ROUTE)
+    return v._make_subnet_dict(subnet)
 
 
 def get_subnet(context, id, fields=None):
@@ -209,7 +214,7 @@ def get_subnet(context, id, fields=None):
     net_id = STRATEGY.get_parent_network(net_id)
     subnet["network_id"] = net_id
 
-    return v._make_subnet_dict(subnet, default_route=routes.DEFAULT_ROUTE)
+    return v._make_subnet_dict(subnet)
 
 
 def get_subnets(context, filters=None, fields=None):
@@ -234,8 +239,7 @@ def get_subnets(context, filters=None, fields=None):
     LOG.info("get_subnets for tenant %s with filters %s fields %s" %
             (context.tenant_id, filters, fields))
     subnets = db_api.subnet_find(context, **filters)
-    return v._make_subnets_list(subnets, fields=fields,
-                                default_route=routes.DEFAULT_ROUTE)
+    return v._make_subnets_list(subnets, fields=fields)
 
 
 def get_subnets_count(context, filters=None):
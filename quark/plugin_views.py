@@ -44,7 +44,7 @@ def _make_network_dict(network, fields=None):
     return res
 
 
-def _make_subnet_dict(subnet, default_route=None, fields=None):
+def _make_subnet_dict(subnet, fields=None):
     dns_nameservers = [str(netaddr.IPAddress(dns["ip"]))
                        for dns in subnet.get("dns_nameservers")]
     net_id = STRATEGY.get_parent_network(subnet["network_id"])
@@ -82,6 +82,7 @@ def _make_subnet_dict(subnet, default_route=None, fields=None):
            "allocation_pools": _allocation_pools(subnet),
            "dns_nameservers": dns_nameservers or [],
            "cidr": subnet.get("cidr"),
+           "gateway_ip": subnet.get("gateway_ip"),
            "enable_dhcp": None}
 
     def _host_route(route):
@@ -89,14 +90,6 @@ def _make_subnet_dict(subnet, default_route=None, fields=None):
                 "nexthop": route["gateway"]}
 
     res["host_routes"] = [_host_route(r) for r in subnet["routes"]]
-
-    #TODO(mdietz): really inefficient, should go away
-    res["gateway_ip"] = None
-    for route in subnet["routes"]:
-        netroute = netaddr.IPNetwork(route["cidr"])
-        if netroute.value == default_route.value:
-            res["gateway_ip"] = route["gateway"]
-            break
     return res
 
 
@@ -164,11 +157,10 @@ def _make_ports_list(query, fields=None):
     return ports
 
 
-def _make_subnets_list(query, default_route=None, fields=None):
+def _make_subnets_list(query, fields=None):
     subnets = []
     for subnet in query:
-        subnet_dict = _make_subnet_dict(subnet, default_route=default_route,
-                                        fields=fields)
+        subnet_dict = _make_subnet_dict(subnet, fields=fields)
         subnets.append(subnet_dict)
     return subnets
 
@@ -0,0 +1,109 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+#  under the License.
+
+"""
+Benchmarks the db api finders against an in-memory SQLite database
+
+    python -m quark.tests.db_benchmark --rows 1000 --calls 2000
+
+Reports the time spent building the filters of a finder call apart from
+the time of the whole call, so finder overhead can be told from time
+spent in the database.
+"""
+
+import optparse
+import time
+
+import netaddr
+from neutron import context as neutron_context
+from neutron.db import api as neutron_db_api
+from neutron.openstack.common.db.sqlalchemy import session as neutron_session
+from oslo.config import cfg
+
+from quark.db import api as db_api
+from quark.db import models
+
+
+def _setup_db():
+    cfg.CONF.set_override("connection", "sqlite://", "database")
+    neutron_db_api.configure_db()
+    models.BASEV2.metadata.create_all(neutron_session._ENGINE)
+
+
+def _populate(context, rows):
+    network = db_api.network_create(context, id="bench-net", name="bench")
+    subnet = db_api.subnet_create(context, network_id=network["id"],
+                                  cidr="10.0.0.0/8")
+    context.session.flush()
+    for i in xrange(rows):
+        db_api.ip_address_create(
+            context, address=netaddr.IPAddress("10.0.0.0") + i + 1,
+            subnet_id=subnet["id"], network_id=network["id"], version=4)
+        context.session.add(models.Port(
+            id="bench-port-%d" % i, network_id=network["id"],
+            backend_key="bench-port-%d" % i, device_id="dev-%d" % i,
+            tenant_id=context.tenant_id, mac_address=i))
+    context.session.flush()
+    return network, subnet
+
+
+def _timed(name, calls, func):
+    start = time.time()
+    for i in xrange(calls):
+        func(i)
+    elapsed = time.time() - start
+    print("%-24s %6d calls %8.3fs %8.3f ms/call" %
+          (name, calls, elapsed, calls and elapsed * 1000 / calls or 0))
+
+
+def run(rows=1000, calls=1000):
+    context = neutron_context.Context("bench", "bench-tenant")
+    network, subnet = _populate(context, rows)
+    print("rows=%d calls=%d" % (rows, calls))
+
+    _timed("_model_query port", calls,
+           lambda i: db_api._model_query(
+               context, models.Port,
+               {"device_id": ["dev-%d" % (i % rows)],
+                "network_id": [network["id"]]}))
+    _timed("_model_query ip_address", calls,
+           lambda i: db_api._model_query(
+               context, models.IPAddress,
+               {"network_id": [network["id"]], "reuse_after": 7200,
+                "deallocated": True, "ip_address": None}))
+    _timed("port_find", calls,
+           lambda i: db_api.port_find(context, device_id="dev-%d" % (i % rows),
+                                      scope=db_api.ALL))
+    _timed("subnet_find", calls,
+           lambda i: db_api.subnet_find(context, id=subnet["id"],
+                                        scope=db_api.ONE))
+    _timed("ip_address_find", calls,
+           lambda i: db_api.ip_address_find(
+               context, network_id=network["id"], reuse_after=7200,
+               deallocated=True, scope=db_api.ONE))
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--rows", type="int", default=1000)
+    parser.add_option("--calls", type="int", default=1000)
+    options, _args = parser.parse_args()
+
+    _setup_db()
+    run(rows=options.rows, calls=options.calls)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+#  under the License.
+
+"""
+In-process stand-in for the parts of the NVP API Quark's drivers use
+
+A FakeController holds the state of a controller cluster. Each of its
+connections acts like an aiclib.nvp.Connection to one controller. Every
+create, read, update, delete and query results call is a round trip: it
+is counted, delayed by the configured latency and may be failed with the
+configured error rate.
+"""
+
+import collections
+import copy
+import random
+
+import aiclib
+import eventlet
+from neutron.openstack.common import uuidutils
+
+
+class FakeController(object):
+    def __init__(self, latency=0, error_rate=0, max_ports_per_switch=0,
+                 transport_zones=None, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_ports_per_switch = max_ports_per_switch
+        self.transport_zones = transport_zones
+        self.random = random.Random(seed)
+        self.calls = collections.defaultdict(int)
+        self.controller_calls = collections.defaultdict(int)
+        self.lswitches = {}
+        self.lports = {}
+        self.profiles = {}
+
+    def connection(self, name="controller"):
+        return FakeConnection(self, name)
+
+    def install(self, driver, controllers=1):
+        """Points every controller of driver at this fake."""
+        driver.nvp_connections = [
+            dict(connection=self.connection("controller%d" % i),
+                 ip_address="controller%d" % i, retries="2")
+            for i in xrange(controllers)]
+        driver.conn_index = 0
+
+    def round_trips(self):
+        return sum(self.calls.itervalues())
+
+    def reset_counts(self):
+        self.calls.clear()
+        self.controller_calls.clear()
+
+    def request(self, conn_name, kind, method):
+        self.calls[(kind, method)] += 1
+        self.controller_calls[conn_name] += 1
+        if self.latency:
+            eventlet.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise aiclib.core.AICException(503, "Injected failure")
+
+    def store(self, kind):
+        return {"lswitch": self.lswitches,
+                "lswitch_port": self.lports,
+                "securityprofile": self.profiles}[kind]
+
+
+class FakeConnection(object):
+    def __init__(self, controller, name):
+        self.controller = controller
+        self.name = name
+
+    def lswitch(self, uuid=None):
+        return FakeEntity(self, "lswitch", uuid)
+
+    def lswitch_port(self, lswitch_uuid=None, uuid=None):
+        return FakeEntity(self, "lswitch_port", uuid, parent=lswitch_uuid)
+
+    def securityprofile(self, uuid=None):
+        return FakeEntity(self, "securityprofile", uuid)
+
+    def securityrule(self, ethertype, **rule):
+        return dict(rule, ethertype=ethertype)
+
+    def transportzone(self, uuid):
+        return FakeTransportZone(self, uuid)
+
+
+def _not_found(kind, uuid):
+    return aiclib.core.AICException(404, "%s %s not found" % (kind, uuid))
+
+
+class FakeEntity(object):
+    SETTERS = {"display_name": "display_name",
+               "tags": "tags",
+               "admin_status_enabled": "admin_status_enabled",
+               "allowed_address_pairs": "allowed_address_pairs",
+               "security_profiles": "security_profiles",
+               "port_ingress_rules": "logical_port_ingress_rules",
+               "port_egress_rules": "logical_port_egress_rules"}
+
+    def __init__(self, conn, kind, uuid=None, parent=None):
+        self.conn = conn
+        self.controller = conn.controller
+        self.kind = kind
+        self.uuid = uuid
+        self.parent = parent
+        self.body = {}
+
+    def __getattr__(self, name):
+        if name not in self.SETTERS:
+            raise AttributeError(name)
+
+        def _set(value):
+            self.body[self.SETTERS[name]] = value
+            return self
+        return _set
+
+    def transport_zone(self, zone_uuid, transport_type, vlan_id=None):
+        zone = dict(zone_uuid=zone_uuid, transport_type=transport_type)
+        if vlan_id:
+            zone["binding_config"] = {
+                "vlan_translation": [{"transport": vlan_id}]}
+        self.body.setdefault("transport_zones", []).append(zone)
+        return self
+
+    def _request(self, method):
+        self.controller.request(self.conn.name, self.kind, method)
+
+    def _get(self):
+        doc = self.controller.store(self.kind).get(self.uuid)
+        if doc is None:
+            raise _not_found(self.kind, self.uuid)
+        return doc
+
+    def create(self):
+        self._request("create")
+        doc = dict(uuid=uuidutils.generate_uuid(), tags=[])
+        if self.kind == "lswitch":
+            doc["transport_zones"] = []
+        elif self.kind == "securityprofile":
+            doc["logical_port_ingress_rules"] = []
+            doc["logical_port_egress_rules"] = []
+        elif self.kind == "lswitch_port":
+            if self.parent not in self.controller.lswitches:
+                raise _not_found("lswitch", self.parent)
+            limit = self.controller.max_ports_per_switch
+            ports = [p for p in self.controller.lports.itervalues()
+                     if p["lswitch"] == self.parent]
+            if limit and len(ports) >= limit:
+                raise aiclib.core.AICException(409, "lswitch is full")
+            doc["lswitch"] = self.parent
+            doc["security_profiles"] = []
+        doc.update(copy.deepcopy(self.body))
+        self.controller.store(self.kind)[doc["uuid"]] = doc
+        return copy.deepcopy(doc)
+
+    def read(self):
+        self._request("read")
+        return copy.deepcopy(self._get())
+
+    def update(self):
+        self._request("update")
+        doc = self._get()
+        doc.update(copy.deepcopy(self.body))
+        return copy.deepcopy(doc)
+
+    def delete(self):
+        self._request("delete")
+        self._get()
+        del self.controller.store(self.kind)[self.uuid]
+        if self.kind == "lswitch":
+            for uuid, port in self.controller.lports.items():
+                if port["lswitch"] == self.uuid:
+                    del self.controller.lports[uuid]
+
+    def query(self):
+        return FakeQuery(self)
+
+
+class FakeQuery(object):
+    def __init__(self, entity):
+        self.entity = entity
+        self.controller = entity.controller
+        self._tagscopes = []
+        self._tags = []
+        self._relations = []
+        self._uuid = None
+        self._profile_uuid = None
+
+    def tagscopes(self, scopes):
+        self._tagscopes = scopes
+        return self
+
+    def tags(self, tags):
+        self._tags = tags
+        return self
+
+    def relations(self, relation):
+        self._relations.append(relation)
+        return self
+
+    def uuid(self, uuid):
+        self._uuid = uuid
+        return self
+
+    def security_profile_uuid(self, op, uuid):
+        self._profile_uuid = uuid
+        return self
+
+    def _matches(self, doc):
+        entity = self.entity
+        if self._uuid and doc["uuid"] != self._uuid:
+            return False
+        if (entity.kind == "lswitch_port" and entity.parent not in
+                (None, "*") and doc["lswitch"] != entity.parent):
+            return False
+        if (self._profile_uuid and
+                self._profile_uuid not in doc.get("security_profiles", [])):
+            return False
+        tags = [(t["scope"], t["tag"]) for t in doc.get("tags", [])]
+        return all(pair in tags for pair in zip(self._tagscopes, self._tags))
+
+    def _relate(self, doc):
+        relations = {}
+        for relation in self._relations:
+            if relation == "LogicalSwitchStatus":
+                count = len([p for p in self.controller.lports.itervalues()
+                             if p["lswitch"] == doc["uuid"]])
+                relations[relation] = {"lport_count": count}
+            elif relation == "LogicalSwitchConfig":
+                relations[relation] = {
+                    "uuid": doc["lswitch"],
+                    "security_profiles": doc.get("security_profiles", [])}
+        doc["_relations"] = relations
+        return doc
+
+    def results(self):
+        self.entity._request("query")
+        store = self.controller.store(self.entity.kind)
+        results = [self._relate(copy.deepcopy(doc))
+                   for doc in store.itervalues() if self._matches(doc)]
+        return {"results": results, "result_count": len(results)}
+
+
+class FakeTransportZone(object):
+    def __init__(self, conn, uuid):
+        self.conn = conn
+        self.uuid = uuid
+
+    def query(self):
+        return self
+
+    def results(self):
+        self.conn.controller.request(self.conn.name, "transportzone",
+                                     "query")
+        zones = self.conn.controller.transport_zones
+        if zones is not None and self.uuid not in zones:
+            return {"results": [], "result_count": 0}
+        return {"results": [{"uuid": self.uuid}], "result_count": 1}
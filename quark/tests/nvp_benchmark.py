@@ -0,0 +1,126 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+#  under the License.
+
+"""
+Benchmarks the NVP drivers against the fake NVP controller
+
+    python -m quark.tests.nvp_benchmark --ports 200 --latency 0.005
+
+Reports wall time and controller round trips per operation for port
+create, update and delete.
+"""
+
+import optparse
+import time
+
+from neutron import context as neutron_context
+from neutron.db import api as neutron_db_api
+from neutron.openstack.common.db.sqlalchemy import session as neutron_session
+from neutron.openstack.common import uuidutils
+from oslo.config import cfg
+
+from quark.db import models
+from quark.drivers import nvp_driver
+from quark.drivers import optimized_nvp_driver
+from quark.tests import fake_nvp
+
+DRIVERS = {"nvp": nvp_driver.NVPDriver,
+           "optimized": optimized_nvp_driver.OptimizedNVPDriver}
+
+
+def _setup_db():
+    cfg.CONF.set_override("connection", "sqlite://", "database")
+    neutron_db_api.configure_db()
+    models.BASEV2.metadata.create_all(neutron_session._ENGINE)
+
+
+def _timed(controller, name, count, func, items):
+    controller.reset_counts()
+    start = time.time()
+    results = [func(item) for item in items]
+    elapsed = time.time() - start
+    per_op = count and float(controller.round_trips()) / count or 0
+    print("%-8s %6d ops %8.3fs %8.2f ms/op %6.2f round trips/op" %
+          (name, count, elapsed, count and elapsed * 1000 / count or 0,
+           per_op))
+    return results
+
+
+def run(driver_name, ports=100, groups=2, latency=0, error_rate=0,
+        controllers=1, max_ports_per_switch=0):
+    controller = fake_nvp.FakeController(
+        latency=latency, error_rate=error_rate,
+        max_ports_per_switch=max_ports_per_switch, seed=0)
+    driver = DRIVERS[driver_name]()
+    driver.limits.update(max_ports_per_switch=max_ports_per_switch,
+                         max_rules_per_group=1000, max_rules_per_port=1000)
+    controller.install(driver, controllers)
+    context = neutron_context.Context("bench", "bench-tenant", is_admin=True)
+
+    network_id = uuidutils.generate_uuid()
+    driver.create_network(context, "bench", network_id=network_id)
+    group_ids = []
+    for i in xrange(groups):
+        group_id = uuidutils.generate_uuid()
+        context.session.add(models.SecurityGroup(
+            id=group_id, name="bench%d" % i, description="",
+            tenant_id=context.tenant_id))
+        driver.create_security_group(context, "bench%d" % i,
+                                     group_id=group_id)
+        group_ids.append(group_id)
+
+    print("driver=%s ports=%d groups=%d latency=%s error_rate=%s "
+          "controllers=%d" % (driver_name, ports, groups, latency,
+                              error_rate, controllers))
+    created = _timed(
+        controller, "create", ports,
+        lambda _: driver.create_port(context, network_id,
+                                     uuidutils.generate_uuid(),
+                                     security_groups=group_ids),
+        xrange(ports))
+    port_ids = [port["uuid"] for port in created]
+    _timed(controller, "update", ports,
+           lambda port_id: driver.update_port(context, port_id,
+                                              security_groups=group_ids),
+           port_ids)
+    _timed(controller, "delete", ports,
+           lambda port_id: driver.delete_port(context, port_id), port_ids)
+    print("calls by controller: %s" % dict(controller.controller_calls))
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--driver", default="all",
+                      choices=["all"] + DRIVERS.keys())
+    parser.add_option("--ports", type="int", default=100)
+    parser.add_option("--groups", type="int", default=2)
+    parser.add_option("--latency", type="float", default=0,
+                      help="Seconds added to every controller round trip")
+    parser.add_option("--error-rate", type="float", default=0)
+    parser.add_option("--controllers", type="int", default=1)
+    parser.add_option("--max-ports-per-switch", type="int", default=0)
+    options, _args = parser.parse_args()
+
+    _setup_db()
+    names = options.driver == "all" and sorted(DRIVERS) or [options.driver]
+    for name in names:
+        run(name, ports=options.ports, groups=options.groups,
+            latency=options.latency, error_rate=options.error_rate,
+            controllers=options.controllers,
+            max_ports_per_switch=options.max_ports_per_switch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+#  under the License.
+
+import contextlib
+import datetime
+
+import mock
+from neutron.openstack.common import timeutils
+from oslo.config import cfg
+
+from quark.db import models
+from quark.plugin_modules import changes
+from quark.tests import test_quark_plugin
+
+
+class TestQuarkGetChanges(test_quark_plugin.TestQuarkPlugin):
+    @contextlib.contextmanager
+    def _stubs(self, changes, routes=None):
+        change_models = []
+        for change in changes:
+            c = models.ChangeLog(created_at=datetime.datetime(2013, 1, 1))
+            c.update(change)
+            change_models.append(c)
+        route_models = []
+        for route in routes or []:
+            r = models.Route()
+            r.update(route)
+            route_models.append(r)
+
+        db_mod = "quark.db.api"
+        with contextlib.nested(
+            mock.patch("%s.change_find" % db_mod),
+            mock.patch("%s.route_find" % db_mod)
+        ) as (change_find, route_find):
+            change_find.return_value = change_models
+            route_find.return_value = route_models
+            yield change_find, route_find
+
+    def test_get_changes_none(self):
+        with self._stubs(changes=[]) as (change_find, route_find):
+            res = self.plugin.get_changes(self.context, since=5)
+            self.assertEqual(res, {"cursor": 5, "changes": []})
+            self.assertFalse(route_find.called)
+
+    def test_get_changes_latest_per_resource(self):
+        route = dict(id="r1", cidr="0.0.0.0/0", gateway="192.168.0.1",
+                     subnet_id="s1")
+        changes = [dict(id=1, resource="route", resource_id="r1",
+                        action="create"),
+                   dict(id=2, resource="route", resource_id="r2",
+                        action="create"),
+                   dict(id=3, resource="route", resource_id="r1",
+                        action="update"),
+                   dict(id=4, resource="route", resource_id="r2",
+                        action="delete")]
+        with self._stubs(changes=changes, routes=[route]) as (change_find,
+                                                             route_find):
+            res = self.plugin.get_changes(self.context, since=0)
+            self.assertEqual(res["cursor"], 4)
+            self.assertEqual(len(res["changes"]), 2)
+            updated, deleted = res["changes"]
+            self.assertEqual(updated["resource_id"], "r1")
+            self.assertEqual(updated["action"], "update")
+            self.assertEqual(updated["payload"]["gateway"], "192.168.0.1")
+            self.assertEqual(deleted["resource_id"], "r2")
+            self.assertIsNone(deleted["payload"])
+            self.assertEqual(route_find.call_count, 1)
+
+    def test_get_changes_limit_capped(self):
+        cfg.CONF.set_override("max_changes_per_request", 10, "QUARK")
+        with self._stubs(changes=[]) as (change_find, route_find):
+            self.plugin.get_changes(self.context, since=0, limit=100)
+            self.assertEqual(change_find.call_args[1]["limit"], 10)
+        cfg.CONF.clear_override("max_changes_per_request", "QUARK")
+
+    def test_get_changes_holds_back_unsettled(self):
+        old = datetime.datetime(2013, 1, 1)
+        changes = [dict(id=1, resource="route", resource_id="r1",
+                        action="delete", created_at=old),
+                   dict(id=3, resource="route", resource_id="r2",
+                        action="delete", created_at=timeutils.utcnow()),
+                   dict(id=4, resource="route", resource_id="r3",
+                        action="delete", created_at=old)]
+        with self._stubs(changes=changes) as (change_find, route_find):
+            res = self.plugin.get_changes(self.context, since=0)
+            self.assertEqual(res["cursor"], 1)
+            self.assertEqual([c["resource_id"] for c in res["changes"]],
+                             ["r1"])
+
+
+class TestQuarkPruneChanges(test_quark_plugin.TestQuarkPlugin):
+    def test_prune_changes(self):
+        with mock.patch("quark.db.api.change_prune") as change_prune:
+            change_prune.return_value = 3
+            self.assertEqual(changes.prune_changes(self.context), 3)
+            before = change_prune.call_args[0][1]
+            retention = cfg.CONF.QUARK.change_log_retention
+            self.assertTrue(before <= timeutils.utcnow() -
+                            datetime.timedelta(seconds=retention))
+
+    def test_prune_changes_disabled(self):
+        cfg.CONF.set_override("change_log_retention", 0, "QUARK")
+        with mock.patch("quark.db.api.change_prune") as change_prune:
+            self.assertEqual(changes.prune_changes(self.context), 0)
+            self.assertFalse(change_prune.called)
+        cfg.CONF.clear_override("change_log_retention", "QUARK")
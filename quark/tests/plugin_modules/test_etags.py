@@ -0,0 +1,56 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+#  under the License.
+
+import contextlib
+
+import mock
+
+from quark.db import models
+from quark.tests import test_quark_plugin
+
+
+class TestQuarkGetEtag(test_quark_plugin.TestQuarkPlugin):
+    @contextlib.contextmanager
+    def _stubs(self, etag="abc"):
+        with mock.patch("quark.db.api.revision_etag") as revision_etag:
+            revision_etag.return_value = etag
+            yield revision_etag
+
+    def test_get_etag_ports(self):
+        with self._stubs() as revision_etag:
+            etag = self.plugin.get_etag(self.context, "ports",
+                                        {"device_id": ["dev"]})
+            self.assertEqual(etag, "abc")
+            revision_etag.assert_called_once_with(self.context, models.Port,
+                                                  device_id=["dev"])
+
+    def test_get_etag_unknown_collection(self):
+        with self._stubs() as revision_etag:
+            self.assertIsNone(self.plugin.get_etag(self.context, "foos"))
+            self.assertFalse(revision_etag.called)
+
+    def test_get_etag_shared_not_cached(self):
+        with self._stubs() as revision_etag:
+            etag = self.plugin.get_etag(self.context, "networks",
+                                        {"shared": [True]})
+            self.assertIsNone(etag)
+            self.assertFalse(revision_etag.called)
+
+    def test_get_etag_unknown_filter_not_cached(self):
+        with self._stubs() as revision_etag:
+            etag = self.plugin.get_etag(self.context, "networks",
+                                        {"device_id": ["dev"]})
+            self.assertIsNone(etag)
+            self.assertFalse(revision_etag.called)
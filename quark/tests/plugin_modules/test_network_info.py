@@ -0,0 +1,70 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+#  under the License.
+
+import contextlib
+
+import mock
+
+from quark.db import models
+from quark.tests import test_quark_plugin
+
+
+class TestQuarkGetNetworkInfo(test_quark_plugin.TestQuarkPlugin):
+    @contextlib.contextmanager
+    def _stubs(self, ports=None, subnets=None, networks=None):
+        with mock.patch("quark.db.api.network_info_find") as info_find:
+            info_find.return_value = (ports or [], subnets or [],
+                                      networks or [])
+            yield info_find
+
+    def _models(self):
+        network = models.Network(id=1, name="public",
+                                 tenant_id=self.context.tenant_id)
+        subnet = models.Subnet(network=network)
+        subnet.update(dict(id=1, network_id=1, cidr="192.168.1.0/24",
+                           gateway_ip="192.168.1.1",
+                           tenant_id=self.context.tenant_id))
+        subnet.routes = [models.Route(cidr="0.0.0.0/0",
+                                      gateway="192.168.1.1")]
+        address = models.IPAddress()
+        address.update(dict(id=1, address=3232235876, version=4,
+                            address_readable="192.168.1.100", subnet_id=1,
+                            network_id=1))
+        port = models.Port()
+        port.update(dict(id=1, network_id=1, device_id="dev",
+                         mac_address="aa:bb:cc:dd:ee:ff",
+                         tenant_id=self.context.tenant_id))
+        port.ip_addresses = [address]
+        network.subnets = [subnet]
+        return port, subnet, network
+
+    def test_get_network_info(self):
+        port, subnet, network = self._models()
+        with self._stubs(ports=[port], subnets=[subnet],
+                         networks=[network]) as info_find:
+            res = self.plugin.get_network_info(self.context, ["dev"])
+            info_find.assert_called_once_with(self.context, ["dev"])
+            self.assertEqual(len(res["ports"]), 1)
+            self.assertEqual(res["ports"][0]["fixed_ips"][0]["ip_address"],
+                             "192.168.1.100")
+            self.assertEqual(len(res["subnets"]), 1)
+            self.assertEqual(res["subnets"][0]["gateway_ip"], "192.168.1.1")
+            self.assertEqual(res["networks"][0]["subnets"], [1])
+
+    def test_get_network_info_no_devices(self):
+        with self._stubs():
+            res = self.plugin.get_network_info(self.context, [])
+            self.assertEqual(res, {"ports": [], "subnets": [],
+                                   "networks": []})
@@ -14,11 +14,14 @@
 #  under the License.
 
 import contextlib
+import json
 
 import mock
 from neutron.common import exceptions
 
 from quark.db import models
+from quark import network_strategy
+from quark.plugin_modules import networks
 from quark.tests import test_quark_plugin
 
 
@@ -118,36 +121,36 @@ class TestQuarkUpdateNetwork(test_quark_plugin.TestQuarkPlugin):
 
 class TestQuarkDeleteNetwork(test_quark_plugin.TestQuarkPlugin):
     @contextlib.contextmanager
-    def _stubs(self, net=None, ports=None, subnets=None):
+    def _stubs(self, net=None, ports=None, subnets=None, in_use=None):
         subnets = subnets or []
         net_mod = net
         port_mods = []
-        subnet_mods = []
 
         for port in ports:
             port_model = models.Port()
             port_model.update(port)
             port_mods.append(port_model)
 
-        for subnet in subnets:
-            subnet_mod = models.Subnet()
-            subnet_mod.update(subnet)
-            subnet_mods.append(subnet_mod)
-
         if net:
             net_mod = models.Network()
             net_mod.update(net)
             net_mod.ports = port_mods
-            net_mod["subnets"] = subnet_mods
 
         db_mod = "quark.db.api"
         with contextlib.nested(
             mock.patch("%s.network_find" % db_mod),
             mock.patch("%s.network_delete" % db_mod),
             mock.patch("quark.drivers.base.BaseDriver.delete_network"),
-            mock.patch("%s.subnet_delete" % db_mod)
-        ) as (net_find, net_delete, driver_net_delete, subnet_del):
+            mock.patch("%s.subnet_ids_for_network" % db_mod),
+            mock.patch("%s.subnet_find_in_use" % db_mod),
+            mock.patch("%s.subnet_bulk_delete" % db_mod)
+        ) as (net_find, net_delete, driver_net_delete, subnet_ids,
+              subnet_in_use, subnet_del):
             net_find.return_value = net_mod
+            subnet_ids.return_value = [subnet["id"] for subnet in subnets]
+            subnet_in_use.return_value = in_use
+            self.driver_net_delete = driver_net_delete
+            self.subnet_bulk_delete = subnet_del
             yield net_delete
 
     def test_delete_network(self):
@@ -170,10 +173,23 @@ class TestQuarkDeleteNetwork(test_quark_plugin.TestQuarkPlugin):
 
     def test_delete_network_with_subnets_passes(self):
         net = dict(id=1)
-        subnet = dict(id=1)
-        with self._stubs(net=net, ports=[], subnets=[subnet]) as net_delete:
+        subnets = [dict(id=1), dict(id=2)]
+        with self._stubs(net=net, ports=[], subnets=subnets) as net_delete:
             self.plugin.delete_network(self.context, 1)
             self.assertTrue(net_delete.called)
+            self.subnet_bulk_delete.assert_called_once_with(self.context,
+                                                            [1, 2])
+
+    def test_delete_network_with_allocated_ips_fails(self):
+        net = dict(id=1)
+        subnets = [dict(id=1), dict(id=2)]
+        with self._stubs(net=net, ports=[], subnets=subnets,
+                         in_use=2) as net_delete:
+            with self.assertRaises(exceptions.SubnetInUse):
+                self.plugin.delete_network(self.context, 1)
+            self.assertFalse(self.driver_net_delete.called)
+            self.assertFalse(self.subnet_bulk_delete.called)
+            self.assertFalse(net_delete.called)
 
 
 class TestQuarkCreateNetwork(test_quark_plugin.TestQuarkPlugin):
@@ -214,6 +230,14 @@ class TestQuarkCreateNetwork(test_quark_plugin.TestQuarkPlugin):
             self.assertEqual(net["shared"], False)
             self.assertEqual(net["tenant_id"], 0)
 
+    def test_create_network_clears_shared_networks(self):
+        networks._shared_networks.set("generation", {})
+        net = dict(id=1, name="public", admin_state_up=True,
+                   tenant_id=0)
+        with self._stubs(net=net):
+            self.plugin.create_network(self.context, dict(network=net))
+            self.assertIsNone(networks._shared_networks.get("generation"))
+
     def test_create_network_with_subnets(self):
         subnet = dict(id=2, cidr="172.168.0.0/24", tenant_id=0)
         net = dict(id=1, name="public", admin_state_up=True,
@@ -230,3 +254,53 @@ class TestQuarkCreateNetwork(test_quark_plugin.TestQuarkPlugin):
             self.assertEqual(net["subnets"], [2])
             self.assertEqual(net["shared"], False)
             self.assertEqual(net["tenant_id"], 0)
+
+
+class TestQuarkFindSharedNetwork(test_quark_plugin.TestQuarkPlugin):
+    @contextlib.contextmanager
+    def _stubs(self, existing):
+        strategy = network_strategy.JSONStrategy(json.dumps(
+            {"public_network": {"children": {"nova": "child_net",
+                                             "other": "missing_net"}}}))
+        nets = [models.Network(id=net_id) for net_id in existing]
+        with contextlib.nested(
+            mock.patch("quark.plugin_modules.networks.STRATEGY", strategy),
+            mock.patch("quark.db.api.network_find_strategy")
+        ) as (_, net_find):
+            net_find.return_value = nets
+            yield strategy, net_find
+
+    def test_find_shared_network_id(self):
+        with self._stubs(["public_network", "child_net"]) as (_, net_find):
+            self.assertEqual(networks.find_shared_network_id(
+                self.context, "public_network"), "public_network")
+            self.assertEqual(networks.find_shared_network_id(
+                self.context, "public_network", "nova"), "child_net")
+            self.assertEqual(net_find.call_count, 1)
+
+    def test_find_shared_network_id_misses(self):
+        with self._stubs(["public_network", "child_net"]) as (_, net_find):
+            self.assertIsNone(networks.find_shared_network_id(
+                self.context, "tenant_net"))
+            self.assertIsNone(networks.find_shared_network_id(
+                self.context, "public_network", "other"))
+            self.assertIsNone(networks.find_shared_network_id(
+                self.context, "public_network", "derp"))
+
+    def test_find_shared_network_id_misses_not_cached(self):
+        with self._stubs(["public_network"]) as (_, net_find):
+            self.assertIsNone(networks.find_shared_network_id(
+                self.context, "public_network", "nova"))
+            net_find.return_value = [models.Network(id="public_network"),
+                                     models.Network(id="child_net")]
+            self.assertEqual(networks.find_shared_network_id(
+                self.context, "public_network", "nova"), "child_net")
+            self.assertEqual(net_find.call_count, 2)
+
+    def test_find_shared_network_id_strategy_reloaded(self):
+        with self._stubs(["public_network"]) as (strategy, net_find):
+            networks.find_shared_network_id(self.context, "public_network")
+            strategy._compile_strategy(json.dumps(
+                {"public_network": {"children": {}}}))
+            networks.find_shared_network_id(self.context, "public_network")
+            self.assertEqual(net_find.call_count, 2)
@@ -134,7 +134,8 @@ class TestQuarkGetPorts(test_quark_plugin.TestQuarkPlugin):
 
 class TestQuarkCreatePort(test_quark_plugin.TestQuarkPlugin):
     @contextlib.contextmanager
-    def _stubs(self, port=None, network=None, addr=None, mac=None):
+    def _stubs(self, port=None, network=None, addr=None, mac=None,
+               port_count=0):
         port_model = models.Port()
         port_model.update(port)
         port_models = port_model
@@ -144,11 +145,13 @@ class TestQuarkCreatePort(test_quark_plugin.TestQuarkPlugin):
         with contextlib.nested(
             mock.patch("%s.port_create" % db_mod),
             mock.patch("%s.network_find" % db_mod),
+            mock.patch("%s.port_count_all" % db_mod),
             mock.patch("%s.allocate_ip_address" % ipam),
             mock.patch("%s.allocate_mac_address" % ipam),
-        ) as (port_create, net_find, alloc_ip, alloc_mac):
+        ) as (port_create, net_find, port_count_all, alloc_ip, alloc_mac):
             port_create.return_value = port_models
             net_find.return_value = network
+            port_count_all.return_value = port_count
             alloc_ip.return_value = addr
             alloc_mac.return_value = mac
             yield port_create
@@ -239,6 +242,23 @@ class TestQuarkCreatePort(test_quark_plugin.TestQuarkPlugin):
             with self.assertRaises(exceptions.BadRequest):
                 self.plugin.create_port(self.context, port)
 
+    def test_create_port_shared_network(self):
+        mac = dict(address="aa:bb:cc:dd:ee:ff")
+        port = dict(port=dict(mac_address=mac["address"],
+                              network_id="public_network", segment_id="nova",
+                              tenant_id=self.context.tenant_id, device_id=2))
+        with contextlib.nested(
+            self._stubs(port=port["port"], network=None, addr=dict(),
+                        mac=mac),
+            mock.patch("quark.plugin_modules.networks.find_shared_network_id")
+        ) as (port_create, find_shared):
+            find_shared.return_value = "child_net"
+            self.plugin.create_port(self.context, port)
+            find_shared.assert_called_once_with(self.context,
+                                                "public_network", "nova")
+            self.assertEqual(port_create.call_args[1]["network_id"],
+                             "child_net")
+
     def test_create_port_no_network_found(self):
         port = dict(port=dict(network_id=1, tenant_id=self.context.tenant_id,
                               device_id=2))
@@ -247,17 +267,33 @@ class TestQuarkCreatePort(test_quark_plugin.TestQuarkPlugin):
                 self.plugin.create_port(self.context, port)
 
     def test_create_port_net_at_max(self):
-        network = dict(id=1, ports=[models.Port()])
+        network = dict(id=1)
         mac = dict(address="aa:bb:cc:dd:ee:ff")
         port_name = "foobar"
         ip = dict()
         port = dict(port=dict(mac_address=mac["address"], network_id=1,
                               tenant_id=self.context.tenant_id, device_id=2,
                               name=port_name))
-        with self._stubs(port=port["port"], network=network, addr=ip, mac=mac):
+        with self._stubs(port=port["port"], network=network, addr=ip, mac=mac,
+                         port_count=1):
             with self.assertRaises(exceptions.OverQuota):
                 self.plugin.create_port(self.context, port)
 
+    def test_create_port_counts_tenant_ports_on_network(self):
+        network = dict(id=1)
+        mac = dict(address="aa:bb:cc:dd:ee:ff")
+        ip = dict()
+        port = dict(port=dict(mac_address=mac["address"], network_id=1,
+                              tenant_id=self.context.tenant_id, device_id=2))
+        with self._stubs(port=port["port"], network=network, addr=ip,
+                         mac=mac):
+            with mock.patch("quark.db.api.port_count_all") as port_count_all:
+                port_count_all.return_value = 0
+                self.plugin.create_port(self.context, port)
+                port_count_all.assert_called_once_with(
+                    self.context, network_id=[network["id"]],
+                    tenant_id=[self.context.tenant_id])
+
     def test_create_port_security_groups(self, groups=[1]):
         network = dict(id=1)
         mac = dict(address="aa:bb:cc:dd:ee:ff")
@@ -523,6 +559,68 @@ class TestQuarkDeletePort(test_quark_plugin.TestQuarkPlugin):
                 self.plugin.delete_port(self.context, 1)
 
 
+class TestQuarkGetPortsByDevice(test_quark_plugin.TestQuarkPlugin):
+    def test_get_ports_by_device(self):
+        port = models.Port()
+        port.update(dict(mac_address="aa:bb:cc:dd:ee:ff", network_id=1,
+                         tenant_id=self.context.tenant_id, device_id=2))
+        with mock.patch("quark.db.api.port_find") as port_find:
+            port_find.return_value = [port]
+            ports = self.plugin.get_ports_by_device(self.context, 2)
+            port_find.assert_called_once_with(self.context, device_id=2,
+                                              fields=None)
+            self.assertEqual(len(ports), 1)
+            self.assertEqual(ports[0]["device_id"], 2)
+
+
+class TestQuarkDeletePortsByDevice(test_quark_plugin.TestQuarkPlugin):
+    @contextlib.contextmanager
+    def _stubs(self, ports=None):
+        port_models = []
+        for port in ports or []:
+            port_model = models.Port()
+            port_model.update(port)
+            port_models.append(port_model)
+
+        db_mod = "quark.db.api"
+        ipam = "quark.ipam.QuarkIpam"
+        with contextlib.nested(
+            mock.patch("%s.port_find" % db_mod),
+            mock.patch("%s.deallocate_ports_ip_addresses" % ipam),
+            mock.patch("%s.deallocate_mac_addresses" % ipam),
+            mock.patch("%s.port_delete" % db_mod),
+            mock.patch("quark.drivers.base.BaseDriver.delete_port")
+        ) as (port_find, dealloc_ips, dealloc_macs, db_port_del,
+              driver_port_del):
+            port_find.return_value = port_models
+            yield dealloc_ips, dealloc_macs, db_port_del, driver_port_del
+
+    def test_delete_ports_by_device(self):
+        ports = [dict(id=1, network_id=1, device_id=2, backend_key="foo",
+                      mac_address="AA:BB:CC:DD:EE:FF"),
+                 dict(id=2, network_id=1, device_id=2, backend_key="bar",
+                      mac_address="AA:BB:CC:DD:EE:FE")]
+        with self._stubs(ports=ports) as (dealloc_ips, dealloc_macs,
+                                          db_port_del, driver_port_del):
+            self.plugin.delete_ports_by_device(self.context, 2)
+            self.assertEqual(dealloc_ips.call_count, 1)
+            dealloc_macs.assert_called_once_with(
+                self.context, [0xAABBCCDDEEFF, 0xAABBCCDDEEFE])
+            self.assertEqual(db_port_del.call_count, 2)
+            self.assertEqual(driver_port_del.call_count, 2)
+            driver_port_del.assert_any_call(self.context, "foo")
+            driver_port_del.assert_any_call(self.context, "bar")
+
+    def test_delete_ports_by_device_no_ports(self):
+        with self._stubs(ports=[]) as (dealloc_ips, dealloc_macs,
+                                       db_port_del, driver_port_del):
+            self.plugin.delete_ports_by_device(self.context, 2)
+            self.assertFalse(dealloc_ips.called)
+            self.assertFalse(dealloc_macs.called)
+            self.assertFalse(db_port_del.called)
+            self.assertFalse(driver_port_del.called)
+
+
 class TestQuarkDisassociatePort(test_quark_plugin.TestQuarkPlugin):
     @contextlib.contextmanager
     def _stubs(self, port=None):
@@ -53,36 +53,37 @@ class TestQuarkGetRoutes(test_quark_plugin.TestQuarkPlugin):
 
 class TestQuarkCreateRoutes(test_quark_plugin.TestQuarkPlugin):
     @contextlib.contextmanager
-    def _stubs(self, create_route, find_routes, subnet):
+    def _stubs(self, create_route, conflict, subnet):
         db_mod = "quark.db.api"
         with contextlib.nested(
             mock.patch("%s.route_create" % db_mod),
-            mock.patch("%s.route_find" % db_mod),
+            mock.patch("%s.route_find_overlapping" % db_mod),
             mock.patch("%s.subnet_find" % db_mod)
-        ) as (route_create, route_find, subnet_find):
+        ) as (route_create, route_find_overlapping, subnet_find):
             route_create.return_value = create_route
-            route_find.return_value = find_routes
+            route_find_overlapping.return_value = conflict
             subnet_find.return_value = subnet
-            yield
+            yield route_find_overlapping
 
     def test_create_route(self):
         subnet = dict(id=2)
         create_route = dict(id=1, cidr="172.16.0.0/24", gateway="172.16.0.1",
                             subnet_id=subnet["id"])
-        route = dict(id=1, cidr="0.0.0.0/0", gateway="192.168.0.1",
-                     subnet_id=subnet["id"])
-        with self._stubs(create_route=create_route, find_routes=[route],
-                         subnet=subnet):
+        with self._stubs(create_route=create_route, conflict=None,
+                         subnet=subnet) as route_find_overlapping:
             res = self.plugin.create_route(self.context,
                                            dict(route=create_route))
             for key in create_route.keys():
                 self.assertEqual(res[key], create_route[key])
+            args = route_find_overlapping.call_args[0]
+            self.assertEqual(args[1], subnet["id"])
+            self.assertEqual(str(args[2]), create_route["cidr"])
 
     def test_create_route_no_subnet_fails(self):
         subnet = dict(id=2)
         route = dict(id=1, cidr="192.168.0.0/24", gateway="192.168.0.1",
                      subnet_id=subnet["id"])
-        with self._stubs(create_route=route, find_routes=[], subnet=None):
+        with self._stubs(create_route=route, conflict=None, subnet=None):
             with self.assertRaises(exceptions.SubnetNotFound):
                 self.plugin.create_route(self.context, dict(route=route))
 
@@ -90,7 +91,7 @@ class TestQuarkCreateRoutes(test_quark_plugin.TestQuarkPlugin):
         subnet = dict(id=2)
         create_route = dict(id=1, cidr="192.168.0.0/24", gateway="192.168.0.1",
                             subnet_id=subnet["id"])
-        with self._stubs(create_route=create_route, find_routes=[],
+        with self._stubs(create_route=create_route, conflict=None,
                          subnet=subnet):
             res = self.plugin.create_route(self.context,
                                            dict(route=create_route))
@@ -102,7 +103,7 @@ class TestQuarkCreateRoutes(test_quark_plugin.TestQuarkPlugin):
                             subnet_id=subnet["id"])
         route = dict(id=1, cidr="192.168.0.0/24", gateway="192.168.0.1",
                      subnet_id=subnet["id"])
-        with self._stubs(create_route=create_route, find_routes=[route],
+        with self._stubs(create_route=create_route, conflict=route,
                          subnet=subnet):
             with self.assertRaises(quark_exceptions.RouteConflict):
                 self.plugin.create_route(self.context,
@@ -21,6 +21,7 @@ from neutron.extensions import securitygroup as sg_ext
 from oslo.config import cfg
 
 from quark.db import models
+from quark.plugin_modules import security_groups
 from quark.tests import test_quark_plugin
 
 
@@ -187,6 +188,54 @@ class TestQuarkCreateSecurityGroup(test_quark_plugin.TestQuarkPlugin):
                 self.assertTrue(group_create.called)
 
 
+class TestQuarkEnsureDefaultSecurityGroup(test_quark_plugin.TestQuarkPlugin):
+    @contextlib.contextmanager
+    def _stubs(self, exists):
+        with contextlib.nested(
+                mock.patch("quark.db.api.security_group_exists"),
+                mock.patch("quark.db.api.security_group_create"),
+                mock.patch("quark.db.api.security_group_rule_create_bulk"),
+                mock.patch(
+                    "quark.drivers.base.BaseDriver.create_security_group")
+        ) as (group_exists, group_create, rule_create, driver_create):
+            group_exists.return_value = exists
+            yield group_exists, group_create, rule_create, driver_create
+
+    def test_ensure_default_security_group_creates_group(self):
+        with self._stubs(False) as (group_exists, group_create, rule_create,
+                                    driver_create):
+            security_groups.ensure_default_security_group(self.context)
+            self.assertEqual(driver_create.call_count, 1)
+            self.assertEqual(group_create.call_count, 1)
+            self.assertEqual(rule_create.call_count, 1)
+            rules = rule_create.call_args[0][1]
+            self.assertEqual(len(rules), 6)
+            self.assertEqual(len(set(r["id"] for r in rules)), 6)
+            for rule in rules:
+                self.assertEqual(rule["security_group_id"],
+                                 security_groups.DEFAULT_SG_UUID)
+                self.assertEqual(rule["direction"], "ingress")
+
+    def test_ensure_default_security_group_cached(self):
+        with self._stubs(True) as (group_exists, group_create, rule_create,
+                                   driver_create):
+            security_groups.ensure_default_security_group(self.context)
+            security_groups.ensure_default_security_group(self.context)
+            self.assertEqual(group_exists.call_count, 1)
+            self.assertFalse(driver_create.called)
+            self.assertFalse(group_create.called)
+
+    def test_ensure_default_security_group_not_cached_when_created(self):
+        with self._stubs(False) as (group_exists, group_create, rule_create,
+                                    driver_create):
+            security_groups.ensure_default_security_group(self.context)
+            group_exists.return_value = True
+            security_groups.ensure_default_security_group(self.context)
+            security_groups.ensure_default_security_group(self.context)
+            self.assertEqual(group_exists.call_count, 2)
+            self.assertEqual(driver_create.call_count, 1)
+
+
 class TestQuarkDeleteSecurityGroup(test_quark_plugin.TestQuarkPlugin):
     @contextlib.contextmanager
     def _stubs(self, security_group=None):
@@ -267,12 +316,13 @@ class TestQuarkCreateSecurityGroupRule(test_quark_plugin.TestQuarkPlugin):
 
         with contextlib.nested(
                 mock.patch("quark.db.api.security_group_find"),
-                mock.patch("quark.db.api.security_group_rule_find"),
+                mock.patch("quark.db.api.security_group_rule_count_by_group"),
                 mock.patch("quark.db.api.security_group_rule_create")
-        ) as (group_find, rule_find, rule_create):
+        ) as (group_find, rule_count, rule_create):
             group_find.return_value = dbgroup
-            rule_find.return_value.count.return_value = group.get(
-                'port_rules', None) if group else 0
+            rule_count.return_value = {}
+            if group and group.get('rules'):
+                rule_count.return_value = {group['id']: len(group['rules'])}
             rule_create.return_value = dbrule
             yield rule_create
 
@@ -342,6 +392,99 @@ class TestQuarkCreateSecurityGroupRule(test_quark_plugin.TestQuarkPlugin):
                 group={'id': 1, 'rules': [models.SecurityGroupRule()]})
 
 
+class TestQuarkCreateSecurityGroupRuleBulk(test_quark_plugin.TestQuarkPlugin):
+    def setUp(self, *args, **kwargs):
+        super(TestQuarkCreateSecurityGroupRuleBulk, self).setUp(*args,
+                                                                **kwargs)
+        cfg.CONF.set_override('quota_security_rules_per_group', 2, 'QUOTAS')
+
+    def _rule(self, **kwargs):
+        rule = {'ethertype': 'IPv4', 'security_group_id': 1,
+                'direction': 'ingress', 'protocol': None,
+                'port_range_min': None, 'port_range_max': None,
+                'tenant_id': self.context.tenant_id}
+        rule.update(kwargs)
+        return {'security_group_rule': rule}
+
+    @contextlib.contextmanager
+    def _stubs(self, groups):
+        dbgroups = []
+        for group in groups:
+            dbgroup = models.SecurityGroup()
+            dbgroup.update(group)
+            dbgroups.append(dbgroup)
+
+        def _create_bulk(context, rules):
+            dbrules = []
+            for rule in rules:
+                dbrule = models.SecurityGroupRule()
+                dbrule.update(rule)
+                dbrule.group_id = rule['security_group_id']
+                dbrules.append(dbrule)
+            return dbrules
+
+        with contextlib.nested(
+                mock.patch("quark.db.api.security_group_find"),
+                mock.patch("quark.db.api.security_group_rule_count_by_group"),
+                mock.patch("quark.db.api.security_group_rule_create_bulk"),
+                mock.patch("quark.drivers.base.BaseDriver."
+                           "update_security_group_rules")
+        ) as (group_find, rule_count, rule_create, driver_update):
+            group_find.return_value = dbgroups
+            rule_count.return_value = dict(
+                (group['id'], len(group['rules'])) for group in groups
+                if group.get('rules'))
+            rule_create.side_effect = _create_bulk
+            yield group_find, rule_create, driver_update
+
+    def test_create_security_group_rule_bulk(self):
+        rules = [self._rule(protocol="TCP"), self._rule(protocol=17)]
+        with self._stubs([{'id': 1}]) as (group_find, rule_create,
+                                          driver_update):
+            result = self.plugin.create_security_group_rule_bulk(
+                self.context, {'security_group_rules': rules})
+            group_find.assert_called_once_with(self.context, id=[1])
+            self.assertEqual(rule_create.call_count, 1)
+            self.assertEqual(driver_update.call_count, 1)
+            added = driver_update.call_args[1]['added']
+            self.assertEqual([r['protocol'] for r in added], [6, 17])
+            self.assertEqual([r['protocol'] for r in result], [6, 17])
+            self.assertEqual([r['security_group_id'] for r in result],
+                             [1, 1])
+            self.assertNotEqual(result[0]['id'], result[1]['id'])
+
+    def test_create_security_group_rule_bulk_invalid_rule_writes_nothing(self):
+        rules = [self._rule(protocol=6), self._rule(protocol="DERP")]
+        with self._stubs([{'id': 1}]) as (group_find, rule_create,
+                                          driver_update):
+            with self.assertRaises(sg_ext.SecurityGroupRuleInvalidProtocol):
+                self.plugin.create_security_group_rule_bulk(
+                    self.context, {'security_group_rules': rules})
+            self.assertFalse(driver_update.called)
+            self.assertFalse(rule_create.called)
+
+    def test_create_security_group_rule_bulk_no_group(self):
+        rules = [self._rule(), self._rule(security_group_id=2)]
+        with self._stubs([{'id': 1}]) as (group_find, rule_create,
+                                          driver_update):
+            with self.assertRaises(sg_ext.SecurityGroupNotFound):
+                self.plugin.create_security_group_rule_bulk(
+                    self.context, {'security_group_rules': rules})
+            self.assertFalse(driver_update.called)
+            self.assertFalse(rule_create.called)
+
+    def test_create_security_group_rule_bulk_over_quota(self):
+        rules = [self._rule(), self._rule(ethertype='IPv6')]
+        group = {'id': 1, 'rules': [models.SecurityGroupRule()]}
+        with self._stubs([group]) as (group_find, rule_create,
+                                      driver_update):
+            with self.assertRaises(exceptions.OverQuota):
+                self.plugin.create_security_group_rule_bulk(
+                    self.context, {'security_group_rules': rules})
+            self.assertFalse(driver_update.called)
+            self.assertFalse(rule_create.called)
+
+
 class TestQuarkDeleteSecurityGroupRule(test_quark_plugin.TestQuarkPlugin):
     @contextlib.contextmanager
     def _stubs(self, rule={}, group={'id': 1}):
@@ -129,11 +129,12 @@ class TestQuarkCreateSubnetOverlapping(test_quark_plugin.TestQuarkPlugin):
         network.update(dict(id=1, subnets=subnet_models))
         with contextlib.nested(
             mock.patch("quark.db.api.network_find"),
-            mock.patch("quark.db.api.subnet_find"),
+            mock.patch("quark.db.api.subnet_find_overlapping"),
             mock.patch("quark.db.api.subnet_create")
-        ) as (net_find, subnet_find, subnet_create):
+        ) as (net_find, subnet_find_overlapping, subnet_create):
             net_find.return_value = network
-            subnet_find.return_value = subnet_models
+            subnet_find_overlapping.return_value = (subnet_models or
+                                                    [None])[0]
             subnet_create.return_value = models.Subnet(
                 network=models.Network(),
                 cidr="192.168.1.1/24")
@@ -414,6 +415,8 @@ class TestQuarkCreateSubnet(test_quark_plugin.TestQuarkPlugin):
             self.assertEqual(subnet_create.call_count, 1)
             self.assertEqual(dns_create.call_count, 0)
             self.assertEqual(route_create.call_count, 1)
+            self.assertEqual(subnet_create.call_args[1]["gateway_ip"],
+                             "172.16.0.4")
             for key in subnet["subnet"].keys():
                 if key == "host_routes":
                     res_tuples = [(r["destination"], r["nexthop"])
@@ -521,7 +524,11 @@ class TestQuarkUpdateSubnet(test_quark_plugin.TestQuarkPlugin):
                 new_subnet_mod["routes"] = new_routes
             if new_dns_servers:
                 new_subnet_mod["dns_nameservers"] = new_dns_servers
-            subnet_update.return_value = new_subnet_mod
+
+            def _subnet_update(context, subnet, **kwargs):
+                new_subnet_mod.update(kwargs)
+                return new_subnet_mod
+            subnet_update.side_effect = _subnet_update
             yield dns_create, route_update, route_create
 
     def test_update_subnet_not_found(self):
@@ -634,6 +641,26 @@ class TestQuarkUpdateSubnet(test_quark_plugin.TestQuarkPlugin):
                              "4.3.2.1")
             self.assertEqual(res["gateway_ip"], "4.3.2.1")
 
+    def test_update_subnet_gateway_ip_with_other_routes_in_args(self):
+        new_routes = [dict(destination="10.0.0.0/24", nexthop="1.1.1.1")]
+        with self._stubs(
+            host_routes=self.DEFAULT_ROUTE,
+            new_routes=new_routes + [dict(destination="0.0.0.0/0",
+                                          nexthop="1.2.3.4")]
+        ) as (dns_create, route_update, route_create):
+            req = dict(subnet=dict(host_routes=new_routes,
+                                   gateway_ip="1.2.3.4"))
+            res = self.plugin.update_subnet(self.context, 1, req)
+            self.assertEqual(route_update.call_count, 0)
+            self.assertEqual(route_create.call_count, 2)
+            route_create.assert_any_call(self.context, cidr="0.0.0.0/0",
+                                         gateway="1.2.3.4")
+            self.assertEqual(res["gateway_ip"], "1.2.3.4")
+            res_tuples = [(r["destination"], r["nexthop"])
+                          for r in res["host_routes"]]
+            self.assertIn(("0.0.0.0/0", "1.2.3.4"), res_tuples)
+            self.assertIn(("10.0.0.0/24", "1.1.1.1"), res_tuples)
+
 
 class TestQuarkDeleteSubnet(test_quark_plugin.TestQuarkPlugin):
     @contextlib.contextmanager
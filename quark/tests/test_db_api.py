@@ -13,11 +13,19 @@
 # License for the specific language governing permissions and limitations
 #  under the License.
 
+import datetime
+import json
+
 import mock
+import netaddr
 from neutron.db import api as neutron_db_api
+from neutron.openstack.common.db.sqlalchemy import session as neutron_session
 from oslo.config import cfg
 
 from quark.db import api as db_api
+from quark.db import models
+from quark import exceptions as quark_exc
+from quark import network_strategy
 
 from quark.tests import test_base
 
@@ -45,3 +53,472 @@ class TestDBAPI(test_base.TestBase):
         query_obj = self.context.session.query.return_value
         filter_fn = query_obj.filter
         self.assertEqual(filter_fn.call_count, 1)
+
+    def test_network_info_find_no_devices(self):
+        with mock.patch("quark.db.api.port_find") as port_find:
+            res = db_api.network_info_find(self.context, [])
+            self.assertFalse(port_find.called)
+            self.assertEqual(res, ([], [], []))
+
+
+class TestDBAPIChangeLog(test_base.TestBase):
+    def setUp(self):
+        super(TestDBAPIChangeLog, self).setUp()
+
+        cfg.CONF.set_override('connection', 'sqlite://', 'database')
+        neutron_db_api.configure_db()
+        models.BASEV2.metadata.create_all(neutron_session._ENGINE)
+
+    def tearDown(self):
+        neutron_db_api.clear_db()
+
+    def test_flush_records_changes(self):
+        route = db_api.route_create(self.context, cidr="0.0.0.0/0",
+                                    gateway="192.168.0.1")
+        self.context.session.flush()
+        db_api.route_update(self.context, route, gateway="192.168.0.2")
+        self.context.session.flush()
+
+        changes = db_api.change_find(self.context, since=0,
+                                     scope=db_api.ALL)
+        self.assertEqual([c["action"] for c in changes],
+                         ["create", "update"])
+        for change in changes:
+            self.assertEqual(change["resource"], "route")
+            self.assertEqual(change["resource_id"], route["id"])
+            self.assertEqual(change["tenant_id"], self.context.tenant_id)
+
+        changes = db_api.change_find(self.context, since=changes[0]["id"],
+                                     scope=db_api.ALL)
+        self.assertEqual(len(changes), 1)
+
+    def test_change_prune(self):
+        old = models.ChangeLog(resource="route", resource_id="r1",
+                               action="delete",
+                               created_at=datetime.datetime(2013, 1, 1))
+        new = models.ChangeLog(resource="route", resource_id="r2",
+                               action="delete",
+                               created_at=datetime.datetime(2013, 3, 1))
+        self.context.session.add_all([old, new])
+        self.context.session.flush()
+
+        pruned = db_api.change_prune(self.context,
+                                     datetime.datetime(2013, 2, 1))
+        self.assertEqual(pruned, 1)
+        changes = db_api.change_find(self.context, scope=db_api.ALL)
+        self.assertEqual([c["resource_id"] for c in changes], ["r2"])
+
+
+class TestDBAPIRevisions(test_base.TestBase):
+    def setUp(self):
+        super(TestDBAPIRevisions, self).setUp()
+
+        cfg.CONF.set_override('connection', 'sqlite://', 'database')
+        neutron_db_api.configure_db()
+        models.BASEV2.metadata.create_all(neutron_session._ENGINE)
+
+    def tearDown(self):
+        neutron_db_api.clear_db()
+
+    def _etag(self, route_id):
+        return db_api.revision_etag(self.context, models.Route,
+                                    id=[route_id])
+
+    def test_update_bumps_revision_and_etag(self):
+        route = db_api.route_create(self.context, cidr="0.0.0.0/0",
+                                    gateway="192.168.0.1")
+        self.context.session.flush()
+        self.assertEqual(route["revision"], 1)
+        etag = self._etag(route["id"])
+        self.assertIsNotNone(etag)
+
+        db_api.route_update(self.context, route, gateway="192.168.0.2")
+        self.context.session.flush()
+        self.context.session.refresh(route)
+        self.assertEqual(route["revision"], 2)
+        self.assertNotEqual(self._etag(route["id"]), etag)
+
+    def test_unchanged_etag_is_stable(self):
+        route = db_api.route_create(self.context, cidr="0.0.0.0/0",
+                                    gateway="192.168.0.1")
+        self.context.session.flush()
+        self.assertEqual(self._etag(route["id"]), self._etag(route["id"]))
+
+    def test_missing_id_has_no_etag(self):
+        self.assertIsNone(self._etag("missing"))
+
+    def _revision(self, model, obj_id):
+        return self.context.session.query(model.revision).filter(
+            model.id == obj_id).scalar()
+
+    def _network(self, net_id="net"):
+        db_api.network_create(self.context, id=net_id, name=net_id,
+                              tenant_id=self.context.tenant_id)
+        self.context.session.flush()
+
+    def test_subnet_create_and_bulk_delete_bump_network(self):
+        self._network()
+        subnet = db_api.subnet_create(self.context, network_id="net",
+                                      cidr="10.0.0.0/24")
+        self.context.session.flush()
+        self.assertEqual(self._revision(models.Network, "net"), 2)
+
+        db_api.subnet_bulk_delete(self.context, [subnet["id"]])
+        self.context.session.flush()
+        self.assertEqual(self._revision(models.Network, "net"), 3)
+
+    def test_ip_policy_change_bumps_subnets(self):
+        self._network()
+        subnet = db_api.subnet_create(self.context, network_id="net",
+                                      cidr="10.0.0.0/24")
+        self.context.session.flush()
+        policy = db_api.ip_policy_create(
+            self.context, network_id="net",
+            exclude=netaddr.IPSet(["10.0.0.0/30"]))
+        self.context.session.flush()
+        self.assertEqual(self._revision(models.Subnet, subnet["id"]), 2)
+
+        policy["exclude"][0]["prefix"] = 31
+        self.context.session.flush()
+        self.assertEqual(self._revision(models.Subnet, subnet["id"]), 3)
+
+    def test_etag_follows_strategy(self):
+        self._network("child_net")
+        subnet = db_api.subnet_create(self.context, network_id="child_net",
+                                      cidr="10.0.0.0/24")
+        self.context.session.flush()
+        etag = db_api.revision_etag(self.context, models.Subnet,
+                                    id=[subnet["id"]])
+
+        strategy = network_strategy.JSONStrategy(json.dumps(
+            {"public_network": {"children": {"nova": "child_net"}}}))
+        with mock.patch("quark.db.api.STRATEGY", strategy):
+            self.assertNotEqual(db_api.revision_etag(
+                self.context, models.Subnet, id=[subnet["id"]]), etag)
+
+
+class TestDBAPISubnetOverlap(test_base.TestBase):
+    def setUp(self):
+        super(TestDBAPISubnetOverlap, self).setUp()
+
+        cfg.CONF.set_override('connection', 'sqlite://', 'database')
+        neutron_db_api.configure_db()
+        models.BASEV2.metadata.create_all(neutron_session._ENGINE)
+        for cidr in ["10.0.0.0/24", "10.0.10.0/24", "::1000/120"]:
+            db_api.subnet_create(self.context, network_id="net", cidr=cidr)
+        self.context.session.flush()
+
+    def tearDown(self):
+        neutron_db_api.clear_db()
+
+    def _overlapping(self, cidr, network_id="net"):
+        subnet = db_api.subnet_find_overlapping(self.context, network_id,
+                                                cidr)
+        return subnet and subnet.cidr
+
+    def test_overlapping(self):
+        self.assertEqual(self._overlapping("10.0.0.128/25"), "10.0.0.0/24")
+        self.assertEqual(self._overlapping("10.0.10.0/23"), "10.0.10.0/24")
+        self.assertIsNotNone(self._overlapping("10.0.0.0/8"))
+        self.assertEqual(self._overlapping("::1000/112"), "::1000/120")
+
+    def test_not_overlapping(self):
+        self.assertIsNone(self._overlapping("10.0.1.0/24"))
+        self.assertIsNone(self._overlapping("10.0.9.0/24"))
+        # Only compared numerically when the stored bounds are padded
+        self.assertIsNone(self._overlapping("::200/120"))
+
+    def test_other_network_or_version(self):
+        self.assertIsNone(self._overlapping("10.0.0.0/24", "other"))
+        self.assertIsNone(self._overlapping("::ffff:0:0/96"))
+
+
+class TestDBAPIRouteOverlap(test_base.TestBase):
+    def setUp(self):
+        super(TestDBAPIRouteOverlap, self).setUp()
+
+        cfg.CONF.set_override('connection', 'sqlite://', 'database')
+        neutron_db_api.configure_db()
+        models.BASEV2.metadata.create_all(neutron_session._ENGINE)
+        for cidr in ["0.0.0.0/0", "10.0.0.0/24", "172.16.0.0/16"]:
+            db_api.route_create(self.context, subnet_id="subnet", cidr=cidr,
+                                gateway="192.168.0.1")
+        self.context.session.flush()
+
+    def tearDown(self):
+        neutron_db_api.clear_db()
+
+    def _overlapping(self, cidr, subnet_id="subnet"):
+        route = db_api.route_find_overlapping(self.context, subnet_id, cidr)
+        return route and route.cidr
+
+    def test_route_bounds(self):
+        route = db_api.route_find(self.context, cidr="10.0.0.0/24",
+                                  scope=db_api.ONE)
+        self.assertEqual(route.prefix, 24)
+        self.assertEqual(route.first_ip,
+                         netaddr.IPAddress("10.0.0.0").ipv6().value)
+        self.assertEqual(route.last_ip,
+                         netaddr.IPAddress("10.0.0.255").ipv6().value)
+
+    def test_contained_and_containing(self):
+        self.assertEqual(self._overlapping("10.0.0.128/25"), "10.0.0.0/24")
+        self.assertEqual(self._overlapping("10.0.0.0/8"), "10.0.0.0/24")
+        self.assertEqual(self._overlapping("172.16.5.0/24"),
+                         "172.16.0.0/16")
+
+    def test_default_route_does_not_conflict(self):
+        self.assertIsNone(self._overlapping("192.168.0.0/24"))
+        self.assertIsNone(self._overlapping("10.0.1.0/24"))
+
+    def test_other_subnet(self):
+        self.assertIsNone(self._overlapping("10.0.0.0/24", "other"))
+
+
+class TestDBAPISubnetGateway(test_base.TestBase):
+    def setUp(self):
+        super(TestDBAPISubnetGateway, self).setUp()
+
+        cfg.CONF.set_override('connection', 'sqlite://', 'database')
+        neutron_db_api.configure_db()
+        models.BASEV2.metadata.create_all(neutron_session._ENGINE)
+        self.subnet = db_api.subnet_create(self.context, network_id="net",
+                                           cidr="192.168.0.0/24")
+        self.context.session.flush()
+
+    def tearDown(self):
+        neutron_db_api.clear_db()
+
+    def _route_create(self, cidr, gateway):
+        route = db_api.route_create(self.context, cidr=cidr, gateway=gateway,
+                                    subnet_id=self.subnet["id"])
+        self.context.session.flush()
+        return route
+
+    def test_default_route_sets_gateway(self):
+        self._route_create("10.0.0.0/8", "192.168.0.2")
+        self.assertIsNone(self.subnet["gateway_ip"])
+        self._route_create("0.0.0.0/0", "192.168.0.1")
+        self.assertEqual(self.subnet["gateway_ip"], "192.168.0.1")
+
+    def test_route_update(self):
+        route = self._route_create("0.0.0.0/0", "192.168.0.1")
+        db_api.route_update(self.context, route, gateway="192.168.0.3")
+        self.assertEqual(self.subnet["gateway_ip"], "192.168.0.3")
+        db_api.route_update(self.context, route, cidr="10.0.0.0/8")
+        self.assertIsNone(self.subnet["gateway_ip"])
+
+    def test_route_delete(self):
+        route = self._route_create("0.0.0.0/0", "192.168.0.1")
+        db_api.route_delete(self.context, route)
+        self.context.session.flush()
+        self.context.session.expire_all()
+        self.assertIsNone(self.subnet["gateway_ip"])
+
+
+class TestDBAPISecurityGroups(test_base.TestBase):
+    def setUp(self):
+        super(TestDBAPISecurityGroups, self).setUp()
+
+        cfg.CONF.set_override('connection', 'sqlite://', 'database')
+        neutron_db_api.configure_db()
+        models.BASEV2.metadata.create_all(neutron_session._ENGINE)
+        self.group = db_api.security_group_create(
+            self.context, id="group", name="foo", description="")
+        self.context.session.flush()
+
+    def tearDown(self):
+        neutron_db_api.clear_db()
+
+    def test_security_group_rule_create_bulk(self):
+        rules = [dict(id="rule%d" % i, security_group_id="group",
+                      tenant_id=self.context.tenant_id, direction="ingress",
+                      ethertype="IPv4", protocol=protocol)
+                 for i, protocol in enumerate((1, 6, 17))]
+        created = db_api.security_group_rule_create_bulk(self.context, rules)
+        self.context.session.flush()
+
+        self.assertEqual([r["id"] for r in created],
+                         ["rule0", "rule1", "rule2"])
+        found = db_api.security_group_rule_find(self.context)
+        self.assertEqual(sorted(r["protocol"] for r in found), [1, 6, 17])
+        self.assertEqual(set(r["group_id"] for r in found), set(["group"]))
+
+    def test_security_group_exists(self):
+        self.assertTrue(db_api.security_group_exists(self.context, "group"))
+        self.assertFalse(db_api.security_group_exists(self.context, "other"))
+
+
+class TestDBAPINetworkFindStrategy(test_base.TestBase):
+    def setUp(self):
+        super(TestDBAPINetworkFindStrategy, self).setUp()
+
+        cfg.CONF.set_override('connection', 'sqlite://', 'database')
+        neutron_db_api.configure_db()
+        models.BASEV2.metadata.create_all(neutron_session._ENGINE)
+        for net_id, tenant_id in (("public_network", "provider"),
+                                  ("child_net", "provider"),
+                                  ("tenant_net", "fake")):
+            self.context.session.add(models.Network(id=net_id, name=net_id,
+                                                    tenant_id=tenant_id))
+        self.context.session.flush()
+
+    def tearDown(self):
+        neutron_db_api.clear_db()
+
+    def test_network_find_strategy(self):
+        strategy = network_strategy.JSONStrategy(json.dumps(
+            {"public_network": {"children": {"nova": "child_net"}}}))
+        with mock.patch("quark.db.api.STRATEGY", strategy):
+            nets = db_api.network_find_strategy(self.context)
+        self.assertEqual(sorted(net["id"] for net in nets),
+                         ["child_net", "public_network"])
+
+    def test_network_find_strategy_empty(self):
+        strategy = network_strategy.JSONStrategy("{}")
+        with mock.patch("quark.db.api.STRATEGY", strategy):
+            self.assertEqual(db_api.network_find_strategy(self.context), [])
+
+
+class TestDBAPISubnetBulkDelete(test_base.TestBase):
+    def setUp(self):
+        super(TestDBAPISubnetBulkDelete, self).setUp()
+
+        cfg.CONF.set_override('connection', 'sqlite://', 'database')
+        neutron_db_api.configure_db()
+        models.BASEV2.metadata.create_all(neutron_session._ENGINE)
+        self.subnet_ids = []
+        for cidr in ("192.168.0.0/24", "192.168.1.0/24"):
+            subnet = db_api.subnet_create(self.context, network_id="net",
+                                          cidr=cidr)
+            self.context.session.flush()
+            db_api.route_create(self.context, cidr="0.0.0.0/0",
+                                gateway="192.168.0.1",
+                                subnet_id=subnet["id"])
+            db_api.dns_create(self.context, subnet_id=subnet["id"],
+                              ip=netaddr.IPAddress("8.8.8.8"))
+            db_api.ip_policy_create(
+                self.context, subnet_id=subnet["id"],
+                exclude=netaddr.IPSet([subnet["cidr"]]))
+            self.subnet_ids.append(subnet["id"])
+        self.context.session.flush()
+
+    def tearDown(self):
+        neutron_db_api.clear_db()
+
+    def test_subnet_ids_for_network(self):
+        self.assertEqual(
+            sorted(db_api.subnet_ids_for_network(self.context, "net")),
+            sorted(self.subnet_ids))
+        self.assertEqual(db_api.subnet_ids_for_network(self.context, "foo"),
+                         [])
+
+    def test_subnet_find_in_use(self):
+        self.assertIsNone(db_api.subnet_find_in_use(self.context,
+                                                    self.subnet_ids))
+        address = db_api.ip_address_create(
+            self.context, address=netaddr.IPAddress("192.168.1.5"),
+            subnet_id=self.subnet_ids[1], network_id="net")
+        self.context.session.flush()
+        self.assertEqual(db_api.subnet_find_in_use(self.context,
+                                                   self.subnet_ids),
+                         self.subnet_ids[1])
+        address["_deallocated"] = 1
+        self.context.session.flush()
+        self.assertIsNone(db_api.subnet_find_in_use(self.context,
+                                                    self.subnet_ids))
+
+    def test_subnet_bulk_delete(self):
+        count = db_api.subnet_bulk_delete(self.context, self.subnet_ids)
+        self.context.session.flush()
+        self.assertEqual(count, 2)
+        session = self.context.session
+        for model in (models.Subnet, models.Route, models.DNSNameserver,
+                      models.IPPolicy, models.IPPolicyRule):
+            self.assertEqual(session.query(model).count(), 0)
+        changes = session.query(models.ChangeLog).filter(
+            models.ChangeLog.action == "delete").all()
+        self.assertEqual(sorted(c.resource for c in changes),
+                         ["route", "route", "subnet", "subnet"])
+
+
+class TestDBAPIModelQuery(test_base.TestBase):
+    def test_filters_for_model(self):
+        filters = db_api._model_query(
+            self.context, models.Port,
+            {"name": ["foo"], "device_id": ["dev"], "network_id": None})
+        self.assertEqual(len(filters), 3)
+        self.assertIs(db_api._filters_for_model(models.Port),
+                      db_api._filters_for_model(models.Port))
+
+    def test_version_filter(self):
+        filters = db_api._model_query(self.context, models.Subnet,
+                                      {"version": 4})
+        self.assertTrue(any("ip_version" in str(f) for f in filters))
+
+    def test_deallocated_false(self):
+        filters = db_api._model_query(self.context, models.IPAddress,
+                                      {"_deallocated": False})
+        self.assertEqual(len(filters), 2)
+
+    def test_unsupported_filter(self):
+        with self.assertRaises(quark_exc.UnsupportedFilter):
+            db_api._model_query(self.context, models.Subnet,
+                                {"mac_address": ["aa:bb:cc:dd:ee:ff"]})
+
+    def test_unsupported_filter_empty_value(self):
+        filters = db_api._model_query(self.context, models.Subnet,
+                                      {"mac_address": None, "device_id": []})
+        self.assertEqual(len(filters), 1)
+
+    def test_unknown_key_ignored(self):
+        filters = db_api._model_query(self.context, models.Port,
+                                      {"device_owner": ["network:dhcp"]})
+        self.assertEqual(len(filters), 1)
+
+    def test_shared(self):
+        self.assertEqual(db_api._model_query(self.context, models.Network,
+                                             {"shared": [True]}), [])
+
+
+class TestDBAPIBackendOperations(test_base.TestBase):
+    def setUp(self):
+        super(TestDBAPIBackendOperations, self).setUp()
+
+        cfg.CONF.set_override('connection', 'sqlite://', 'database')
+        neutron_db_api.configure_db()
+        models.BASEV2.metadata.create_all(neutron_session._ENGINE)
+
+    def tearDown(self):
+        neutron_db_api.clear_db()
+
+    def _op(self, resource_id, **kwargs):
+        key = "%s:%s" % (resource_id, kwargs.pop("key", ""))
+        return db_api.backend_operation_create(
+            self.context, idempotency_key=key, resource_id=resource_id,
+            operation="delete_port", **kwargs)
+
+    def test_record_skips_recorded(self):
+        first = db_api.backend_operation_record(
+            self.context, idempotency_key="delete_port:foo",
+            resource_id="foo", operation="delete_port")
+        self.assertIsNotNone(first)
+        self.assertIsNone(db_api.backend_operation_record(
+            self.context, idempotency_key="delete_port:foo",
+            resource_id="foo", operation="delete_port"))
+        ops = db_api.backend_operation_find(self.context, resource_id="foo")
+        self.assertEqual([op["id"] for op in ops], [first["id"]])
+
+    def test_find_due_heads_only(self):
+        later = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        parked = self._op("parked", parked_at=datetime.datetime(2013, 1, 1))
+        after_parked = self._op("parked", key="next")
+        first = self._op("busy")
+        self._op("busy", key="next")
+        self._op("waiting", next_attempt_at=later)
+        self.context.session.flush()
+
+        due = db_api.backend_operation_find_due(self.context)
+        self.assertEqual([op["id"] for op in due],
+                         [after_parked["id"], first["id"]])
+        self.assertNotIn(parked["id"], [op["id"] for op in due])
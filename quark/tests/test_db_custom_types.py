@@ -18,6 +18,7 @@ from quark.db import custom_types
 from quark.tests import test_base
 
 from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy import types
 
 
 class TestDBCustomTypesINET(test_base.TestBase):
@@ -29,7 +30,8 @@ class TestDBCustomTypesINET(test_base.TestBase):
 
     def test_inet_load_dialect_impl(self):
         dialect = self.inet.load_dialect_impl(mysql.dialect())
-        self.assertEqual(type(dialect), type(custom_types.INET.impl()))
+        self.assertIsInstance(dialect, types.Numeric)
+        self.assertEqual(dialect.precision, 39)
 
     def test_inet_load_dialect_impl_sqlite(self):
         dialect = self.inet.load_dialect_impl(sqlite.dialect())
@@ -40,8 +42,13 @@ class TestDBCustomTypesINET(test_base.TestBase):
         self.assertIsNone(bind)
 
     def test_process_bind_param_with_value(self):
-        bind = self.inet.process_bind_param("foo", sqlite.dialect())
-        self.assertEqual(bind, "foo")
+        bind = self.inet.process_bind_param(1, sqlite.dialect())
+        self.assertEqual(bind, "0" * 38 + "1")
+
+    def test_process_bind_param_sqlite_sorts_numerically(self):
+        small = self.inet.process_bind_param(767, sqlite.dialect())
+        big = self.inet.process_bind_param(4096, sqlite.dialect())
+        self.assertTrue(small < big)
 
     def test_process_bind_param_with_value_not_sqlite(self):
         bind = self.inet.process_bind_param("foo", mysql.dialect())
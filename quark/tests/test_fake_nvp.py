@@ -0,0 +1,97 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+#  under the License.
+
+import aiclib
+import neutron.extensions.securitygroup as sg_ext
+
+import quark.drivers.nvp_driver
+from quark.tests import fake_nvp
+from quark.tests import test_base
+
+
+class TestNVPDriverAgainstFake(test_base.TestBase):
+    def setUp(self):
+        super(TestNVPDriverAgainstFake, self).setUp()
+        self.controller = fake_nvp.FakeController()
+        self.driver = quark.drivers.nvp_driver.NVPDriver()
+        self.controller.install(self.driver, controllers=2)
+        self.driver.limits.update(max_rules_per_group=30,
+                                  max_rules_per_port=30)
+        self.net_id = "12345678-1234-1234-1234-123412341234"
+        self.driver.create_network(self.context, "net",
+                                   network_id=self.net_id)
+
+    def test_port_lifecycle(self):
+        port = self.driver.create_port(self.context, self.net_id, "port1")
+        self.assertIn(port["uuid"], self.controller.lports)
+        self.assertEqual(port["lswitch"],
+                         self.controller.lports[port["uuid"]]["lswitch"])
+        self.driver.update_port(self.context, port["uuid"], status=False)
+        self.assertFalse(
+            self.controller.lports[port["uuid"]]["admin_status_enabled"])
+        self.driver.delete_port(self.context, port["uuid"])
+        self.assertEqual(self.controller.lports, {})
+
+    def test_create_port_round_trips(self):
+        self.driver.create_security_group(self.context, "sg",
+                                          group_id="group1")
+        self.controller.reset_counts()
+        self.driver.create_port(self.context, self.net_id, "port1",
+                                security_groups=["group1"])
+        self.driver.create_port(self.context, self.net_id, "port2",
+                                security_groups=["group1"])
+        # The profile lookup is cached after the first port
+        self.assertEqual(
+            self.controller.calls[("securityprofile", "query")], 1)
+        self.assertEqual(self.controller.calls[("lswitch", "query")], 2)
+        self.assertEqual(self.controller.calls[("lswitch_port", "create")],
+                         2)
+
+    def test_requests_spread_over_controllers(self):
+        self.controller.reset_counts()
+        for i in xrange(4):
+            self.driver.create_port(self.context, self.net_id, "port%d" % i)
+        self.assertEqual(self.controller.controller_calls["controller0"],
+                         self.controller.controller_calls["controller1"])
+
+    def test_reads_fail_over(self):
+        port = self.driver.create_port(self.context, self.net_id, "port1")
+        self.driver.lswitch_cache.clear()
+        self.controller.error_rate = 1
+        with self.assertRaises(aiclib.core.AICException):
+            self.driver.update_port(self.context, port["uuid"])
+        # Both controllers were tried and marked down
+        for conn in self.driver.nvp_connections:
+            self.assertIn("down_until", conn)
+
+    def test_port_limit(self):
+        self.controller.max_ports_per_switch = 1
+        self.driver.limits["max_ports_per_switch"] = 1
+        first = self.driver.create_port(self.context, self.net_id, "port1")
+        second = self.driver.create_port(self.context, self.net_id, "port2")
+        self.assertNotEqual(first["lswitch"], second["lswitch"])
+
+    def test_security_group_rules(self):
+        self.driver.create_security_group(self.context, "sg",
+                                          group_id="group1")
+        rule = {"ethertype": "IPv4", "direction": "ingress",
+                "protocol": 6}
+        self.driver.create_security_group_rule(self.context, "group1", rule)
+        with self.assertRaises(sg_ext.SecurityGroupRuleExists):
+            self.driver.create_security_group_rule(self.context, "group1",
+                                                   rule)
+        self.driver.delete_security_group_rule(self.context, "group1", rule)
+        self.driver.delete_security_group(self.context, "group1")
+        self.assertEqual(self.controller.profiles, {})
@@ -0,0 +1,109 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+#  under the License.
+
+import mock
+from oslo.config import cfg
+
+from quark.drivers import base
+from quark.drivers import instrumentation
+from quark.drivers import nvp_driver
+from quark.tests import fake_nvp
+from quark.tests import test_base
+from quark import utils
+
+
+class TestInstrumentation(test_base.TestBase):
+    def setUp(self):
+        super(TestInstrumentation, self).setUp()
+        cfg.CONF.set_override("instrument_drivers", True, "QUARK")
+        cfg.CONF.set_override("instrumentation_log_interval", 0, "QUARK")
+        instrumentation.STATS.reset()
+
+    def tearDown(self):
+        cfg.CONF.clear_override("instrument_drivers", "QUARK")
+        cfg.CONF.clear_override("instrumentation_log_interval", "QUARK")
+        instrumentation.STATS.reset()
+
+    def _metric(self, operation, name):
+        return instrumentation.STATS.snapshot()[(operation, name)]
+
+    def test_histogram(self):
+        metric = instrumentation.Metric()
+        metric.record(0.5)
+        metric.record(7)
+        metric.record(10000, error=True)
+        data = metric.to_dict()
+        self.assertEqual(data["count"], 3)
+        self.assertEqual(data["errors"], 1)
+        self.assertEqual(data["histogram"][0], 1)
+        self.assertEqual(data["histogram"][3], 1)
+        self.assertEqual(data["histogram"][-1], 1)
+
+    def test_wrap_driver_disabled(self):
+        cfg.CONF.set_override("instrument_drivers", False, "QUARK")
+        driver = base.BaseDriver()
+        self.assertIs(instrumentation.wrap_driver(driver), driver)
+
+    def test_driver_calls_tagged_with_operation(self):
+        driver = instrumentation.wrap_driver(base.BaseDriver())
+        with instrumentation.operation("create_port"):
+            driver.create_port(self.context, 1, 2)
+        self.assertEqual(
+            self._metric("create_port", "driver.create_port")["count"], 1)
+
+    def test_driver_errors_counted(self):
+        driver = instrumentation.wrap_driver(base.BaseDriver())
+        with mock.patch.object(base.BaseDriver, "delete_port") as delete:
+            delete.side_effect = ValueError
+            with self.assertRaises(ValueError):
+                driver.delete_port(self.context, 1)
+        metric = self._metric("unknown", "driver.delete_port")
+        self.assertEqual(metric["errors"], 1)
+
+    def test_outermost_operation_wins(self):
+        with instrumentation.operation("delete_ports_by_device"):
+            with instrumentation.operation("delete_port"):
+                self.assertEqual(instrumentation.current_operation(),
+                                 "delete_ports_by_device")
+        self.assertEqual(instrumentation.current_operation(), "unknown")
+
+    def test_operation_carried_to_pool(self):
+        with instrumentation.operation("delete_ports_by_device"):
+            ops = utils.pool_map(
+                lambda _: instrumentation.current_operation(), [1, 2])
+        self.assertEqual(ops, ["delete_ports_by_device"] * 2)
+
+    def test_tag_operations(self):
+        @instrumentation.tag_operations
+        class Plugin(object):
+            def create_port(self):
+                return instrumentation.current_operation()
+
+        self.assertEqual(Plugin().create_port(), "create_port")
+
+    def test_controller_round_trips(self):
+        controller = fake_nvp.FakeController()
+        driver = nvp_driver.NVPDriver()
+        controller.install(driver)
+        with instrumentation.operation("create_network"):
+            driver.create_network(self.context, "net", network_id="net1")
+        with instrumentation.operation("create_port"):
+            driver.create_port(self.context, "net1", "port1")
+        self.assertEqual(
+            self._metric("create_network", "lswitch.create")["count"], 1)
+        self.assertEqual(
+            self._metric("create_port", "lswitch.query")["count"], 1)
+        self.assertEqual(
+            self._metric("create_port", "lswitch_port.create")["count"], 1)
@@ -193,6 +193,27 @@ class QuarkIPAddressDeallocation(QuarkIpamBaseTest):
         self.assertFalse(addr["deallocated"])
 
 
+class QuarkPortsIPAddressDeallocation(QuarkIpamBaseTest):
+    def test_deallocate_ports_ip_addresses(self):
+        port1 = dict(id=1, ip_addresses=[])
+        port2 = dict(id=2, ip_addresses=[])
+        shared = dict(id=1, ports=[port1, port2])
+        other = dict(id=2, ports=[port2, dict(id=3)])
+        port1["ip_addresses"].append(shared)
+        port2["ip_addresses"].extend([shared, other])
+        with mock.patch("quark.db.api.ip_address_bulk_deallocate") as dealloc:
+            self.ipam.deallocate_ports_ip_addresses(self.context,
+                                                    [port1, port2])
+            dealloc.assert_called_once_with(self.context, [1])
+        self.assertEqual(port1["ip_addresses"], [])
+        self.assertEqual(port2["ip_addresses"], [])
+
+    def test_deallocate_mac_addresses(self):
+        with mock.patch("quark.db.api.mac_address_bulk_deallocate") as dealloc:
+            self.ipam.deallocate_mac_addresses(self.context, [1, 2])
+            dealloc.assert_called_once_with(self.context, [1, 2])
+
+
 class QuarkNewIPAddressAllocation(QuarkIpamBaseTest):
     @contextlib.contextmanager
     def _stubs(self, addresses=None, subnets=None):
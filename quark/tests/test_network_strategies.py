@@ -14,6 +14,9 @@
 #    under the License.
 
 import json
+import os
+import tempfile
+
 from neutron.common import exceptions
 from oslo.config import cfg
 
@@ -78,3 +81,54 @@ class TestJSONStrategy(test_base.TestBase):
         with self.assertRaises(exceptions.NetworkNotFound):
             json_strategy.best_match_network_id(self.context,
                                                 "public_network", "derpa")
+
+
+class TestJSONStrategyFile(test_base.TestBase):
+    def setUp(self):
+        self.context = None
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self._write({"public_network": {"children": {"nova": "child_net"}}},
+                    100)
+        cfg.CONF.set_override("net_strategy_file", self.path, "QUARK")
+
+    def tearDown(self):
+        cfg.CONF.clear_override("net_strategy_file", "QUARK")
+        os.unlink(self.path)
+
+    def _write(self, strategy, mtime):
+        with open(self.path, "w") as strategy_file:
+            strategy_file.write(json.dumps(strategy))
+        os.utime(self.path, (mtime, mtime))
+
+    def test_loads_file(self):
+        json_strategy = network_strategy.JSONStrategy()
+        self.assertEqual(json_strategy.get_parent_network("child_net"),
+                         "public_network")
+        self.assertEqual(json_strategy.best_match_network_id(
+            self.context, "public_network", "nova"), "child_net")
+
+    def test_reload_unchanged(self):
+        json_strategy = network_strategy.JSONStrategy()
+        self.assertFalse(json_strategy.reload())
+
+    def test_reload_changed(self):
+        json_strategy = network_strategy.JSONStrategy()
+        self._write({"other_network": {"children": {"nova": "other_child"}}},
+                    200)
+        self.assertTrue(json_strategy.reload())
+        self.assertFalse(json_strategy.is_parent_network("public_network"))
+        self.assertTrue(json_strategy.is_parent_network("other_network"))
+        self.assertEqual(json_strategy.get_parent_network("other_child"),
+                         "other_network")
+        self.assertEqual(json_strategy.get_parent_network("child_net"),
+                         "child_net")
+
+    def test_reload_bad_file_keeps_strategy(self):
+        json_strategy = network_strategy.JSONStrategy()
+        with open(self.path, "w") as strategy_file:
+            strategy_file.write("{not json")
+        os.utime(self.path, (200, 200))
+        with self.assertRaises(ValueError):
+            json_strategy.reload()
+        self.assertTrue(json_strategy.is_parent_network("public_network"))
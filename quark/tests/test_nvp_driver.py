@@ -14,6 +14,8 @@
 #  under the License.
 
 import contextlib
+
+import eventlet
 import mock
 
 from neutron.db import api as db_api
@@ -333,6 +335,32 @@ class TestNVPDriverCreatePort(TestNVPDriver):
                 admin_status_enabled.call_args
             self.assertTrue(True in status_args)
 
+    def test_create_port_lookups_concurrent(self):
+        events = []
+
+        def _lookup(name, result):
+            def _run(*args):
+                events.append("%s start" % name)
+                eventlet.sleep(0)
+                events.append("%s end" % name)
+                return result
+            return _run
+
+        with contextlib.nested(
+            self._stubs(),
+            mock.patch("%s._create_or_choose_lswitch" % self.d_pkg),
+            mock.patch("%s._get_security_groups_for_port" % self.d_pkg),
+        ) as (connection, choose_switch, get_groups):
+            choose_switch.side_effect = _lookup("switch", self.lswitch_uuid)
+            get_groups.side_effect = _lookup("groups", [self.profile_id])
+            port = self.driver.create_port(self.context, self.net_id,
+                                           self.port_id, security_groups=[1])
+            self.assertEqual(port["lswitch"], self.lswitch_uuid)
+            self.assertEqual(events[:2], ["switch start", "groups start"])
+            connection.lswitch_port.assert_called_with(self.lswitch_uuid)
+            connection.lswitch_port().security_profiles.assert_called_with(
+                [self.profile_id])
+
     def test_create_port_switch_not_exists(self):
         with self._stubs(has_lswitch=False,
                          net_details=dict(foo=3)) as (connection):
@@ -731,6 +759,15 @@ class TestNVPDriverCreateSecurityGroupRule(TestNVPDriver):
                 mock.call.update(),
             ], any_order=True)
 
+    def test_security_rule_create_reads_profile_uncached(self):
+        with self._stubs() as connection:
+            self.driver._get_security_group(self.context, 1, cached=True)
+            self.driver.create_security_group_rule(
+                self.context, 1,
+                {'ethertype': 'IPv4', 'direction': 'ingress'})
+            query = connection.securityprofile().query()
+            self.assertEqual(query.results.call_count, 2)
+
     def test_security_rule_create_with_ip_prefix_and_profile(self):
         with self._stubs() as connection:
             self.driver.create_security_group_rule(
@@ -824,6 +861,60 @@ class TestNVPDriverDeleteSecurityGroupRule(TestNVPDriver):
                     {'ethertype': 'IPv6', 'direction': 'egress'})
 
 
+class TestNVPDriverUpdateSecurityGroupRules(
+        TestNVPDriverDeleteSecurityGroupRule):
+    def test_update_rules_single_update(self):
+        with self._stubs(
+            rules=[{'ethertype': 'IPv4', 'direction': 'ingress'},
+                   {'ethertype': 'IPv6', 'direction': 'egress'}]
+        ) as connection:
+            connection.lswitch_port().query.return_value = \
+                self._create_lport_query(1, [self.profile_id])
+            # Two rules on the port, one more after the batch
+            self.driver.limits['max_rules_per_port'] = 3
+            self.driver.update_security_group_rules(
+                self.context, 1,
+                added=[{'ethertype': 'IPv4', 'direction': 'ingress',
+                        'protocol': 6},
+                       {'ethertype': 'IPv4', 'direction': 'ingress',
+                        'protocol': 17}],
+                removed=[{'ethertype': 'IPv4', 'direction': 'ingress'}])
+            profile = connection.securityprofile()
+            profile.port_ingress_rules.assert_called_once_with(
+                [{'ethertype': 'IPv4', 'protocol': 6},
+                 {'ethertype': 'IPv4', 'protocol': 17}])
+            self.assertFalse(profile.port_egress_rules.called)
+            self.assertEqual(profile.update.call_count, 1)
+
+    def test_update_rules_duplicate_in_batch(self):
+        with self._stubs() as connection:
+            connection.lswitch_port().query.return_value = \
+                self._create_lport_query(1, [self.profile_id])
+            rule = {'ethertype': 'IPv4', 'direction': 'ingress'}
+            with self.assertRaises(sg_ext.SecurityGroupRuleExists):
+                self.driver.update_security_group_rules(
+                    self.context, 1, added=[rule, dict(rule)])
+            self.assertFalse(connection.securityprofile().update.called)
+
+    def test_update_rules_over_port_limit(self):
+        with self._stubs() as connection:
+            connection.lswitch_port().query.return_value = \
+                self._create_lport_query(1, [self.profile_id])
+            with self.assertRaises(sg_ext.qexception.InvalidInput):
+                self.driver.update_security_group_rules(
+                    self.context, 1,
+                    added=[{'ethertype': 'IPv4', 'direction': 'ingress'},
+                           {'ethertype': 'IPv6', 'direction': 'ingress'},
+                           {'ethertype': 'IPv4', 'direction': 'egress'}])
+            self.assertFalse(connection.securityprofile().update.called)
+
+    def test_update_rules_nothing(self):
+        with self._stubs() as connection:
+            self.assertIsNone(self.driver.update_security_group_rules(
+                self.context, 1))
+            self.assertFalse(connection.securityprofile().update.called)
+
+
 class TestNVPDriverLoadConfig(TestNVPDriver):
     def test_load_config(self):
         controllers = "192.168.221.139:443:admin:admin:30:10:2:2"
@@ -871,3 +962,114 @@ class TestNVPGetConnection(TestNVPDriver):
         with self._stubs(has_conn=True) as aiclib_conn:
             self.driver.get_connection()
             self.assertFalse(aiclib_conn.called)
+
+
+class TestNVPControllerPool(TestNVPDriver):
+    def setUp(self):
+        super(TestNVPControllerPool, self).setUp()
+        for i in xrange(3):
+            self.driver.nvp_connections.append(dict(connection="conn%d" % i,
+                                                    ip_address="10.0.0.%d" % i,
+                                                    req_timeout="30",
+                                                    retries="2"))
+
+    def test_get_connection_round_robin(self):
+        conns = [self.driver.get_connection() for _ in xrange(4)]
+        self.assertEqual(conns, ["conn0", "conn1", "conn2", "conn0"])
+
+    def test_get_connection_skips_down_controllers(self):
+        self.driver._mark_down(self.driver.nvp_connections[1])
+        conns = [self.driver.get_connection() for _ in xrange(3)]
+        self.assertEqual(conns, ["conn0", "conn2", "conn0"])
+
+    def test_get_connection_all_down(self):
+        for conn in self.driver.nvp_connections:
+            self.driver._mark_down(conn)
+        self.assertEqual(self.driver.get_connection(), "conn0")
+
+    def test_read_fails_over(self):
+        def _query():
+            conn = self.driver.get_connection()
+            if conn == "conn0":
+                raise IOError("Connection refused")
+            return conn
+
+        self.assertEqual(self.driver._read(_query), "conn1")
+        self.assertTrue(self.driver.nvp_connections[0]["down_until"])
+        self.assertNotIn("down_until", self.driver.nvp_connections[1])
+
+    def test_read_gives_up_after_retries(self):
+        def _query():
+            self.driver.get_connection()
+            raise IOError("Connection refused")
+
+        with self.assertRaises(IOError):
+            self.driver._read(_query)
+        self.assertEqual(self.driver.conn_index, 0)
+
+    def test_read_does_not_retry_client_errors(self):
+        query = mock.Mock(side_effect=ValueError)
+
+        def _query():
+            self.driver.get_connection()
+            query()
+
+        with self.assertRaises(ValueError):
+            self.driver._read(_query)
+        self.assertEqual(query.call_count, 1)
+        for conn in self.driver.nvp_connections:
+            self.assertNotIn("down_until", conn)
+
+
+class TestNVPDriverLookupCache(TestNVPDriver):
+    @contextlib.contextmanager
+    def _stubs(self):
+        with contextlib.nested(
+            mock.patch("%s.get_connection" % self.d_pkg),
+        ) as (get_connection,):
+            connection = self._create_connection()
+            connection.securityprofile = self._create_security_profile()
+            get_connection.return_value = connection
+            yield connection
+
+    def test_security_group_lookups_cached(self):
+        with self._stubs() as connection:
+            self.driver.create_port(self.context, self.net_id, self.port_id,
+                                    security_groups=[1])
+            self.driver.create_port(self.context, self.net_id, self.port_id,
+                                    security_groups=[1])
+            query = connection.securityprofile().query()
+            self.assertEqual(query.results.call_count, 1)
+
+    def test_security_group_update_invalidates(self):
+        with self._stubs() as connection:
+            self.driver._get_security_group(self.context, 1, cached=True)
+            self.driver.update_security_group(self.context, 1, name="bar")
+            self.driver._get_security_group(self.context, 1, cached=True)
+            query = connection.securityprofile().query()
+            self.assertEqual(query.results.call_count, 3)
+
+    def test_cached_security_group_is_a_copy(self):
+        with self._stubs():
+            group = self.driver._get_security_group(self.context, 1,
+                                                    cached=True)
+            group['logical_port_ingress_rules'].append({'ethertype': 'IPv4'})
+            group = self.driver._get_security_group(self.context, 1,
+                                                    cached=True)
+            self.assertEqual(group['logical_port_ingress_rules'], [])
+
+    def test_lswitch_from_port_cached(self):
+        with self._stubs() as connection:
+            self.driver.update_port(self.context, self.port_id)
+            self.driver.update_port(self.context, self.port_id)
+            query = connection.lswitch_port().query()
+            self.assertEqual(query.results.call_count, 1)
+
+    def test_delete_port_invalidates(self):
+        with self._stubs() as connection:
+            self.driver.create_port(self.context, self.net_id, self.port_id)
+            self.assertEqual(self.driver.lswitch_cache.get(self.lport_uuid),
+                             self.lswitch_uuid)
+            self.driver.delete_port(self.context, self.lport_uuid)
+            self.assertIsNone(self.driver.lswitch_cache.get(self.lport_uuid))
+            self.assertFalse(connection.lswitch_port().query.called)
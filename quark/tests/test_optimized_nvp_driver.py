@@ -14,10 +14,16 @@
 #  under the License.
 
 import contextlib
+
+import aiclib
+import eventlet
 import mock
+from oslo.config import cfg
 
 import quark.db.models
 import quark.drivers.optimized_nvp_driver
+import quark.exceptions
+from quark.tests import fake_nvp
 import quark.tests.test_nvp_driver as test_nvp_driver
 
 
@@ -93,6 +99,22 @@ class TestOptimizedNVPDriverDeleteNetwork(TestOptimizedNVPDriver):
                               connection.lswitch().delete.call_count)
             self.assertEquals(switch_count, context_delete.call_count)
 
+    def test_delete_network_deletes_switches_concurrently(self):
+        in_flight = []
+        most_in_flight = []
+
+        def delete():
+            in_flight.append(None)
+            most_in_flight.append(len(in_flight))
+            eventlet.sleep(0)
+            in_flight.pop()
+
+        with self._stubs(switch_count=3) as (connection, context_delete):
+            connection.lswitch().delete.side_effect = delete
+            self.driver.delete_network(self.context, self.net_id)
+            self.assertEquals(3, connection.lswitch().delete.call_count)
+            self.assertTrue(max(most_in_flight) > 1)
+
 
 class TestOptimizedNVPDriverDeletePort(TestOptimizedNVPDriver):
     '''Need to test if ports on switch = 0 delete switch.'''
@@ -102,13 +124,15 @@ class TestOptimizedNVPDriverDeletePort(TestOptimizedNVPDriver):
             mock.patch("%s.get_connection" % self.d_pkg),
             mock.patch("%s._lport_select_by_id" % self.d_pkg),
             mock.patch("%s._lswitch_select_by_nvp_id" % self.d_pkg),
-        ) as (get_connection, select_port, select_switch):
+            mock.patch("%s._lswitch_release" % self.d_pkg),
+        ) as (get_connection, select_port, select_switch, release):
             connection = self._create_connection()
             port = self._create_lport_mock(port_count)
             switch = self._create_lswitch_mock()
             get_connection.return_value = connection
             select_port.return_value = port
             select_switch.return_value = switch
+            release.return_value = port_count == 1
             self.context.session.delete = mock.Mock(return_value=None)
             yield connection, self.context.session.delete
 
@@ -124,10 +148,36 @@ class TestOptimizedNVPDriverDeletePort(TestOptimizedNVPDriver):
         '''Ensure that the switch is deleted if empty.'''
         with self._stubs(port_count=1) as (connection, context_delete):
             self.driver.delete_port(self.context, self.port_id)
-            self.assertEquals(2, context_delete.call_count)
+            self.assertEquals(1, context_delete.call_count)
             self.assertTrue(connection.lswitch_port().delete.called)
             self.assertTrue(connection.lswitch().delete.called)
 
+    def test_delete_port_already_deleted_from_nvp(self):
+        '''A retried delete still cleans up the row and the switch.'''
+        with self._stubs(port_count=1) as (connection, context_delete):
+            connection.lswitch_port().delete.side_effect = \
+                aiclib.core.AICException(404, "lport not found")
+            connection.lswitch().delete.side_effect = \
+                aiclib.core.AICException(404, "lswitch not found")
+            self.driver.delete_port(self.context, self.port_id)
+            self.assertEquals(1, context_delete.call_count)
+            self.assertTrue(connection.lswitch().delete.called)
+
+    def test_delete_port_fails_on_nvp_error(self):
+        with self._stubs() as (connection, context_delete):
+            connection.lswitch_port().delete.side_effect = \
+                aiclib.core.AICException(409, "conflict")
+            with self.assertRaises(aiclib.core.AICException):
+                self.driver.delete_port(self.context, self.port_id)
+            self.assertFalse(context_delete.called)
+
+    def test_delete_port_row_already_deleted(self):
+        with self._stubs() as (connection, context_delete):
+            self.driver._lport_select_by_id.return_value = None
+            self.driver.delete_port(self.context, self.port_id)
+            self.assertFalse(context_delete.called)
+            self.assertFalse(connection.lswitch_port().delete.called)
+
 
 class TestOptimizedNVPDriverCreatePort(TestOptimizedNVPDriver):
     '''In no case should the optimized driver query for an lswitch.'''
@@ -139,10 +189,12 @@ class TestOptimizedNVPDriverCreatePort(TestOptimizedNVPDriver):
             mock.patch("%s._lswitch_select_first" % self.d_pkg),
             mock.patch("%s._lswitch_select_by_nvp_id" % self.d_pkg),
             mock.patch("%s._lswitch_create_optimized" % self.d_pkg),
-            mock.patch("%s._get_network_details" % self.d_pkg)
+            mock.patch("%s._get_network_details" % self.d_pkg),
+            mock.patch("%s._lswitch_claim" % self.d_pkg)
         ) as (get_connection, select_free, select_first,
-              select_by_id, create_opt, get_net_dets):
+              select_by_id, create_opt, get_net_dets, claim):
             connection = self._create_connection()
+            claim.return_value = True
             get_connection.return_value = connection
             if has_lswitch:
                 select_first.return_value = mock.Mock(nvp_id=self.lswitch_uuid)
@@ -420,8 +472,10 @@ class TestQueryMethods(TestOptimizedNVPDriver):
 
     def test_lswitch_select_first(self):
         with self._stubs() as query_return:
-            self.driver._lswitch_select_first(self.context, 1)
+            switch = self.driver._lswitch_select_first(self.context, 1)
             self.assertTrue(query_return.filter.called)
+            self.assertEqual(switch,
+                             query_return.filter.return_value.first())
 
     def test_lswitch_select_free(self):
         with self._stubs() as query_return:
@@ -442,3 +496,190 @@ class TestQueryMethods(TestOptimizedNVPDriver):
         with self._stubs() as query_return:
             self.driver._query_security_group(self.context, 1)
             self.assertTrue(query_return.filter.called)
+
+
+class TestLswitchPortCounts(TestOptimizedNVPDriver):
+    def setUp(self):
+        super(TestLswitchPortCounts, self).setUp()
+        # Talk to the real session, the base class stubs out add
+        del self.context.session.add
+        self.session = self.context.session
+        self.switch = self.driver._lswitch_create_optimized(
+            self.context, "net", self.lswitch_uuid, self.net_id)
+        self.session.flush()
+
+    def _port_count(self):
+        self.session.expire_all()
+        switch = self.driver._lswitch_select_by_nvp_id(self.context,
+                                                       self.lswitch_uuid)
+        return switch and switch.port_count
+
+    def test_claim(self):
+        self.assertTrue(self.driver._lswitch_claim(self.context,
+                                                   self.switch.id))
+        self.assertEqual(self._port_count(), 1)
+
+    def test_claim_full_switch_fails(self):
+        for _ in xrange(2):
+            self.assertTrue(self.driver._lswitch_claim(
+                self.context, self.switch.id, limit=2))
+        self.assertFalse(self.driver._lswitch_claim(
+            self.context, self.switch.id, limit=2))
+        self.assertEqual(self._port_count(), 2)
+
+    def test_select_open_claims(self):
+        self.driver.limits['max_ports_per_switch'] = 1
+        nvp_id = self.driver._lswitch_select_open(self.context,
+                                                  network_id=self.net_id)
+        self.assertEqual(nvp_id, self.lswitch_uuid)
+        self.assertIsNone(self.driver._lswitch_select_open(
+            self.context, network_id=self.net_id))
+        self.assertEqual(self._port_count(), 1)
+
+    def test_release(self):
+        self.driver._lswitch_claim(self.context, self.switch.id)
+        self.driver._lswitch_claim(self.context, self.switch.id)
+        self.assertFalse(self.driver._lswitch_release(self.context,
+                                                      self.switch.id))
+        self.assertEqual(self._port_count(), 1)
+
+    def test_release_last_port_removes_switch(self):
+        self.driver._lswitch_claim(self.context, self.switch.id)
+        self.assertTrue(self.driver._lswitch_release(self.context,
+                                                     self.switch.id))
+        self.assertIsNone(self._port_count())
+
+    def test_reconcile_port_counts(self):
+        for _ in xrange(3):
+            self.driver._lswitch_claim(self.context, self.switch.id)
+        self.session.add(quark.drivers.optimized_nvp_driver.LSwitchPort(
+            port_id=self.port_id, switch_id=self.switch.id))
+        self.session.flush()
+        self.assertEqual(self.driver.reconcile_port_counts(self.context), 1)
+        self.assertEqual(self._port_count(), 1)
+        self.assertEqual(self.driver.reconcile_port_counts(self.context), 0)
+
+    def _add_network(self):
+        self.session.add(quark.db.models.Network(id=self.net_id,
+                                                 tenant_id="tid",
+                                                 name="net"))
+        self.session.flush()
+
+    def test_select_free_prefers_fullest_switch(self):
+        self.driver.limits['max_ports_per_switch'] = 2
+        spare = self.driver._lswitch_create_optimized(
+            self.context, "net", "spare", self.net_id)
+        self.driver._lswitch_claim(self.context, self.switch.id)
+        self.session.flush()
+        switch = self.driver._lswitch_select_free(self.context, self.net_id)
+        self.assertEqual(switch.nvp_id, self.lswitch_uuid)
+        self.assertNotEqual(spare.nvp_id, self.lswitch_uuid)
+
+    def test_provision_spare_lswitches(self):
+        controller = fake_nvp.FakeController()
+        controller.install(self.driver)
+        self.driver.limits['max_ports_per_switch'] = 2
+        cfg.CONF.set_override('spare_lswitches', 1, 'NVP')
+        self._add_network()
+        self.driver._lswitch_claim(self.context, self.switch.id)
+        try:
+            self.assertEqual(
+                self.driver.provision_spare_lswitches(self.context), 1)
+            self.session.flush()
+            self.assertEqual(
+                self.driver.provision_spare_lswitches(self.context), 0)
+            switches = self.driver._lswitches_for_network(self.context,
+                                                          self.net_id)
+            self.assertEqual(sorted(s.port_count for s in switches), [0, 1])
+            self.assertEqual(len(controller.lswitches), 1)
+            tags = controller.lswitches.values()[0]["tags"]
+            self.assertIn({"tag": "tid", "scope": "os_tid"}, tags)
+        finally:
+            cfg.CONF.clear_override('spare_lswitches', 'NVP')
+
+    def test_provision_spare_lswitches_not_busy(self):
+        cfg.CONF.set_override('spare_lswitches', 1, 'NVP')
+        self.driver.limits['max_ports_per_switch'] = 4
+        self._add_network()
+        self.driver._lswitch_claim(self.context, self.switch.id)
+        try:
+            self.assertEqual(
+                self.driver.provision_spare_lswitches(self.context), 0)
+        finally:
+            cfg.CONF.clear_override('spare_lswitches', 'NVP')
+
+    def test_provisioner_runs_where_enabled(self):
+        cfg.CONF.set_override('spare_lswitches', 1, 'NVP')
+        try:
+            for enabled in (False, True):
+                cfg.CONF.set_override('spare_lswitch_provisioner', enabled,
+                                      'NVP')
+                with contextlib.nested(
+                    mock.patch("quark.drivers.nvp_driver.NVPDriver."
+                               "load_config"),
+                    mock.patch("quark.drivers.optimized_nvp_driver.eventlet")
+                ) as (load_config, eventlet):
+                    self.driver.load_config()
+                    self.assertEqual(eventlet.spawn.called, enabled)
+        finally:
+            cfg.CONF.clear_override('spare_lswitches', 'NVP')
+            cfg.CONF.clear_override('spare_lswitch_provisioner', 'NVP')
+
+
+class TestSecurityRuleCounts(TestOptimizedNVPDriver):
+    def setUp(self):
+        super(TestSecurityRuleCounts, self).setUp()
+        del self.context.session.add
+        self.session = self.context.session
+        SecurityProfile = quark.drivers.optimized_nvp_driver.SecurityProfile
+        self.session.add(SecurityProfile(id="g1", nvp_id="nvp1",
+                                         rule_count=2))
+        self.session.add(SecurityProfile(id="g2", nvp_id="nvp2",
+                                         rule_count=3))
+        self.switch = self.driver._lswitch_create_optimized(
+            self.context, "net", self.lswitch_uuid, self.net_id)
+        self.session.flush()
+
+    def _add_port(self, port_id, groups):
+        lport = quark.drivers.optimized_nvp_driver.LSwitchPort(
+            port_id=port_id, switch_id=self.switch.id)
+        self.driver._lport_set_profiles(self.context, lport, groups)
+        self.session.add(lport)
+        self.session.flush()
+        return lport
+
+    def test_port_rule_totals(self):
+        self.assertEqual(self._add_port("p1", ["g1", "g2"]).rule_count, 5)
+        self.assertEqual(self._add_port("p2", ["g1"]).rule_count, 2)
+        self.assertEqual(
+            self.driver._check_rule_count_per_port(self.context, "g1"), 5)
+        self.assertEqual(
+            self.driver._check_rule_count_per_port(self.context, "g2"), 5)
+
+    def test_rule_count_unused_group(self):
+        self._add_port("p1", ["g1"])
+        self.assertEqual(
+            self.driver._check_rule_count_per_port(self.context, "g2"), 0)
+
+    def test_rules_changed_updates_ports(self):
+        self._add_port("p1", ["g1", "g2"])
+        self._add_port("p2", ["g1"])
+        self._add_port("p3", ["g2"])
+        self.driver._security_group_rules_changed(self.context, "g1", 4)
+        self.session.expire_all()
+        totals = dict(
+            (port.port_id, port.rule_count) for port in
+            self.session.query(quark.drivers.optimized_nvp_driver.
+                               LSwitchPort))
+        self.assertEqual(totals, {"p1": 7, "p2": 4, "p3": 3})
+        self.assertEqual(
+            self.driver._check_rule_count_per_port(self.context, "g2"), 7)
+
+    def test_get_security_groups_for_port(self):
+        self.driver.limits['max_rules_per_port'] = 5
+        self.assertEqual(self.driver._get_security_groups_for_port(
+            self.context, ["g2", "g1"]), ["nvp2", "nvp1"])
+        self.driver.limits['max_rules_per_port'] = 4
+        with self.assertRaises(quark.exceptions.DriverLimitReached):
+            self.driver._get_security_groups_for_port(self.context,
+                                                      ["g1", "g2"])
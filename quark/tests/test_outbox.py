@@ -0,0 +1,157 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+#  under the License.
+
+import contextlib
+import json
+
+import mock
+from neutron.common import exceptions
+from oslo.config import cfg
+
+from quark.db import models
+from quark import outbox
+from quark.tests import test_base
+
+
+class TestOutboxCall(test_base.TestBase):
+    def setUp(self):
+        super(TestOutboxCall, self).setUp()
+        self.driver = mock.Mock()
+
+    def tearDown(self):
+        cfg.CONF.clear_override("backend_outbox", "QUARK")
+
+    @contextlib.contextmanager
+    def _stubs(self, enabled):
+        cfg.CONF.set_override("backend_outbox", enabled, "QUARK")
+        with mock.patch("quark.db.api.backend_operation_record") as \
+                op_record:
+            yield op_record
+
+    def test_call_disabled_calls_driver(self):
+        with self._stubs(enabled=False) as op_record:
+            outbox.call(self.context, self.driver, "delete_port", "foo",
+                        "foo")
+            self.driver.delete_port.assert_called_once_with(self.context,
+                                                            "foo")
+            self.assertFalse(op_record.called)
+
+    def test_call_enabled_records_operation(self):
+        with self._stubs(enabled=True) as op_record:
+            outbox.call(self.context, self.driver, "delete_port", "foo",
+                        "foo")
+            self.assertFalse(self.driver.delete_port.called)
+            op_record.assert_called_once_with(
+                self.context, idempotency_key="delete_port:foo",
+                resource_id="foo", operation="delete_port",
+                arguments=json.dumps(dict(args=("foo",), kwargs={})))
+
+    def test_call_each_disabled_calls_driver(self):
+        with self._stubs(enabled=False):
+            outbox.call_each(self.context, self.driver, "delete_port",
+                             ["foo", "bar"])
+            self.driver.delete_port.assert_any_call(self.context, "foo")
+            self.driver.delete_port.assert_any_call(self.context, "bar")
+
+
+class TestOutboxDispatcher(test_base.TestBase):
+    def setUp(self):
+        super(TestOutboxDispatcher, self).setUp()
+        self.driver = mock.Mock()
+        self.dispatcher = outbox.Dispatcher(self.driver)
+
+    @contextlib.contextmanager
+    def _stubs(self, ops, claimed=True):
+        op_models = []
+        for i, op in enumerate(ops):
+            op_model = models.BackendOperation()
+            op_model.update(dict(id=i + 1, tenant_id="tid", attempts=0,
+                                 operation="delete_port",
+                                 arguments=json.dumps(dict(
+                                     args=[op["resource_id"]], kwargs={}))))
+            op_model.update(op)
+            op_models.append(op_model)
+
+        def _find(context, limit=None, **filters):
+            return [o for o in op_models if o["id"] == filters["id"]]
+
+        def _find_due(context, limit=None):
+            heads = {}
+            for o in reversed(op_models):
+                heads[o["resource_id"]] = o
+            return sorted(heads.values(), key=lambda o: o["id"])
+
+        db_mod = "quark.db.api"
+        with contextlib.nested(
+            mock.patch("quark.outbox.transaction"),
+            mock.patch("%s.backend_operation_find" % db_mod),
+            mock.patch("%s.backend_operation_find_due" % db_mod),
+            mock.patch("%s.backend_operation_claim" % db_mod),
+            mock.patch("%s.backend_operation_delete" % db_mod),
+            mock.patch("%s.backend_operation_retry_later" % db_mod),
+            mock.patch("%s.backend_operation_park" % db_mod),
+        ) as (txn, op_find, op_find_due, op_claim, op_delete, op_retry,
+              op_park):
+            op_find.side_effect = _find
+            op_find_due.side_effect = _find_due
+            op_claim.return_value = claimed
+            self.op_park = op_park
+            yield op_delete, op_retry
+
+    def test_dispatch(self):
+        with self._stubs([dict(resource_id="foo"),
+                          dict(resource_id="bar")]) as (op_delete, op_retry):
+            self.assertEqual(self.dispatcher.dispatch(), 2)
+            self.assertEqual(op_delete.call_count, 2)
+            self.assertFalse(op_retry.called)
+            self.assertEqual(self.driver.delete_port.call_count, 2)
+            context, key = self.driver.delete_port.call_args[0]
+            self.assertEqual(context.tenant_id, "tid")
+
+    def test_dispatch_failure_blocks_resource(self):
+        self.driver.delete_port.side_effect = [Exception("down"), None]
+        with self._stubs([dict(resource_id="foo"),
+                          dict(resource_id="foo")]) as (op_delete, op_retry):
+            self.assertEqual(self.dispatcher.dispatch(), 0)
+            self.assertEqual(self.driver.delete_port.call_count, 1)
+            self.assertFalse(op_delete.called)
+            self.assertEqual(op_retry.call_count, 1)
+            args = op_retry.call_args[0]
+            self.assertEqual(args[2:], (1, "down"))
+
+    def test_dispatch_not_claimed(self):
+        with self._stubs([dict(resource_id="foo")],
+                         claimed=False) as (op_delete, op_retry):
+            self.assertEqual(self.dispatcher.dispatch(), 0)
+            self.assertFalse(self.driver.delete_port.called)
+
+    def test_dispatch_parks_after_max_attempts(self):
+        self.driver.delete_port.side_effect = Exception("down")
+        max_attempts = cfg.CONF.QUARK.outbox_max_attempts
+        with self._stubs([dict(resource_id="foo",
+                               attempts=max_attempts - 1)]) as (op_delete,
+                                                                op_retry):
+            self.assertEqual(self.dispatcher.dispatch(), 0)
+            self.assertFalse(op_retry.called)
+            self.assertEqual(self.op_park.call_count, 1)
+            self.assertEqual(self.op_park.call_args[0][2], "down")
+
+    def test_dispatch_delete_not_found_is_done(self):
+        self.driver.delete_port.side_effect = exceptions.NotFound()
+        with self._stubs([dict(resource_id="foo")]) as (op_delete,
+                                                        op_retry):
+            self.assertEqual(self.dispatcher.dispatch(), 1)
+            self.assertEqual(op_delete.call_count, 1)
+            self.assertFalse(op_retry.called)
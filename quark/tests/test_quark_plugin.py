@@ -13,12 +13,16 @@
 # License for the specific language governing permissions and limitations
 #  under the License.
 
+import contextlib
 
 import mock
+from neutron.common import exceptions
 from neutron.db import api as db_api
 from oslo.config import cfg
 
 import quark.plugin
+from quark.plugin_modules import networks
+from quark.plugin_modules import security_groups
 
 from quark.tests import test_base
 
@@ -31,6 +35,8 @@ class TestQuarkPlugin(test_base.TestBase):
         cfg.CONF.set_override('connection', 'sqlite://', 'database')
         db_api.configure_db()
         self.plugin = quark.plugin.Plugin()
+        security_groups._default_groups.clear()
+        networks._shared_networks.clear()
 
     def tearDown(self):
         db_api.clear_db()
@@ -54,3 +60,35 @@ class TestQuarkAPIExtensions(TestQuarkPlugin):
             conf.set_override.assert_called_once_with(
                 "api_extensions_path",
                 "apple:banana:carrot")
+
+
+class TestQuarkBulkCreate(TestQuarkPlugin):
+    def test_native_bulk_support(self):
+        self.assertTrue(getattr(self.plugin, "_Plugin__native_bulk_support",
+                                False))
+
+    def test_create_network_bulk(self):
+        with mock.patch("quark.plugin_modules.networks.create_network") as \
+                create_network:
+            create_network.side_effect = lambda context, net: net["network"]
+            res = self.plugin.create_network_bulk(
+                self.context, {"networks": [{"network": {"name": "a"}},
+                                            {"network": {"name": "b"}}]})
+            self.assertEqual([net["name"] for net in res], ["a", "b"])
+            self.assertEqual(create_network.call_count, 2)
+
+    def test_create_port_bulk_failure_deletes_created(self):
+        with contextlib.nested(
+            mock.patch("quark.plugin_modules.ports.create_port"),
+            mock.patch("quark.plugin_modules.ports.delete_port")
+        ) as (create_port, delete_port):
+            create_port.side_effect = [{"id": 1}, {"id": 2},
+                                       exceptions.NetworkNotFound(net_id=3)]
+            delete_port.side_effect = [None, Exception("boom")]
+            with self.assertRaises(exceptions.NetworkNotFound):
+                self.plugin.create_port_bulk(
+                    self.context, {"ports": [{"port": {}}, {"port": {}},
+                                             {"port": {}}]})
+            self.assertEqual(delete_port.call_args_list,
+                             [mock.call(self.context, 1),
+                              mock.call(self.context, 2)])
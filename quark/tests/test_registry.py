@@ -0,0 +1,48 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+#  under the License.
+
+import mock
+
+from quark.drivers import base
+from quark.drivers import registry
+from quark.plugin_modules import networks
+from quark.plugin_modules import ports
+from quark.plugin_modules import security_groups
+from quark.tests import test_base
+
+
+class TestLazyDriver(test_base.TestBase):
+    def test_built_on_first_use(self):
+        factory = mock.Mock()
+        driver = registry.LazyDriver(factory)
+        self.assertFalse(factory.called)
+        driver.create_port("context")
+        driver.delete_port("context")
+        self.assertEqual(factory.call_count, 1)
+        factory.return_value.create_port.assert_called_once_with("context")
+
+    def test_reset(self):
+        factory = mock.Mock()
+        driver = registry.LazyDriver(factory)
+        driver.get()
+        driver.reset()
+        driver.get()
+        self.assertEqual(factory.call_count, 2)
+
+    def test_net_driver_shared_by_plugin_modules(self):
+        self.assertIs(ports.net_driver, registry.net_driver)
+        self.assertIs(networks.net_driver, registry.net_driver)
+        self.assertIs(security_groups.net_driver, registry.net_driver)
+        self.assertIsInstance(registry.net_driver.get(), base.BaseDriver)
@@ -0,0 +1,63 @@
+# Copyright 2013 Openstack Foundation
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+#  under the License.
+
+import mock
+
+from quark.tests import test_base
+from quark import utils
+
+
+class TestTTLCache(test_base.TestBase):
+    def test_get_set(self):
+        cache = utils.TTLCache(30, 10)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+
+    def test_expired(self):
+        cache = utils.TTLCache(30, 10)
+        with mock.patch("time.time") as now:
+            now.return_value = 100
+            cache.set("a", 1)
+            now.return_value = 131
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(len(cache), 0)
+
+    def test_bounded(self):
+        cache = utils.TTLCache(30, 2)
+        with mock.patch("time.time") as now:
+            for i, key in enumerate("abc"):
+                now.return_value = 100 + i
+                cache.set(key, i)
+            self.assertEqual(len(cache), 2)
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.get("c"), 2)
+
+    def test_disabled(self):
+        cache = utils.TTLCache(0, 10)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+
+class TestElevated(test_base.TestBase):
+    def test_elevated_once(self):
+        admin_context = utils.elevated(self.context)
+        self.assertTrue(admin_context.is_admin)
+        self.assertFalse(self.context.is_admin)
+        self.assertIs(utils.elevated(self.context), admin_context)
+
+    def test_admin_context(self):
+        admin_context = utils.elevated(self.context)
+        self.assertIs(utils.elevated(admin_context), admin_context)
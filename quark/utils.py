@@ -13,7 +13,15 @@
 # License for the specific language governing permissions and limitations
 #  under the License.
 
+import time
+
+import eventlet
 from neutron.api.v2 import attributes
+from oslo.config import cfg
+
+from quark.drivers import instrumentation
+
+CONF = cfg.CONF
 
 
 def attr_specified(param):
@@ -25,3 +33,76 @@ def pop_param(attrs, param, default=None):
     if attr_specified(val):
         return val
     return default
+
+
+def elevated(context):
+    """Returns an admin version of context, made once per context."""
+    if context.is_admin:
+        return context
+    admin_context = getattr(context, "_quark_elevated", None)
+    if admin_context is None:
+        admin_context = context.elevated()
+        context._quark_elevated = admin_context
+    return admin_context
+
+
+def pool_map(func, *iterables):
+    """Calls func over iterables on a bounded pool of green threads.
+
+    Results come back in order. If any call raises, the first exception
+    reached is re-raised once the remaining calls have finished.
+    """
+    pool = eventlet.GreenPool(CONF.QUARK.backend_pool_size)
+    results = pool.imap(instrumentation.carry_operation(func), *iterables)
+    try:
+        return list(results)
+    finally:
+        pool.waitall()
+
+
+class TTLCache(object):
+    """A bounded mapping whose entries expire ttl seconds after being set.
+
+    A ttl or max_size of 0 disables caching. When full, expired entries
+    are dropped first and then the entry closest to expiring.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires <= time.time():
+            self._data.pop(key, None)
+            return default
+        return value
+
+    def set(self, key, value):
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        if key not in self._data and len(self._data) >= self.max_size:
+            self._evict()
+        self._data[key] = (time.time() + self.ttl, value)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def _evict(self):
+        now = time.time()
+        for key, (expires, _) in self._data.items():
+            if expires <= now:
+                del self._data[key]
+        if len(self._data) >= self.max_size:
+            oldest = min(self._data, key=lambda k: self._data[k][0])
+            del self._data[oldest]